@@ -0,0 +1,101 @@
+"""昵称黑名单匹配基准：旧的逐关键词 casefold + re.search vs. NicknameBlacklist。
+
+用法（在插件目录下）：python benchmarks/bench_blacklist.py [--names N] [--keywords 3,100,1000,5000]
+
+对每个关键词规模：
+- 先随机校验 AhoCorasick 与朴素子串匹配结果一致，NicknameBlacklist 与旧实现结果一致；
+- 再分别计时：旧实现、预编译（不带缓存）、预编译 + LRU 缓存命中，以及构建耗时。
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import random
+import re
+import string
+import time
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load(name: str):
+    spec = importlib.util.spec_from_file_location(name, _ROOT / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+wxhttp_blacklist = _load("wxhttp_blacklist")
+AhoCorasick = wxhttp_blacklist.AhoCorasick
+NicknameBlacklist = wxhttp_blacklist.NicknameBlacklist
+
+_ALPHABET = string.ascii_lowercase + "微信客服官方号"
+REGEX = "^官方.*"
+
+
+def old_match(nickname_or_id: str, keywords: list, regex: str) -> bool:
+    """原 WxHttpPlatformAdapter._match_nickname_blacklist（每次调用都重新 casefold 与编译正则）。"""
+    if not nickname_or_id:
+        return False
+    haystack = nickname_or_id.casefold()
+    for kw in keywords:
+        if kw and kw.casefold() in haystack:
+            return True
+    if regex:
+        return re.search(regex, nickname_or_id, flags=re.IGNORECASE) is not None
+    return False
+
+
+def _rand(rng: random.Random, lo: int, hi: int) -> str:
+    return "".join(rng.choices(_ALPHABET, k=rng.randint(lo, hi)))
+
+
+def check(rng: random.Random) -> None:
+    for _ in range(300):
+        kws = [_rand(rng, 1, 4) for _ in range(rng.randint(1, 60))]
+        ac = AhoCorasick(kws)
+        for _ in range(30):
+            text = _rand(rng, 0, 15)
+            assert ac.search(text) == any(k in text for k in kws), (kws, text)
+
+
+def _per_call_us(fn, items) -> float:
+    t0 = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - t0) / len(items) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=2000)
+    parser.add_argument("--keywords", default="3,100,1000,5000")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    check(rng)
+    names = [_rand(rng, 3, 12) for _ in range(args.names)]
+
+    print(f"{'keywords':>9}{'old us':>10}{'compiled':>10}{'cached':>10}{'build ms':>10}")
+    for count in (int(x) for x in args.keywords.split(",") if x.strip()):
+        kws = sorted({_rand(rng, 3, 6) for _ in range(count)})
+        uncached = NicknameBlacklist(kws, REGEX, cache_size=0)
+        cached = NicknameBlacklist(kws, REGEX)
+        assert all(uncached.matches(n) == old_match(n, kws, REGEX) for n in names)
+
+        t_old = _per_call_us(lambda n: old_match(n, kws, REGEX), names)
+        t_compiled = _per_call_us(uncached.matches, names)
+        for n in names:
+            cached.matches(n)
+        t_cached = _per_call_us(cached.matches, names)
+        t0 = time.perf_counter()
+        NicknameBlacklist(kws, REGEX)
+        build_ms = (time.perf_counter() - t0) * 1e3
+        print(f"{len(kws):>9}{t_old:>10.2f}{t_compiled:>10.2f}{t_cached:>10.2f}{build_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
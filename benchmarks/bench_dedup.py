@@ -0,0 +1,93 @@
+"""去重窗口的内存占用基准：每个 id 的字节数（默认 100 万个 id）。
+
+用法（在插件目录下）：python benchmarks/bench_dedup.py [--ids N] [--fp-rate P]
+
+对比三种实现：
+- 旧实现 set + deque(maxlen=N)：tracemalloc 统计容器本身，另加每个 int 对象的大小；
+- DedupRing：uint64 环形数组 + 开放寻址索引（nbytes 为实际分配的字节数）；
+- RotatingBloom：两代轮换的 Bloom 过滤器，同时抽样估计假阳性。
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load(name: str):
+    spec = importlib.util.spec_from_file_location(name, _ROOT / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+wxhttp_dedup = _load("wxhttp_dedup")
+
+
+def bench_set_deque(ids):
+    tracemalloc.start()
+    seen = set()
+    window = deque(maxlen=len(ids))
+    for msg_id in ids:
+        seen.add(msg_id)
+        window.append(msg_id)
+    containers = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # id 列表预先生成，int 对象不计入上面的统计；旧实现里每个 id 都要持有一个 int
+    per_int = sys.getsizeof(ids[0])
+    return containers / len(ids), per_int
+
+
+def bench_ring(ids):
+    ring = wxhttp_dedup.DedupRing(len(ids))
+    t0 = time.perf_counter()
+    for msg_id in ids:
+        ring.add(msg_id)
+    elapsed = time.perf_counter() - t0
+    nbytes = ring.nbytes
+    ring.close()
+    return nbytes / len(ids), elapsed / len(ids) * 1e6
+
+
+def bench_bloom(ids, fp_rate, rng):
+    bloom = wxhttp_dedup.RotatingBloom(len(ids), fp_rate)
+    sample = ids[: min(len(ids), 200000)]
+    t0 = time.perf_counter()
+    for msg_id in sample:
+        bloom.add(msg_id)
+    elapsed = time.perf_counter() - t0
+    probes = 200000
+    false_hits = sum(1 for _ in range(probes) if rng.getrandbits(63) in bloom)
+    return bloom.nbytes / len(ids), elapsed / len(sample) * 1e6, false_hits / probes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ids", type=int, default=1_000_000)
+    parser.add_argument("--fp-rate", type=float, default=1e-6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ids = [rng.getrandbits(63) | 1 for _ in range(args.ids)]
+
+    containers, per_int = bench_set_deque(ids)
+    ring_bytes, ring_us = bench_ring(ids)
+    bloom_bytes, bloom_us, fp = bench_bloom(ids, args.fp_rate, rng)
+
+    print(f"ids={args.ids}")
+    print(f"set+deque : {containers:6.1f} B/id containers + {per_int} B/id int objects")
+    print(f"DedupRing : {ring_bytes:6.1f} B/id, add {ring_us:.2f} us")
+    print(f"Bloom     : {bloom_bytes:6.1f} B/id, add {bloom_us:.2f} us, fp={fp:.2e} (target {args.fp_rate:g})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""MessageMeta 单次解码 vs. 旧的逐字段解析器的微基准。
+
+用法（在插件目录下）：python benchmarks/bench_msg_meta.py [--number N]
+
+旧实现每个字段各自 eT.fromstring 一次：图片消息在缓存键（md5 + CDN 参数）和下载
+（CDN 参数 + 总长度）阶段共解析 4 次，视频 2 次；decode_message_meta 每条消息只解析一次。
+文本消息只有群聊才解析 MsgSource 的 atuserlist（旧实现为 re.search + re.split），
+私聊文本旧实现不做任何解析，新实现直接返回共享的空结果。
+脚本先校验两者结果一致，再分别计时。
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import re
+import timeit
+from pathlib import Path
+
+from defusedxml import ElementTree as eT
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load(name: str):
+    spec = importlib.util.spec_from_file_location(name, _ROOT / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+decode_message_meta = _load("wxhttp_msg_meta").decode_message_meta
+
+
+# ---- 旧实现（原 WxHttpPlatformAdapter 上的静态解析方法，原样保留作对照）----
+
+
+def _parse_int(s):
+    if not s:
+        return None
+    try:
+        return int(s)
+    except Exception:
+        return None
+
+
+def old_image_total_len(xml_text):
+    try:
+        root = eT.fromstring(xml_text)
+    except Exception:
+        return None
+    img = root.find(".//img")
+    if img is None:
+        return None
+    for attr in ("hdlength", "totalLen", "length", "len"):
+        v = _parse_int(img.get(attr))
+        if v and v > 0:
+            return v
+    return None
+
+
+def old_video_meta(xml_text):
+    try:
+        root = eT.fromstring(xml_text)
+    except Exception:
+        return None, None, None, None, None
+    videomsg = root.find(".//videomsg")
+    if videomsg is None:
+        return None, None, None, None, None
+    total_len = _parse_int(videomsg.get("length"))
+    cdn_url = videomsg.get("cdnvideourl")
+    play_len = _parse_int(videomsg.get("playlength"))
+    raw_len = _parse_int(videomsg.get("rawlength"))
+    cdn_raw_url = videomsg.get("cdnrawvideourl")
+    return (
+        total_len if (total_len and total_len > 0) else None,
+        (cdn_url.strip() if isinstance(cdn_url, str) and cdn_url.strip() else None),
+        play_len if (play_len and play_len > 0) else None,
+        raw_len if (raw_len and raw_len > 0) else None,
+        (cdn_raw_url.strip() if isinstance(cdn_raw_url, str) and cdn_raw_url.strip() else None),
+    )
+
+
+def old_media_md5(xml_text, tag):
+    try:
+        root = eT.fromstring(xml_text)
+    except Exception:
+        return None
+    node = root.find(f".//{tag}")
+    if node is None:
+        return None
+    md5 = node.get("md5")
+    if isinstance(md5, str) and md5.strip():
+        return md5.strip().lower()
+    return None
+
+
+def old_cdn_image_params(xml_text):
+    try:
+        root = eT.fromstring(xml_text)
+    except Exception:
+        return None, None
+    img = root.find(".//img")
+    if img is None:
+        return None, None
+    aes_key = img.get("aeskey") or img.get("cdnthumbaeskey")
+    aes_key = aes_key.strip() if isinstance(aes_key, str) and aes_key.strip() else None
+    raw = img.get("cdnbigimgurl") or img.get("cdnmidimgurl") or img.get("cdnthumburl")
+    if not isinstance(raw, str) or not raw.strip():
+        return None, aes_key
+    raw = raw.strip()
+    if raw.startswith("http://") or raw.startswith("https://"):
+        parts = [p for p in raw.split("/") if p]
+        file_no = parts[-2] if len(parts) >= 2 else None
+    else:
+        file_no = raw
+    return file_no, aes_key
+
+
+# ---- 样本 ----
+
+_CDN_ID = (
+    "3057020100044b30490201000204a1b2c3d402032f5b130204b4ee5e7502046512a1b604243738623933633"
+    "4362d373339662d343730382d613530342d3130393236376164356634310204011418020201000405004c4f2100"
+)
+IMAGE_XML = (
+    '<?xml version="1.0"?>\n<msg><img aeskey="0123456789abcdef0123456789abcdef" encryver="1" '
+    'cdnthumbaeskey="0123456789abcdef0123456789abcdef" '
+    f'cdnthumburl="{_CDN_ID}" cdnthumblength="4567" cdnthumbheight="120" cdnthumbwidth="90" '
+    'cdnmidheight="0" cdnmidwidth="0" cdnhdheight="0" cdnhdwidth="0" '
+    f'cdnmidimgurl="{_CDN_ID}" length="123456" md5="0A1B2C3D4E5F60718293A4B5C6D7E8F9" '
+    'hevc_mid_size="45678" originsourcemd5="0a1b2c3d4e5f60718293a4b5c6d7e8f9" />'
+    "<platform_signature></platform_signature><imgdatahash></imgdatahash></msg>"
+)
+VIDEO_XML = (
+    '<?xml version="1.0"?>\n<msg><videomsg aeskey="abc" cdnvideourl="3057020100" cdnthumbaeskey="abc" '
+    'cdnthumburl="3057" length="2345678" playlength="12" cdnthumblength="4000" cdnthumbwidth="224" '
+    'cdnthumbheight="398" fromusername="wxid_x" md5="aabbccdd" newmd5="eeff" isplaceholder="0" '
+    'rawmd5="" rawlength="0" cdnrawvideourl="" cdnrawvideoaeskey="" overwritenewmsgid="0" '
+    'originsourcemd5="" isad="0" /></msg>'
+)
+MSG_SOURCE = (
+    "<msgsource><atuserlist><![CDATA[wxid_bot]]></atuserlist><silence>0</silence>"
+    "<membercount>312</membercount><signature>V1_abc</signature></msgsource>"
+)
+MSG_SOURCE_NO_AT = "<msgsource><silence>0</silence><membercount>312</membercount><signature>V1_abc</signature></msgsource>"
+
+
+def old_image():
+    # 缓存键阶段 + 下载阶段
+    old_media_md5(IMAGE_XML, "img")
+    old_cdn_image_params(IMAGE_XML)
+    old_cdn_image_params(IMAGE_XML)
+    old_image_total_len(IMAGE_XML)
+
+
+def new_image():
+    decode_message_meta(3, IMAGE_XML, MSG_SOURCE)
+
+
+def old_video():
+    old_video_meta(VIDEO_XML)
+    old_media_md5(VIDEO_XML, "videomsg")
+
+
+def new_video():
+    decode_message_meta(43, VIDEO_XML, MSG_SOURCE)
+
+
+def old_parse_atuserlist(msg_source):
+    # 原 WxHttpPlatformAdapter._parse_atuserlist_by_msgsource，群文本每条都会调用
+    m = re.search(r"<atuserlist>(.*?)</atuserlist>", msg_source, flags=re.S)
+    if not m:
+        return []
+    inner = (m.group(1) or "").strip()
+    if not inner:
+        return []
+    return [p.strip() for p in re.split(r"[\s,]+", inner) if p.strip()]
+
+
+def old_text():
+    old_parse_atuserlist(MSG_SOURCE)
+
+
+def new_text():
+    decode_message_meta(1, "hi", MSG_SOURCE)
+
+
+def old_text_no_at():
+    old_parse_atuserlist(MSG_SOURCE_NO_AT)
+
+
+def new_text_no_at():
+    decode_message_meta(1, "hi", MSG_SOURCE_NO_AT)
+
+
+def check() -> None:
+    img = decode_message_meta(3, IMAGE_XML)
+    assert (img.cdn_file_no, img.cdn_aes_key) == old_cdn_image_params(IMAGE_XML)
+    assert img.img_len == old_image_total_len(IMAGE_XML)
+    assert img.md5 == old_media_md5(IMAGE_XML, "img")
+    vid = decode_message_meta(43, VIDEO_XML)
+    assert (
+        vid.video_len,
+        vid.cdn_video_url,
+        vid.play_len,
+        vid.video_raw_len,
+        vid.cdn_raw_video_url,
+    ) == old_video_meta(VIDEO_XML)
+    assert vid.md5 == old_media_md5(VIDEO_XML, "videomsg")
+    for source in (MSG_SOURCE, MSG_SOURCE_NO_AT, "<atuserlist> wxid_a,wxid_b\n wxid_c </atuserlist>"):
+        assert decode_message_meta(1, "hi", source).at_list == old_parse_atuserlist(source)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    check()
+    n = args.number
+    print(f"{'case':<8}{'old us':>10}{'new us':>10}{'speedup':>10}")
+    for name, old, new in (
+        ("image", old_image, new_image),
+        ("video", old_video, new_video),
+        ("text", old_text, new_text),
+        ("text-0@", old_text_no_at, new_text_no_at),
+    ):
+        t_old = timeit.timeit(old, number=n) / n * 1e6
+        t_new = timeit.timeit(new, number=n) / n * 1e6
+        print(f"{name:<8}{t_old:>10.1f}{t_new:>10.1f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
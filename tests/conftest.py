@@ -0,0 +1,68 @@
+"""未安装 AstrBot 时，用最小的 sys.modules 替身让纯逻辑模块可以导入测试。
+
+只替换被测模块用到的部分（logger、媒体消息组件）；装了真正的 AstrBot 时不做任何事。
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+import sys
+import types
+from typing import Optional
+
+from pydantic.v1 import BaseModel
+
+if importlib.util.find_spec("astrbot") is None:
+    _logger = logging.getLogger("astrbot")
+
+    astrbot = types.ModuleType("astrbot")
+    astrbot.logger = _logger
+    astrbot_api = types.ModuleType("astrbot.api")
+    astrbot_api.logger = _logger
+    astrbot.api = astrbot_api
+
+    class BaseMessageComponent(BaseModel):
+        """与 AstrBot 一致：pydantic.v1 模型，toDict 直接遍历实例 __dict__。"""
+
+        type: str = ""
+
+        def toDict(self):
+            data = {}
+            for k, v in self.__dict__.items():
+                if k == "type" or v is None:
+                    continue
+                data[k] = v
+            return {"type": self.type.lower(), "data": data}
+
+        async def convert_to_file_path(self) -> str:
+            return self.path or self.file
+
+        async def convert_to_base64(self) -> str:
+            return ""
+
+        async def register_to_file_service(self) -> str:
+            return self.url or self.file
+
+    class Image(BaseMessageComponent):
+        type: str = "Image"
+        file: Optional[str] = ""
+        url: Optional[str] = ""
+        path: Optional[str] = ""
+
+    class Record(Image):
+        type: str = "Record"
+
+    class Video(Image):
+        type: str = "Video"
+
+    message_components = types.ModuleType("astrbot.api.message_components")
+    message_components.BaseMessageComponent = BaseMessageComponent
+    message_components.Image = Image
+    message_components.Record = Record
+    message_components.Video = Video
+    astrbot_api.message_components = message_components
+
+    sys.modules["astrbot"] = astrbot
+    sys.modules["astrbot.api"] = astrbot_api
+    sys.modules["astrbot.api.message_components"] = message_components
@@ -0,0 +1,63 @@
+"""懒加载媒体组件：加载状态不进序列化，拷贝后仍可独立加载。"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import importlib.util
+import json
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("wxhttp_lazy_media", _ROOT / "wxhttp_lazy_media.py")
+wxhttp_lazy_media = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(wxhttp_lazy_media)
+
+LazyImage = wxhttp_lazy_media.LazyImage
+
+
+def _loader(path: str, calls: list):
+    async def load():
+        calls.append(path)
+        await asyncio.sleep(0.01)
+        return LazyImage(file=path, path=path)
+
+    return load
+
+
+def test_deferred_state_not_serialized():
+    async def main():
+        calls = []
+        comp = LazyImage.deferred(_loader("/tmp/a.jpg", calls), label="MsgId=1")
+        comp.prefetch()  # 下载任务在途时也不能出现在序列化结果里
+        for dumped in (comp.dict(), comp.toDict()):
+            assert not any(str(k).startswith("_wx") for k in dumped)
+            assert not any(str(k).startswith("_wx") for k in dumped.get("data", {}))
+            json.dumps(dumped)
+        await comp.ensure_loaded()
+        assert comp.file == "/tmp/a.jpg"
+        assert comp.toDict()["data"]["file"] == "/tmp/a.jpg"
+        assert calls == ["/tmp/a.jpg"]
+
+    asyncio.run(main())
+
+
+def test_copies_load_independently():
+    async def main():
+        calls = []
+        comp = LazyImage.deferred(_loader("/tmp/b.jpg", calls))
+        comp.prefetch()
+        pending = copy.deepcopy(comp)
+        shallow = comp.copy()
+        assert await pending.convert_to_file_path() == "/tmp/b.jpg"
+        assert await shallow.convert_to_file_path() == "/tmp/b.jpg"
+        assert await comp.convert_to_file_path() == "/tmp/b.jpg"
+        # 深拷贝在下载完成前拷走，各自下载；浅拷贝共用原组件的下载
+        assert calls == ["/tmp/b.jpg", "/tmp/b.jpg"]
+
+        loaded = copy.deepcopy(comp)
+        assert loaded.is_loaded
+        assert await loaded.convert_to_file_path() == "/tmp/b.jpg"
+        assert len(calls) == 2
+
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""媒体缓存 single-flight：发起下载的调用方被取消，不影响其它等待者。"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_ROOT = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("wxhttp_media_cache", _ROOT / "wxhttp_media_cache.py")
+wxhttp_media_cache = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(wxhttp_media_cache)
+
+
+def test_owner_cancel_does_not_cancel_waiters(tmp_path):
+    target = tmp_path / "a.jpg"
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        target.write_bytes(b"x")
+        return str(target)
+
+    async def main():
+        cache = wxhttp_media_cache.MediaCache()
+        owner = asyncio.create_task(cache.get_or_fetch(["img:md5:a"], fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_fetch(["img:md5:a", "img:msg:1"], fetch))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert await waiter == str(target)
+        assert calls == [1]
+        # 下载完成后已登记，再次请求直接命中
+        assert await cache.get_or_fetch(["img:md5:a"], fetch) == str(target)
+        assert (cache.misses, cache.shared, cache.hits) == (1, 1, 1)
+
+    asyncio.run(main())
+
+
+def test_fetch_error_reaches_every_waiter():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        cache = wxhttp_media_cache.MediaCache()
+        results = await asyncio.gather(
+            cache.get_or_fetch(["k"], fetch),
+            cache.get_or_fetch(["k"], fetch),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.misses == 1 and not cache._inflight
+
+    asyncio.run(main())
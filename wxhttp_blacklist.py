@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Pattern
+
+from astrbot import logger
+
+# 关键词较少时逐个子串查找（C 实现）比纯 Python 自动机更快
+_AC_MIN_KEYWORDS = 32
+
+
+class AhoCorasick:
+    """多模式子串匹配自动机，只回答“是否包含任一关键词”。
+
+    关键词需预先 casefold；goto 表为每个状态一个 dict，失败链接按 BFS 构建，
+    命中标记沿失败链接向下合并，匹配时扫描一遍文本即可。
+    """
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[bool] = [False]
+        for kw in keywords:
+            if not kw:
+                continue
+            state = 0
+            for ch in kw:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(False)
+                state = nxt
+            out[state] = True
+
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                if state == 0:
+                    # 根的子节点失败时回到根
+                    continue
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] or out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def search(self, text: str) -> bool:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if out[state]:
+                return True
+        return False
+
+
+class NicknameBlacklist:
+    """昵称黑名单：配置加载时编译一次，匹配结果按昵称做有界 LRU 缓存。
+
+    - 关键词：不区分大小写的子串匹配，数量多时走 Aho-Corasick；
+    - 正则：预编译（IGNORECASE），非法正则只在编译时告警一次并忽略。
+    """
+
+    def __init__(
+        self,
+        keywords: Iterable[str],
+        regex: str = "",
+        *,
+        cache_size: int = 4096,
+        label: str = "",
+    ) -> None:
+        folded = sorted({kw.casefold() for kw in keywords if kw})
+        self._keywords = folded
+        self._automaton: Optional[AhoCorasick] = AhoCorasick(folded) if len(folded) >= _AC_MIN_KEYWORDS else None
+        self._pattern: Optional[Pattern[str]] = None
+        regex = (regex or "").strip()
+        if regex:
+            try:
+                self._pattern = re.compile(regex, flags=re.IGNORECASE)
+            except re.error as e:
+                logger.warning(f"[wxhttp] invalid {label or 'nickname'} blacklist regex={regex!r}: {e}")
+        self._cache_size = max(0, int(cache_size))
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._keywords) or self._pattern is not None
+
+    def _evaluate(self, nickname_or_id: str) -> bool:
+        if self._keywords:
+            haystack = nickname_or_id.casefold()
+            if self._automaton is not None:
+                if self._automaton.search(haystack):
+                    return True
+            else:
+                for kw in self._keywords:
+                    if kw in haystack:
+                        return True
+        if self._pattern is not None:
+            return self._pattern.search(nickname_or_id) is not None
+        return False
+
+    def matches(self, nickname_or_id: str) -> bool:
+        if not nickname_or_id or not self.enabled:
+            return False
+        cache = self._cache
+        verdict = cache.get(nickname_or_id)
+        if verdict is not None:
+            self.hits += 1
+            cache.move_to_end(nickname_or_id)
+            return verdict
+        self.misses += 1
+        verdict = self._evaluate(nickname_or_id)
+        if self._cache_size:
+            cache[nickname_or_id] = verdict
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+        return verdict
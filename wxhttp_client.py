@@ -2,13 +2,89 @@ from __future__ import annotations
 
 import asyncio
 import json
+import time
 import urllib.error
 import urllib.request
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 from astrbot import logger
 
+from .wxhttp_pacing import DEFAULT_THROTTLE_KEYWORDS, AdaptiveRateController, SessionPacer
+from .wxhttp_retry import DEFAULT_RETRY_POLICIES, CircuitBreaker, RetryPolicy, WxHttpRequestError
+from .wxhttp_scheduler import LaneConfig, LaneScheduler
+from .wxhttp_transport import WxHttpConnectionPool
+
+# 请求通道：发送回复、媒体下载、元数据查询互不阻塞。
+# media 通道的 4 个 worker 对应分片下载窗口；它仍应用 api_request_delay_range，
+# 与其它 apply_delay 通道共用同一个发送节奏，窗口只增加在途数，不提高请求发出的速率
+LANE_SEND = "send"
+LANE_MEDIA = "media"
+LANE_META = "meta"
+
+DEFAULT_LANES: Dict[str, LaneConfig] = {
+    LANE_SEND: LaneConfig(weight=4, workers=1, max_depth=200),
+    LANE_MEDIA: LaneConfig(weight=1, workers=4, max_depth=1000),
+    LANE_META: LaneConfig(weight=2, workers=1, max_depth=200),
+}
+
+# 启用会话节奏控制后，发送通道不再做全局随机延时，由 SessionPacer 按会话排开，不同会话可并行
+PACED_SEND_LANE = LaneConfig(weight=4, workers=4, max_depth=200, apply_delay=False)
+
+# 按接口路径前缀归类；未列出的接口走 meta 通道
+_LANE_BY_PATH_PREFIX = (
+    ("/Msg/Send", LANE_SEND),
+    ("/Msg/Upload", LANE_SEND),
+    ("/Tools/", LANE_MEDIA),
+)
+
+
+def lane_for_path(path: str) -> str:
+    p = path if path.startswith("/") else f"/{path}"
+    for prefix, lane in _LANE_BY_PATH_PREFIX:
+        if p.startswith(prefix):
+            return lane
+    return LANE_META
+
+
+def throttle_signal(result: Dict[str, Any], keywords: Tuple[str, ...] = DEFAULT_THROTTLE_KEYWORDS) -> str:
+    """判断一个已解析的响应是否为限流/风控信号，是则返回简短描述，否则返回空串。
+
+    只看失败的响应（Success 为假且 Code 不是 0/200）：Code 为 429，或 Message 含限流关键词。
+    """
+    code = result.get("Code")
+    if result.get("Success") or code in (0, 200):
+        return ""
+    msg = str(result.get("Message") or "")
+    if code == 429 or str(code) == "429":
+        return f"Code=429 {msg[:40]}".strip()
+    folded = msg.casefold()
+    for kw in keywords:
+        if kw and kw.casefold() in folded:
+            return f"Code={code} {msg[:40]}"
+    return ""
+
+
+# 可以安全重试的只读接口（按路径前缀）及其重试类别。未列出的接口按 send 类别处理、默认不重试；
+# 新增接口确认幂等后再加到这里
+_RETRY_CLASS_BY_PATH_PREFIX = (
+    ("/Msg/Sync", "sync"),
+    ("/Tools/DownloadImg", "media"),
+    ("/Tools/CdnDownloadImage", "media"),
+    ("/Tools/DownloadVoice", "media"),
+    ("/Tools/DownloadVideo", "media"),
+    ("/Group/GetChatRoomMemberDetail", "meta"),
+)
+
+
+def retry_class_for_path(path: str) -> str:
+    """重试策略类别：只读接口按上表归类，其余（含发送类与未知接口）归为 send。"""
+    p = path if path.startswith("/") else f"/{path}"
+    for prefix, retry_class in _RETRY_CLASS_BY_PATH_PREFIX:
+        if p.startswith(prefix):
+            return retry_class
+    return "send"
+
 
 @dataclass
 class WxHttpClient:
@@ -17,25 +93,100 @@ class WxHttpClient:
     # API 请求队列化配置（sync 接口不受影响）
     request_delay_min: float = 0.0
     request_delay_max: float = 0.0
+    # HTTP 传输方式："pool"（asyncio keep-alive 连接池，默认）或 "urllib"（每次新建连接，走线程池）
+    transport: str = "pool"
+    pool_max_connections: int = 8
+    pool_idle_timeout_sec: float = 30.0
+    # 请求通道配置（None 使用 DEFAULT_LANES）；max_inflight 为所有通道共享的在途请求上限（0 表示连接池大小减一）。
+    # 使用连接池时总会给 Sync 留出一个连接，避免下一次 Sync 排在长时间的媒体下载后面
+    lanes: Optional[Dict[str, LaneConfig]] = None
+    max_inflight: int = 0
+    # 发送类接口（SendTxt/UploadImg/SendVoice）的按会话节奏控制
+    send_pacer: Optional[SessionPacer] = None
+    # 按接口类别的重试策略（None 使用 DEFAULT_RETRY_POLICIES，只需覆盖要改的类别）
+    retry_policies: Optional[Dict[str, RetryPolicy]] = None
+    # 熔断：连续失败次数阈值（0 关闭）与首次打开时长
+    breaker_failure_threshold: int = 5
+    breaker_reset_sec: float = 30.0
+    # AIMD 自适应限速（None 表示使用固定的 request_delay_min/max）；作用于 apply_delay 的通道
+    rate_controller: Optional[AdaptiveRateController] = None
+    # 响应 Message 中代表限流/风控的关键词
+    throttle_keywords: Tuple[str, ...] = DEFAULT_THROTTLE_KEYWORDS
     
     def __post_init__(self):
-        # API 请求队列（不包括 sync）
-        self._request_queue: asyncio.Queue = asyncio.Queue()
-        self._queue_worker_started = False
-        self._request_counter = 0
+        # API 请求调度器（不包括 sync）
+        lanes = dict(DEFAULT_LANES)
+        if self.send_pacer is not None and self.send_pacer.enabled:
+            lanes[LANE_SEND] = PACED_SEND_LANE
+        if self.lanes:
+            lanes.update(self.lanes)
+        self._scheduler = LaneScheduler(
+            lanes,
+            self._run_scheduled,
+            max_inflight=self._scheduled_inflight_limit(),
+            delay_range=(self.request_delay_min, self.request_delay_max),
+            rate_controller=self.rate_controller,
+        )
+        self._retry_policies = dict(DEFAULT_RETRY_POLICIES)
+        if self.retry_policies:
+            self._retry_policies.update(self.retry_policies)
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.breaker_failure_threshold,
+            reset_timeout_sec=self.breaker_reset_sec,
+        )
+        self._pool: Optional[WxHttpConnectionPool] = None
+        if self.transport == "pool":
+            try:
+                self._pool = WxHttpConnectionPool(
+                    self.base_url,
+                    max_connections=self.pool_max_connections,
+                    timeout_sec=self.timeout_sec,
+                    idle_timeout_sec=self.pool_idle_timeout_sec,
+                )
+            except ValueError as e:
+                logger.warning(f"[wxhttp] 连接池不可用，回退到 urllib: {e}")
+
+    def _scheduled_inflight_limit(self) -> int:
+        limit = self.max_inflight or self.pool_max_connections - 1
+        if self.transport == "pool" and self.pool_max_connections > 1:
+            # 调度器最多占用 pool - 1 个连接，剩下一个留给 Sync
+            limit = min(limit, self.pool_max_connections - 1)
+        return max(1, limit)
 
     def _url(self, path: str) -> str:
         base = self.base_url.rstrip("/")
         p = path if path.startswith("/") else f"/{path}"
         return f"{base}{p}"
 
+    @staticmethod
+    def _log_request(api_name: str, payload_str: str) -> None:
+        logger.debug(f"[wxhttp] → {api_name} 请求: {payload_str[:200]}..." if len(payload_str) > 200 else f"[wxhttp] → {api_name} 请求: {payload_str}")
+
+    @staticmethod
+    def _decode_response(url: str, raw: str, api_name: str, start_time: float) -> Dict[str, Any]:
+        try:
+            result = json.loads(raw)
+            elapsed = time.time() - start_time
+            
+            # 记录响应结果
+            code = result.get("Code", "N/A")
+            success = result.get("Success", False)
+            msg = result.get("Message", "")
+            status = "✓" if (success or code in (0, 200)) else "⚠"
+            logger.info(f"[wxhttp] {status} {api_name} ← Code={code} {msg} (耗时 {elapsed:.2f}s)")
+            
+            return result
+        except Exception as e:
+            elapsed = time.time() - start_time
+            logger.error(f"[wxhttp] ✗ {api_name} JSON解析失败 (耗时 {elapsed:.2f}s): {raw[:200]}")
+            raise RuntimeError(f"Invalid JSON from {url}: {raw[:500]}") from e
+
     def _post_json_sync(self, url: str, payload: Dict[str, Any], api_name: str = "API") -> Dict[str, Any]:
-        import time
         start_time = time.time()
         
         # 记录请求开始
         payload_str = json.dumps(payload, ensure_ascii=False)
-        logger.debug(f"[wxhttp] → {api_name} 请求: {payload_str[:200]}..." if len(payload_str) > 200 else f"[wxhttp] → {api_name} 请求: {payload_str}")
+        self._log_request(api_name, payload_str)
         
         data = payload_str.encode("utf-8")
         req = urllib.request.Request(
@@ -51,70 +202,128 @@ class WxHttpClient:
             elapsed = time.time() - start_time
             body = e.read().decode("utf-8", errors="replace") if e.fp else ""
             logger.error(f"[wxhttp] ✗ {api_name} HTTP错误 {e.code} (耗时 {elapsed:.2f}s): {body[:200]}")
-            raise RuntimeError(f"HTTP {e.code} calling {url}: {body}") from e
+            raise WxHttpRequestError(f"HTTP {e.code} calling {url}: {body}", status=e.code) from e
         except Exception as e:
             elapsed = time.time() - start_time
             logger.error(f"[wxhttp] ✗ {api_name} 请求失败 (耗时 {elapsed:.2f}s): {e}")
-            raise RuntimeError(f"Failed calling {url}: {e}") from e
+            timed_out = isinstance(getattr(e, "reason", e), TimeoutError)
+            raise WxHttpRequestError(f"Failed calling {url}: {e}", timeout=timed_out) from e
+
+        return self._decode_response(url, raw, api_name, start_time)
+
+    async def _post_json_pooled(self, url: str, payload: Dict[str, Any], api_name: str = "API") -> Dict[str, Any]:
+        assert self._pool is not None
+        start_time = time.time()
+
+        payload_str = json.dumps(payload, ensure_ascii=False)
+        self._log_request(api_name, payload_str)
 
         try:
-            result = json.loads(raw)
+            status, body_bytes = await self._pool.post(url, payload_str.encode("utf-8"))
+        except asyncio.TimeoutError as e:
             elapsed = time.time() - start_time
-            
-            # 记录响应结果
-            code = result.get("Code", "N/A")
-            success = result.get("Success", False)
-            msg = result.get("Message", "")
-            status = "✓" if (success or code in (0, 200)) else "⚠"
-            logger.info(f"[wxhttp] {status} {api_name} ← Code={code} {msg} (耗时 {elapsed:.2f}s)")
-            
-            return result
+            logger.error(f"[wxhttp] ✗ {api_name} 请求超时 (耗时 {elapsed:.2f}s)")
+            raise WxHttpRequestError(f"Timeout calling {url}", timeout=True) from e
         except Exception as e:
             elapsed = time.time() - start_time
-            logger.error(f"[wxhttp] ✗ {api_name} JSON解析失败 (耗时 {elapsed:.2f}s): {raw[:200]}")
-            raise RuntimeError(f"Invalid JSON from {url}: {raw[:500]}") from e
+            logger.error(f"[wxhttp] ✗ {api_name} 请求失败 (耗时 {elapsed:.2f}s): {e}")
+            raise WxHttpRequestError(f"Failed calling {url}: {e}") from e
+
+        raw = body_bytes.decode("utf-8", errors="replace")
+        if status >= 400:
+            elapsed = time.time() - start_time
+            logger.error(f"[wxhttp] ✗ {api_name} HTTP错误 {status} (耗时 {elapsed:.2f}s): {raw[:200]}")
+            raise WxHttpRequestError(f"HTTP {status} calling {url}: {raw}", status=status)
+
+        return self._decode_response(url, raw, api_name, start_time)
+
+    async def _post(self, url: str, payload: Dict[str, Any], api_name: str = "API") -> Dict[str, Any]:
+        """按配置的传输方式发送请求：默认连接池，urllib 作为回退。经过熔断器。"""
+        probe = self.breaker.before_call()
+        try:
+            if self._pool is not None:
+                result = await self._post_json_pooled(url, payload, api_name)
+            else:
+                result = await asyncio.to_thread(self._post_json_sync, url, payload, api_name)
+        except WxHttpRequestError as e:
+            if e.retryable:
+                self.breaker.record_failure()
+            else:
+                # 4xx 说明服务本身可达
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # 只有拿到探测名额的请求被取消时才归还，不能替别的请求释放
+            if probe:
+                self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def close(self) -> None:
+        """停止调度器并关闭连接池中的空闲连接。"""
+        await self._scheduler.close()
+        if self._pool is not None:
+            await self._pool.close()
+
+    async def _run_scheduled(self, item: tuple[str, Dict[str, Any], str, str]) -> Dict[str, Any]:
+        url, payload, api_name, lane = item
+        controller = self.rate_controller
+        if controller is None:
+            return await self._post(url, payload, api_name)
+
+        # 把每个排队请求的结果反馈给自适应限速（Sync 不经过这里，其耗时不代表接口负载）。
+        # 媒体分片的耗时随自适应分片大小变化，不参与耗时突增检测，只看显式的限流信号
+        check_latency = lane != LANE_MEDIA
+        start = time.monotonic()
+        try:
+            result = await self._post(url, payload, api_name)
+        except WxHttpRequestError as e:
+            if e.timeout:
+                controller.observe(api_name, time.monotonic() - start, f"{api_name} 超时")
+            elif e.status is not None and e.retryable:
+                controller.observe(api_name, time.monotonic() - start, f"{api_name} HTTP {e.status}")
+            raise
+        controller.observe(
+            api_name,
+            time.monotonic() - start if check_latency else None,
+            throttle_signal(result, self.throttle_keywords),
+        )
+        return result
 
-    async def _queue_worker(self):
-        """后台队列工作线程，处理所有非 sync 的 API 请求"""
-        import random
-        logger.info(f"[wxhttp] 请求队列工作线程启动（延时: {self.request_delay_min}-{self.request_delay_max}s）")
-        
-        while True:
-            try:
-                url, payload, api_name, future = await self._request_queue.get()
-                
-                # 随机延时（模拟真人操作）
-                if self.request_delay_max > 0:
-                    delay = random.uniform(self.request_delay_min, self.request_delay_max)
-                    logger.debug(f"[wxhttp] 队列延时 {delay:.2f}s 后发送 {api_name}")
-                    await asyncio.sleep(delay)
-                
-                # 执行请求
-                try:
-                    result = await asyncio.to_thread(self._post_json_sync, url, payload, api_name)
-                    future.set_result(result)
-                except Exception as e:
-                    future.set_exception(e)
-                finally:
-                    self._request_queue.task_done()
-            except Exception as e:
-                logger.exception(f"[wxhttp] 队列工作线程异常: {e}")
-    
-    async def _ensure_queue_worker(self):
-        """确保队列工作线程已启动"""
-        if not self._queue_worker_started:
-            self._queue_worker_started = True
-            asyncio.create_task(self._queue_worker())
-    
     async def _request_via_queue(self, path: str, payload: Dict[str, Any], api_name: str) -> Dict[str, Any]:
-        """通过队列发送请求（带延时控制）"""
-        await self._ensure_queue_worker()
-        
+        """通过调度器发送请求（按接口归入对应通道，带延时控制）"""
+        self.breaker.reject_if_open()
         url = self._url(path)
-        future = asyncio.Future()
-        await self._request_queue.put((url, payload, api_name, future))
-        
-        return await future
+        lane = lane_for_path(path)
+        return await self._scheduler.submit(lane, (url, payload, api_name, lane))
+
+    async def _with_retry(self, path: str, api_name: str, call) -> Dict[str, Any]:
+        """按接口类别的策略重试可重试的失败；熔断打开时直接失败。"""
+        policy = self._retry_policies.get(retry_class_for_path(path)) or RetryPolicy()
+        attempt = 1
+        while True:
+            try:
+                return await call()
+            except WxHttpRequestError as e:
+                if not e.retryable or attempt >= policy.max_attempts:
+                    raise
+                delay = policy.backoff(attempt)
+                logger.warning(
+                    f"[wxhttp] {api_name} 第 {attempt}/{policy.max_attempts} 次请求失败，{delay:.2f}s 后重试: {e}"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def queue_stats(self) -> Dict[str, Dict[str, int]]:
+        """各通道当前排队/在途请求数。"""
+        return self._scheduler.stats()
+
+    def rate_stats(self) -> Optional[Dict[str, Any]]:
+        """自适应限速的当前速率上限与实际吞吐；未启用时返回 None。"""
+        if self.rate_controller is None:
+            return None
+        return self.rate_controller.stats()
     
     async def post_json(self, path: str, payload: Dict[str, Any], api_name: str = "API", bypass_queue: bool = False) -> Dict[str, Any]:
         """发送 JSON POST 请求
@@ -128,10 +337,19 @@ class WxHttpClient:
         if bypass_queue:
             # sync 接口不走队列，直接调用
             url = self._url(path)
-            return await asyncio.to_thread(self._post_json_sync, url, payload, api_name)
+            return await self._with_retry(path, api_name, lambda: self._post(url, payload, api_name))
         else:
-            # 其他接口走队列
-            return await self._request_via_queue(path, payload, api_name)
+            # 其他接口走队列；重试时重新排队，退避期间不占用通道 worker
+            return await self._with_retry(
+                path, api_name, lambda: self._request_via_queue(path, payload, api_name)
+            )
+
+    async def _post_send(self, to_wxid: str, path: str, payload: Dict[str, Any], api_name: str) -> Dict[str, Any]:
+        """发送类接口：按会话节奏控制后再进入发送通道。"""
+        if self.send_pacer is None:
+            return await self.post_json(path, payload, api_name=api_name)
+        async with self.send_pacer.slot(to_wxid):
+            return await self.post_json(path, payload, api_name=api_name)
 
     async def sync(self, *, wxid: str, scene: int = 0, synckey: str = "") -> Dict[str, Any]:
         return await self.post_json(
@@ -154,7 +372,8 @@ class WxHttpClient:
         at: str = "",
         type_: int = 1,
     ) -> Dict[str, Any]:
-        return await self.post_json(
+        return await self._post_send(
+            to_wxid,
             "/Msg/SendTxt",
             {
                 "At": at,
@@ -173,7 +392,8 @@ class WxHttpClient:
         to_wxid: str,
         base64_data: str,
     ) -> Dict[str, Any]:
-        return await self.post_json(
+        return await self._post_send(
+            to_wxid,
             "/Msg/UploadImg",
             {
                 "Base64": base64_data,
@@ -192,7 +412,8 @@ class WxHttpClient:
         type_: int = 4,
         voice_time_ms: int = 1000,
     ) -> Dict[str, Any]:
-        return await self.post_json(
+        return await self._post_send(
+            to_wxid,
             "/Msg/SendVoice",
             {
                 "Base64": base64_data,
@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import mmap
+import os
+import struct
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from astrbot import logger
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+# Fibonacci 哈希乘数（2^64 / 黄金分割）
+_FIB_MUL = 11400714819323198485
+
+_HEADER = struct.Struct("<8sQQQ")
+_MAGIC = b"WXDEDUP1"
+
+
+def _table_bits(capacity: int) -> int:
+    # 索引表至少为容量的 2 倍（负载因子 <= 0.5），线性探测保持短链
+    bits = 4
+    while (1 << bits) < capacity * 2:
+        bits += 1
+    return bits
+
+
+class DedupRing:
+    """定长消息 id 去重窗口：int64 环形数组 + 开放寻址哈希索引，全部放在一块连续内存里。
+
+    - 只记住最近 capacity 个 id，写满后覆盖最旧的一个并从索引中删除（线性探测的回移删除，无墓碑）；
+    - 传入 path 时由 mmap 文件承载，写入即进入页缓存，进程崩溃后重启仍可去重；
+    - id 按无符号 64 位处理，0 视为“无 id”不参与去重。
+
+    文件布局：header(magic, capacity, head, count) | ring[capacity] | index[2^bits]
+    """
+
+    def __init__(self, capacity: int, path: Optional[str] = None) -> None:
+        self.capacity = max(16, int(capacity))
+        self.path = path
+        self._bits = _table_bits(self.capacity)
+        self._table_size = 1 << self._bits
+        self._nbytes = _HEADER.size + 8 * (self.capacity + self._table_size)
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        if path:
+            buf = self._open_file(path)
+        else:
+            buf = bytearray(self._nbytes)
+            _HEADER.pack_into(buf, 0, _MAGIC, self.capacity, 0, 0)
+        self._buf = buf
+        self._words = memoryview(buf)[_HEADER.size:].cast("Q")
+        self._ring = self._words[: self.capacity]
+        self._index = self._words[self.capacity :]
+        _, _, self._head, self._count = _HEADER.unpack_from(buf, 0)
+
+    def _open_file(self, path: str):
+        fresh = True
+        try:
+            if os.path.getsize(path) == self._nbytes:
+                with open(path, "rb") as f:
+                    magic, capacity, head, count = _HEADER.unpack(f.read(_HEADER.size))
+                fresh = not (magic == _MAGIC and capacity == self.capacity and head < capacity and count <= capacity)
+                if fresh:
+                    logger.warning(f"[wxhttp] 去重文件头不匹配，重建 {path}")
+            else:
+                logger.info(f"[wxhttp] 去重文件容量变化，重建 {path}")
+        except FileNotFoundError:
+            pass
+        f = open(path, "r+b" if not fresh else "w+b")
+        if fresh:
+            f.truncate(self._nbytes)
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, self.capacity, 0, 0))
+            f.flush()
+        self._file = f
+        self._mmap = mmap.mmap(f.fileno(), self._nbytes)
+        return self._mmap
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def _slot(self, key: int) -> int:
+        return ((key * _FIB_MUL) & _MASK64) >> (64 - self._bits)
+
+    def _find(self, key: int) -> int:
+        """返回 key 所在槽位，或应插入的空槽位（取负数 - 1）。"""
+        index, mask = self._index, self._table_size - 1
+        i = self._slot(key)
+        while True:
+            v = index[i]
+            if v == key:
+                return i
+            if v == 0:
+                return -i - 1
+            i = (i + 1) & mask
+
+    def _remove(self, key: int) -> None:
+        i = self._find(key)
+        if i < 0:
+            return
+        index, mask = self._index, self._table_size - 1
+        # 回移删除：把后续同簇元素前移，保持探测链连续
+        j = i
+        while True:
+            index[i] = 0
+            while True:
+                j = (j + 1) & mask
+                v = index[j]
+                if v == 0:
+                    return
+                home = self._slot(v)
+                # home 不在 (i, j] 循环区间内时，v 可以移到 i
+                if (i <= j and (home <= i or home > j)) or (i > j and home <= i and home > j):
+                    break
+            index[i] = v
+            i = j
+
+    def __contains__(self, msg_id: int) -> bool:
+        key = int(msg_id) & _MASK64
+        return key != 0 and self._find(key) >= 0
+
+    def add(self, msg_id: int) -> bool:
+        """记录一个 id；已存在返回 False，新 id 返回 True。"""
+        key = int(msg_id) & _MASK64
+        if key == 0:
+            return True
+        pos = self._find(key)
+        if pos >= 0:
+            return False
+        head = self._head
+        if self._count == self.capacity:
+            self._remove(self._ring[head])
+            # 删除可能移动了探测链，重新定位插入槽
+            pos = self._find(key)
+        else:
+            self._count += 1
+        self._index[-pos - 1] = key
+        self._ring[head] = key
+        self._head = (head + 1) % self.capacity
+        _HEADER.pack_into(self._buf, 0, _MAGIC, self.capacity, self._head, self._count)
+        return True
+
+    def flush(self) -> None:
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        # mmap 关闭前必须释放所有导出的 memoryview
+        self._ring.release()
+        self._index.release()
+        self._words.release()
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RotatingBloom:
+    """两代轮换的 Bloom 过滤器，用于在精确窗口之外再记住更多 id（可能误判为“见过”）。
+
+    每代最多容纳 capacity/2 个 id，当前代写满后整体轮换、丢弃最老一代，
+    因此至少记住最近 capacity/2、至多 capacity 个 id。
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = 1e-6) -> None:
+        self.capacity = max(2, int(capacity))
+        self.fp_rate = min(0.1, max(1e-12, float(fp_rate)))
+        per_gen = self.capacity // 2
+        # m = -n ln(p) / (ln 2)^2，k = m/n ln 2
+        bits = max(64, int(math.ceil(-per_gen * math.log(self.fp_rate) / (math.log(2) ** 2))))
+        self._bits = bits
+        self._k = max(1, int(round(bits / per_gen * math.log(2))))
+        self._per_gen = per_gen
+        self._current = bytearray((bits + 7) // 8)
+        self._previous = bytearray((bits + 7) // 8)
+        self._current_count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def _positions(self, key: int):
+        # 双重哈希：h1 + i*h2
+        h1 = (key * _FIB_MUL) & _MASK64
+        h2 = ((key ^ (key >> 31)) * 0xBF58476D1CE4E5B9 & _MASK64) | 1
+        bits = self._bits
+        for i in range(self._k):
+            yield ((h1 + i * h2) & _MASK64) % bits
+
+    @staticmethod
+    def _test(buf: bytearray, positions) -> bool:
+        for p in positions:
+            if not buf[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def __contains__(self, msg_id: int) -> bool:
+        positions = list(self._positions(int(msg_id) & _MASK64))
+        return self._test(self._current, positions) or self._test(self._previous, positions)
+
+    def add(self, msg_id: int) -> None:
+        if self._current_count >= self._per_gen:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._current_count = 0
+        buf = self._current
+        for p in self._positions(int(msg_id) & _MASK64):
+            buf[p >> 3] |= 1 << (p & 7)
+        self._current_count += 1
+
+
+class MessageDeduper:
+    """消息去重：精确的 DedupRing 窗口，可选再叠加一个更大的 RotatingBloom 窗口。"""
+
+    def __init__(
+        self,
+        capacity: int = 3000,
+        *,
+        path: Optional[str] = None,
+        bloom_capacity: int = 0,
+        bloom_fp_rate: float = 1e-6,
+    ) -> None:
+        self.ring = DedupRing(capacity, path)
+        self.bloom: Optional[RotatingBloom] = None
+        if bloom_capacity and int(bloom_capacity) > self.ring.capacity:
+            self.bloom = RotatingBloom(bloom_capacity, bloom_fp_rate)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ring.nbytes + (self.bloom.nbytes if self.bloom is not None else 0)
+
+    def add(self, msg_id: int) -> bool:
+        """新 id 返回 True；在精确窗口或 Bloom 窗口里见过则返回 False。"""
+        if not self.ring.add(msg_id):
+            return False
+        if self.bloom is not None:
+            if msg_id in self.bloom:
+                return False
+            self.bloom.add(msg_id)
+        return True
+
+    def flush(self) -> None:
+        self.ring.flush()
+
+    def close(self) -> None:
+        self.ring.close()
+
+
+class _SyncBatch:
+    __slots__ = ("keybuf", "remaining")
+
+    def __init__(self, keybuf: str, remaining: int) -> None:
+        self.keybuf = keybuf
+        self.remaining = remaining
+
+
+class SyncCheckpoint:
+    """Sync 游标（KeyBuf）检查点。
+
+    一批 AddMsgs 全部经过转换（已写入去重窗口）后，该批返回的 KeyBuf 才可提交；
+    按批次顺序推进，确保游标不会越过尚未处理的消息。落盘为原子替换（tmp + fsync + rename），
+    并合并短时间内的多次提交。
+    """
+
+    def __init__(self, path: str, *, flush_interval_sec: float = 1.0) -> None:
+        self.path = path
+        self.flush_interval_sec = max(0.1, float(flush_interval_sec))
+        self._batches: Deque[_SyncBatch] = deque()
+        self._committed = ""
+        self._saved = ""
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_flush: List[Callable[[], None]] = []
+
+    @property
+    def committed(self) -> str:
+        return self._committed
+
+    def on_flush(self, callback: Callable[[], None]) -> None:
+        """检查点落盘前执行（用于先刷去重窗口）。"""
+        self._on_flush.append(callback)
+
+    def load(self) -> str:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                keybuf = str(json.load(f).get("keybuf") or "")
+        except FileNotFoundError:
+            return ""
+        except Exception as e:
+            logger.warning(f"[wxhttp] 读取 Sync 检查点失败: {e}")
+            return ""
+        self._committed = self._saved = keybuf
+        return keybuf
+
+    def begin_batch(self, keybuf: str, count: int) -> Callable[[], None]:
+        """登记一批消息，返回每条消息处理完成后调用的回调。"""
+        batch = _SyncBatch(keybuf, count)
+        self._batches.append(batch)
+
+        def done() -> None:
+            batch.remaining -= 1
+            self._advance()
+
+        self._advance()
+        return done
+
+    def _advance(self) -> None:
+        advanced = False
+        while self._batches and self._batches[0].remaining <= 0:
+            batch = self._batches.popleft()
+            if batch.keybuf:
+                self._committed = batch.keybuf
+                advanced = True
+        if advanced:
+            self._start()
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _save_sync(self, keybuf: str) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"keybuf": keybuf}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def flush(self) -> None:
+        keybuf = self._committed
+        if keybuf == self._saved:
+            return
+        for callback in self._on_flush:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"[wxhttp] checkpoint pre-flush failed: {e}")
+        try:
+            await asyncio.to_thread(self._save_sync, keybuf)
+            self._saved = keybuf
+        except Exception as e:
+            logger.warning(f"[wxhttp] 保存 Sync 检查点失败: {e}")
+
+    def _start(self) -> None:
+        if self._task is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+            await asyncio.sleep(self.flush_interval_sec)
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from astrbot import logger
+
+# (start_pos, length) -> 该分片的原始字节；失败时抛出异常
+FetchSection = Callable[[int, int], Awaitable[bytes]]
+
+
+class SectionDownloadError(RuntimeError):
+    """分片下载失败（首个失败分片的原因会挂在 __cause__ 上）。"""
+
+
+class BytesSink:
+    """按偏移写入的内存缓冲区。"""
+
+    def __init__(self, total_len: int) -> None:
+        self._buf = bytearray(total_len)
+        self._end = 0
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        end = offset + len(data)
+        if end > len(self._buf):
+            self._buf.extend(b"\0" * (end - len(self._buf)))
+        self._buf[offset:end] = data
+        self._end = max(self._end, end)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buf[: self._end])
+
+
+def _merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+class RangeFileWriter:
+    """按偏移写入的文件 sink，附带断点续传清单。
+
+    - 整个下载过程只打开一次文件描述符，按显式偏移写入；
+    - 已完成的区间记录在旁路清单 <file>.part.json 中（原子替换写入）；
+    - 再次下载同一文件（同一 total_len）时只补缺失区间；
+    - 下载完成后删除清单，文件截断到实际长度。
+    """
+
+    MANIFEST_SUFFIX = ".part.json"
+
+    def __init__(self, path: str, total_len: int, *, flush_every: int = 16) -> None:
+        self.path = path
+        self.total_len = int(total_len)
+        self.manifest_path = path + self.MANIFEST_SUFFIX
+        self._flush_every = max(1, int(flush_every))
+        self._done: List[Tuple[int, int]] = []
+        self._dirty = 0
+        self._fd: Optional[int] = None
+
+    def _load_manifest(self) -> List[Tuple[int, int]]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+        if not isinstance(manifest, dict) or manifest.get("total") != self.total_len:
+            return []
+        ranges = []
+        for item in manifest.get("ranges") or []:
+            if isinstance(item, list) and len(item) == 2:
+                start, end = int(item[0]), int(item[1])
+                if 0 <= start < end <= self.total_len:
+                    ranges.append((start, end))
+        return _merge_ranges(ranges)
+
+    def open(self) -> None:
+        """打开文件；清单有效则保留已下载内容，否则从头开始。"""
+        done = self._load_manifest() if os.path.exists(self.path) else []
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if not done:
+            flags |= os.O_TRUNC
+        self._fd = os.open(self.path, flags, 0o644)
+        self._done = done
+        self._dirty = 0
+
+    def missing_ranges(self) -> List[Tuple[int, int]]:
+        missing: List[Tuple[int, int]] = []
+        cursor = 0
+        for start, end in self._done:
+            if start > cursor:
+                missing.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < self.total_len:
+            missing.append((cursor, self.total_len))
+        return missing
+
+    @property
+    def completed_bytes(self) -> int:
+        return sum(end - start for start, end in self._done)
+
+    def _pwrite(self, offset: int, data: bytes) -> None:
+        assert self._fd is not None
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                n = os.pwrite(self._fd, view, offset)
+                view = view[n:]
+                offset += n
+        else:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            os.write(self._fd, data)
+
+    def _save_manifest(self) -> None:
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"total": self.total_len, "ranges": self._done}, f)
+        os.replace(tmp, self.manifest_path)
+        self._dirty = 0
+
+    def _write_and_record(self, offset: int, data: bytes) -> None:
+        self._pwrite(offset, data)
+        self._done = _merge_ranges([*self._done, (offset, offset + len(data))])
+        self._dirty += 1
+        if self._dirty >= self._flush_every:
+            self._save_manifest()
+
+    async def write_at(self, offset: int, data: bytes) -> None:
+        await asyncio.to_thread(self._write_and_record, offset, data)
+
+    def _close(self, complete: bool) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if complete:
+                end = self._done[-1][1] if self._done else 0
+                if end < self.total_len:
+                    # 最后一片比声明的短：按实际长度截断
+                    os.ftruncate(fd, end)
+            elif self._dirty:
+                self._save_manifest()
+        finally:
+            os.close(fd)
+        if complete:
+            try:
+                os.remove(self.manifest_path)
+            except FileNotFoundError:
+                pass
+
+    async def close(self, complete: bool) -> None:
+        """关闭文件。complete=False 时保存清单以便续传。"""
+        await asyncio.to_thread(self._close, complete)
+
+
+class SectionSizeController:
+    """单个 (媒体类型, 服务端) 的自适应分片大小。
+
+    - 连续成功且延时低于目标：按 grow_factor 放大；
+    - 延时明显超过目标：小幅缩小；
+    - 失败/超时：减半；
+    - 记录吞吐量最高的分片大小（best_size），失败回退时不会低于它的一半；
+    - 中间分片返回得比请求的短：说明服务端有分片上限，按实际长度收紧 max_size，之后不再超过它。
+    """
+
+    ALIGN = 4096
+
+    def __init__(
+        self,
+        *,
+        initial: int,
+        min_size: int = 16384,
+        max_size: int = 524288,
+        target_latency_sec: float = 1.0,
+        grow_after: int = 3,
+        grow_factor: float = 1.5,
+    ) -> None:
+        self.min_size = max(self.ALIGN, int(min_size))
+        self.max_size = max(self.min_size, int(max_size))
+        self.target_latency_sec = float(target_latency_sec)
+        self.grow_after = max(1, int(grow_after))
+        self.grow_factor = max(1.0, float(grow_factor))
+        self._size = self._clamp(initial)
+        self._streak = 0
+        self.best_size = self._size
+        self._best_throughput = 0.0
+        self.successes = 0
+        self.failures = 0
+        # 学到的服务端分片上限（0 表示尚未发现）
+        self.server_cap = 0
+
+    def _clamp(self, size: float) -> int:
+        aligned = int(size) // self.ALIGN * self.ALIGN
+        return min(self.max_size, max(self.min_size, aligned))
+
+    def size(self) -> int:
+        return self._size
+
+    def cap(self, size: int) -> None:
+        """服务端实际返回的整片长度小于请求长度：以此为上限。"""
+        size = int(size)
+        if size <= 0 or (self.server_cap and size >= self.server_cap):
+            return
+        self.server_cap = size
+        self.max_size = size
+        self.min_size = min(self.min_size, size)
+        self._size = min(self._size, size)
+        self.best_size = min(self.best_size, size)
+        logger.debug(f"[wxhttp] 服务端分片上限 {size} 字节，分片大小不再超过该值")
+
+    def record(self, size: int, latency_sec: float, ok: bool) -> None:
+        if not ok:
+            self.failures += 1
+            self._streak = 0
+            floor = self._clamp(self.best_size // 2)
+            self._size = max(floor, self._clamp(min(self._size, size) // 2))
+            return
+
+        self.successes += 1
+        if latency_sec > 0:
+            throughput = size / latency_sec
+            # 只有足量分片才参与“最佳大小”的评估，避免尾片干扰
+            if size >= self._size // 2 and throughput > self._best_throughput:
+                self._best_throughput = throughput
+                self.best_size = self._clamp(size)
+
+        if latency_sec > self.target_latency_sec * 2:
+            self._streak = 0
+            self._size = self._clamp(self._size * 0.75)
+            return
+
+        if latency_sec <= self.target_latency_sec:
+            self._streak += 1
+            if self._streak >= self.grow_after:
+                self._streak = 0
+                self._size = self._clamp(self._size * self.grow_factor)
+
+    def snapshot(self) -> Dict[str, int]:
+        out = {"size": self._size, "best_size": self.best_size}
+        if self.server_cap:
+            out["server_cap"] = self.server_cap
+        return out
+
+    def restore(self, state: Dict[str, int]) -> None:
+        cap = state.get("server_cap")
+        if isinstance(cap, int) and cap > 0:
+            self.cap(cap)
+        best = state.get("best_size")
+        if isinstance(best, int) and best > 0:
+            self.best_size = self._clamp(best)
+            self._size = self.best_size
+
+
+class SectionSizeRegistry:
+    """按 (媒体类型, 服务端) 维护 SectionSizeController，学到的大小跨消息复用。"""
+
+    def __init__(
+        self,
+        *,
+        initial: Dict[str, int],
+        min_size: int = 16384,
+        max_size: int = 524288,
+        target_latency_sec: float = 1.0,
+    ) -> None:
+        self._initial = dict(initial)
+        self._min_size = min_size
+        self._max_size = max_size
+        self._target_latency_sec = target_latency_sec
+        self._controllers: Dict[Tuple[str, str], SectionSizeController] = {}
+        self._restored: Dict[str, Dict[str, int]] = {}
+
+    def get(self, media_type: str, server: str) -> SectionSizeController:
+        key = (media_type, server)
+        ctl = self._controllers.get(key)
+        if ctl is None:
+            ctl = SectionSizeController(
+                initial=self._initial.get(media_type, 65536),
+                min_size=self._min_size,
+                max_size=self._max_size,
+                target_latency_sec=self._target_latency_sec,
+            )
+            state = self._restored.get(f"{media_type}|{server}")
+            if state:
+                ctl.restore(state)
+            self._controllers[key] = ctl
+        return ctl
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        out = dict(self._restored)
+        for (media_type, server), ctl in self._controllers.items():
+            out[f"{media_type}|{server}"] = ctl.snapshot()
+        return out
+
+    def restore(self, state: Dict[str, Dict[str, int]]) -> None:
+        if isinstance(state, dict):
+            self._restored = {k: v for k, v in state.items() if isinstance(v, dict)}
+
+
+class RangedDownloader:
+    """窗口化并发分片下载。
+
+    同时保持最多 window 个 Section.StartPos 请求在途，按偏移写回 sink；
+    任一分片失败时取消所有在途分片并抛出 SectionDownloadError。
+    分片返回得比请求的短时，视为服务端的分片上限：写入已收到的部分，剩余部分作为新区间补拉；
+    只有文件末尾的补拉返回空时，才认为实际文件比声明的短。
+    传入 sizer 时每个新分片的大小由 SectionSizeController 决定，并回报延时与成败。
+    """
+
+    def __init__(
+        self,
+        fetch: FetchSection,
+        *,
+        total_len: int,
+        chunk_size: int,
+        window: int = 4,
+        label: str = "media",
+        sizer: Optional[SectionSizeController] = None,
+        ranges: Optional[List[Tuple[int, int]]] = None,
+    ) -> None:
+        if total_len <= 0:
+            raise ValueError("total_len must be positive")
+        self._fetch = fetch
+        self._total_len = int(total_len)
+        self._chunk_size = max(1, int(chunk_size))
+        self._window = max(1, int(window))
+        self._label = label
+        self._sizer = sizer
+        # 需要下载的 [start, end) 区间，默认整个文件；续传时只给缺失区间
+        self._ranges = _merge_ranges(ranges) if ranges is not None else [(0, self._total_len)]
+
+    def _next_chunk_size(self) -> int:
+        return self._sizer.size() if self._sizer is not None else self._chunk_size
+
+    async def _fetch_one(self, start: int, length: int, eof_ok: bool = False) -> bytes:
+        if self._sizer is None:
+            return await self._fetch_checked(start, length, eof_ok)
+        t0 = time.monotonic()
+        try:
+            data = await self._fetch_checked(start, length, eof_ok)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._sizer.record(length, time.monotonic() - t0, ok=False)
+            raise
+        if not data:
+            return data
+        if len(data) < length and start + length < self._total_len:
+            self._sizer.cap(len(data))
+        self._sizer.record(len(data), time.monotonic() - t0, ok=True)
+        return data
+
+    async def _fetch_checked(self, start: int, length: int, eof_ok: bool = False) -> bytes:
+        data = await self._fetch(start, length)
+        if not data:
+            if eof_ok:
+                return b""
+            raise SectionDownloadError(f"empty section start={start}")
+        return data[:length]
+
+    async def run(self, sink: BytesSink | RangeFileWriter) -> int:
+        """下载全部待下载区间写入 sink，返回写入的字节数。"""
+        pending_ranges = list(self._ranges)
+        range_idx = 0
+        next_start = pending_ranges[0][0] if pending_ranges else 0
+        written = 0
+        in_flight: Dict[asyncio.Task, Tuple[int, int]] = {}
+        # 短分片留下的剩余部分，优先补拉
+        remainders: List[Tuple[int, int]] = []
+        # 文件末尾补拉返回空的位置：实际文件在此结束
+        eof = self._total_len
+
+        def schedule() -> None:
+            nonlocal next_start, range_idx
+            while len(in_flight) < self._window and remainders:
+                start, end = remainders.pop()
+                if start >= eof:
+                    continue
+                length = min(self._next_chunk_size(), end - start)
+                task = asyncio.create_task(self._fetch_one(start, length, eof_ok=end >= self._total_len))
+                in_flight[task] = (start, length)
+                if start + length < end:
+                    remainders.append((start + length, end))
+            while len(in_flight) < self._window and range_idx < len(pending_ranges):
+                range_end = pending_ranges[range_idx][1]
+                length = min(self._next_chunk_size(), range_end - next_start)
+                task = asyncio.create_task(self._fetch_one(next_start, length))
+                in_flight[task] = (next_start, length)
+                next_start += length
+                if next_start >= range_end:
+                    range_idx += 1
+                    if range_idx < len(pending_ranges):
+                        next_start = pending_ranges[range_idx][0]
+
+        try:
+            schedule()
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    start, length = in_flight.pop(task)
+                    exc = task.exception()
+                    if exc is not None:
+                        raise SectionDownloadError(
+                            f"{self._label} section failed start={start}: {exc}"
+                        ) from exc
+                    data = task.result()
+                    if not data:
+                        eof = min(eof, start)
+                        continue
+                    result = sink.write_at(start, data)
+                    if inspect.isawaitable(result):
+                        await result
+                    written += len(data)
+                    if len(data) < length and start + len(data) < eof:
+                        # 分片变短：服务端分片上限，剩余部分补拉
+                        remainders.append((start + len(data), start + length))
+                schedule()
+        finally:
+            if in_flight:
+                await self._abort(in_flight.keys())
+        return written
+
+    async def _abort(self, tasks: Iterable[asyncio.Task]) -> None:
+        tasks = list(tasks)
+        cancelled = 0
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        # 已完成的任务也要收集一次结果，避免 "exception was never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.debug(f"[wxhttp] {self._label} 分片下载中止，已取消 {cancelled} 个在途分片")
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from defusedxml import ElementTree as eT
+
+# 群系统消息类型：10000 为纯文本提示，10002 为 <sysmsg> XML
+GROUP_SYSTEM_MSG_TYPES = (10000, 10002)
+
+# sysmsgtemplate 中承载“被加入 / 被移出”成员的 link 名称；其余 link（邀请人、操作人等）只更新昵称
+_JOINED_LINKS = {"names", "adder"}
+_REMOVED_LINKS = {"names", "kickoutname", "member"}
+
+# 无法解析出 wxid 的成员变动提示：只能让整表过期，下次读取时后台刷新
+_MEMBERSHIP_HINT_RE = re.compile(r"加入了?群聊|移出(了)?群聊|退出了?群聊|修改群昵称|joined the group|from the group|left the group")
+
+
+@dataclass
+class GroupMemberDelta:
+    """一条群系统消息对成员表的影响。"""
+
+    added: Dict[str, str] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    # 仅更新已在表里的成员昵称（邀请人/操作人等）
+    renamed: Dict[str, str] = field(default_factory=dict)
+    # 识别到成员变动但拿不到 wxid：整表标记过期
+    invalidate: bool = False
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.renamed or self.invalidate)
+
+
+def _memberlist(link) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for member in link.iter("member"):
+        wxid = (member.findtext("username") or "").strip()
+        if wxid:
+            out[wxid] = (member.findtext("nickname") or "").strip()
+    return out
+
+
+def _parse_sysmsg(xml_text: str) -> Optional[GroupMemberDelta]:
+    try:
+        root = eT.fromstring(xml_text)
+    except Exception:
+        return None
+    if root.tag != "sysmsg":
+        return None
+    sys_type = (root.get("type") or "").strip()
+    delta = GroupMemberDelta()
+
+    if sys_type == "sysmsgtemplate":
+        template = root.findtext(".//template") or ""
+        joined = "加入" in template or "joined" in template
+        removed = "移出" in template or "退出" in template or "removed" in template
+        if not joined and not removed:
+            return None
+        for link in root.iter("link"):
+            name = (link.get("name") or "").strip()
+            members = _memberlist(link)
+            if not members:
+                continue
+            if joined and name in _JOINED_LINKS:
+                delta.added.update(members)
+            elif removed and name in _REMOVED_LINKS:
+                delta.removed.extend(members)
+            else:
+                delta.renamed.update({k: v for k, v in members.items() if v})
+        if not delta.added and not delta.removed:
+            delta.invalidate = True
+        return delta
+
+    if sys_type == "delchatroommember":
+        members: Dict[str, str] = {}
+        for link in root.iter("link"):
+            members.update(_memberlist(link))
+        if members:
+            delta.removed.extend(members)
+        else:
+            delta.invalidate = True
+        return delta
+
+    return None
+
+
+def parse_group_system_message(msg_type: int, content: str) -> Optional[GroupMemberDelta]:
+    """解析群系统消息（入群 / 移出 / 退群等），返回成员表增量；与成员无关时返回 None。
+
+    content 可以带 "chatroom_id:\\n" 前缀。
+    """
+    text = (content or "").strip()
+    if not text:
+        return None
+    start = text.find("<sysmsg")
+    if start >= 0:
+        return _parse_sysmsg(text[start:])
+    if msg_type == 10000 and _MEMBERSHIP_HINT_RE.search(text):
+        # 10000 纯文本只有昵称，没有 wxid
+        return GroupMemberDelta(invalidate=True)
+    return None
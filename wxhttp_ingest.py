@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import zlib
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from astrbot import logger
+
+RawMsgHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+ShardKeyFn = Callable[[Dict[str, Any]], str]
+
+
+class ShardedExecutor:
+    """按 key 分片的有序执行器。
+
+    同一个 key 总是落到同一个分片，分片内单 worker 顺序执行，保证同一会话的消息
+    按入队顺序完成；不同分片之间并行。每个分片有独立的有界队列。
+    """
+
+    def __init__(
+        self,
+        handler: RawMsgHandler,
+        key_fn: ShardKeyFn,
+        *,
+        shards: int = 4,
+        max_pending: int = 500,
+        label: str = "shard",
+    ) -> None:
+        self._handler = handler
+        self._key_fn = key_fn
+        self._label = label
+        n = max(1, int(shards))
+        per_shard = max(1, int(max_pending) // n)
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=per_shard) for _ in range(n)]
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def shards(self) -> int:
+        return len(self._queues)
+
+    @property
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def shard_of(self, item: Dict[str, Any]) -> int:
+        try:
+            key = self._key_fn(item) or ""
+        except Exception:
+            key = ""
+        # crc32 在进程间稳定，便于排查某个会话落在哪个分片
+        return zlib.crc32(key.encode("utf-8")) % len(self._queues)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        for i, queue in enumerate(self._queues):
+            self._workers.append(asyncio.create_task(self._worker(i, queue)))
+
+    async def put(self, item: Dict[str, Any], on_done: Optional[Callable[[], None]] = None) -> None:
+        """入队；on_done 在该项处理结束（无论成功与否）后调用。"""
+        self.start()
+        await self._queues[self.shard_of(item)].put((item, on_done))
+
+    async def join(self) -> None:
+        """等待已入队的任务全部处理完。"""
+        await asyncio.gather(*(q.join() for q in self._queues))
+
+    async def _worker(self, index: int, queue: asyncio.Queue) -> None:
+        while True:
+            item, on_done = await queue.get()
+            try:
+                await self._handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[wxhttp] {self._label}#{index} 处理失败: {e}")
+            finally:
+                queue.task_done()
+                if on_done is not None:
+                    on_done()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        if timeout:
+            try:
+                await asyncio.wait_for(self.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[wxhttp] {self._label} 关闭时仍有 {self.pending} 项未处理")
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+class IngestPipeline(ShardedExecutor):
+    """Sync 拉取与消息转换解耦的入站流水线。
+
+    Sync 循环只负责把原始 AddMsg 放入有界缓冲区；转换 worker 在后台完成媒体下载、
+    昵称解析并提交事件。消息按会话（群 id 或私聊 wxid）分片：不同会话并行转换，
+    同一会话按顺序到达 commit_event。缓冲区满时 put() 阻塞，对 Sync 形成背压。
+    """
+
+    def __init__(
+        self,
+        handler: RawMsgHandler,
+        key_fn: ShardKeyFn,
+        *,
+        workers: int = 4,
+        max_pending: int = 500,
+    ) -> None:
+        super().__init__(handler, key_fn, shards=workers, max_pending=max_pending, label="入站分片")
+
+    def start(self) -> None:
+        if not self._workers:
+            logger.info(
+                f"[wxhttp] 入站流水线启动（分片={self.shards}, 缓冲={sum(q.maxsize for q in self._queues)}）"
+            )
+        super().start()
+
+
+class AdaptivePollInterval:
+    """根据 Sync 返回的消息量调整下一次轮询的间隔。
+
+    - 有新消息：立即再次轮询（间隔 0），并把空闲间隔重置为下限；
+    - 连续空轮询：间隔按 backoff 倍数逐步放大，直到上限。
+    """
+
+    def __init__(
+        self,
+        *,
+        min_sec: float = 0.5,
+        max_sec: float = 5.0,
+        backoff: float = 1.5,
+    ) -> None:
+        self.min_sec = max(0.0, float(min_sec))
+        self.max_sec = max(self.min_sec, float(max_sec))
+        self.backoff = max(1.0, float(backoff))
+        self._idle_sec = self.min_sec
+
+    @property
+    def current_idle_sec(self) -> float:
+        return self._idle_sec
+
+    def next_delay(self, msg_count: int) -> float:
+        if msg_count > 0:
+            self._idle_sec = self.min_sec
+            return 0.0
+        delay = self._idle_sec
+        self._idle_sec = min(self.max_sec, max(self._idle_sec, 0.05) * self.backoff)
+        return delay
+
+
+BACKLOG_DROP = "drop"
+BACKLOG_HISTORY = "history"
+
+
+class BacklogGate:
+    """停机/故障恢复后的积压快进。
+
+    启动时以及 Sync 长时间故障后进入追赶状态：按 AddMsg 的 CreateTime 判断，
+    超过 max_age_sec 的旧消息交给调用方丢弃或轻量处理；一旦某批出现新鲜消息
+    （或 Sync 返回空批次，说明积压已清空），自动回到正常模式。正常模式下不做任何过滤，
+    因此处理慢的实时消息不会被误判为积压。
+
+    passthrough_types 中的消息（如群系统消息）即使过期也照常处理，但不算作“已追上”。
+    max_age_sec 默认 0，即关闭。
+    """
+
+    def __init__(
+        self,
+        *,
+        max_age_sec: float = 0.0,
+        mode: str = BACKLOG_HISTORY,
+        passthrough_types: Collection[int] = (),
+    ) -> None:
+        self.max_age_sec = max(0.0, float(max_age_sec))
+        self.mode = mode if mode in (BACKLOG_DROP, BACKLOG_HISTORY) else BACKLOG_HISTORY
+        self.passthrough_types = frozenset(passthrough_types)
+        self._active = self.enabled
+        self._backlog_seen = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_sec > 0
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def enter(self) -> None:
+        """Sync 故障后调用：恢复后的第一批消息重新按积压判断。"""
+        if self.enabled and not self._active:
+            self._active = True
+            self._backlog_seen = 0
+
+    @staticmethod
+    def _create_time(raw_msg: Dict[str, Any]) -> Optional[float]:
+        value = raw_msg.get("CreateTime")
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+        return None
+
+    def split(self, batch: List[Dict[str, Any]], now: float) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """返回 (正常处理的消息, 积压消息)。"""
+        if not self._active:
+            return batch, []
+        live: List[Dict[str, Any]] = []
+        backlog: List[Dict[str, Any]] = []
+        fresh = not batch
+        for raw_msg in batch:
+            created = self._create_time(raw_msg)
+            if created is None or now - created <= self.max_age_sec:
+                live.append(raw_msg)
+                fresh = True
+            elif raw_msg.get("MsgType") in self.passthrough_types:
+                live.append(raw_msg)
+            else:
+                backlog.append(raw_msg)
+        self._backlog_seen += len(backlog)
+        if fresh:
+            self._active = False
+            if self._backlog_seen:
+                action = "丢弃" if self.mode == BACKLOG_DROP else "作为历史轻量处理"
+                logger.info(
+                    f"[wxhttp] 积压追赶完成：{self._backlog_seen} 条超过 {self.max_age_sec:g}s 的旧消息已{action}"
+                )
+        return live, backlog
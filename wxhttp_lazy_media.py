@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from astrbot import logger
+from astrbot.api.message_components import Image, Record, Video
+from pydantic.v1 import PrivateAttr
+
+# 返回真正下载好的组件（Image/Record/Video），失败返回 None
+MediaLoader = Callable[[], Awaitable[Optional[Any]]]
+
+# 物化后从真实组件拷贝到懒加载组件上的字段
+_COPY_FIELDS = ("file", "url", "path")
+
+
+class MediaUnavailableError(RuntimeError):
+    """懒加载媒体下载失败。"""
+
+
+class _LoadState:
+    """懒加载的运行时状态，挂在组件的私有属性上（不进 .dict()/toDict()）。
+
+    拷贝（copy/deepcopy）时只带走加载器和已下载结果，不带走下载任务：
+    已下载的拷贝直接套用结果，未下载的拷贝各自重新下载。
+    """
+
+    __slots__ = ("loader", "label", "task", "built")
+
+    def __init__(self, loader: Optional[MediaLoader] = None, label: str = "", built: Any = None) -> None:
+        self.loader = loader
+        self.label = label
+        self.task: Optional[asyncio.Task] = None
+        self.built = built
+
+    def __copy__(self) -> "_LoadState":
+        return _LoadState(self.loader, self.label, self.built)
+
+    def __deepcopy__(self, memo: dict) -> "_LoadState":
+        return self.__copy__()
+
+    def __reduce__(self):
+        # 加载器一般是闭包，无法序列化；反序列化后只保留已下载结果
+        return (_LoadState, (None, self.label, self.built))
+
+
+class _LazyMediaMixin:
+    """懒加载媒体组件：只携带下载参数，首次被读取文件/URL/base64 时才真正下载。
+
+    组件本身是 pydantic 模型，加载状态放在子类声明的私有属性 _wx_state 里，
+    不参与 .dict()/toDict() 序列化，拷贝时也不会带上下载任务。
+    """
+
+    @classmethod
+    def deferred(cls, loader: MediaLoader, *, label: str = ""):
+        comp = cls(file="")
+        comp._wx_state = _LoadState(loader, label)
+        return comp
+
+    @property
+    def is_loaded(self) -> bool:
+        state: Optional[_LoadState] = self._wx_state
+        return state is None or state.built is not None
+
+    def prefetch(self) -> None:
+        """后台提前下载（用于明确发给机器人的消息）。"""
+        self._wx_start()
+
+    def _wx_start(self) -> asyncio.Task:
+        state: _LoadState = self._wx_state
+        task = state.task
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = asyncio.create_task(self._wx_load(state))
+            # 预取失败且无人读取时，避免 "exception was never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            state.task = task
+        return task
+
+    async def _wx_load(self, state: _LoadState) -> Any:
+        if state.loader is None:
+            raise MediaUnavailableError(f"media loader unavailable: {state.label}")
+        built = await state.loader()
+        if built is None:
+            raise MediaUnavailableError(f"media download failed: {state.label}")
+        state.built = built
+        self._wx_apply(built)
+        logger.debug(f"[wxhttp] 懒加载媒体已下载: {state.label}")
+        return built
+
+    def _wx_apply(self, built: Any) -> None:
+        for name in _COPY_FIELDS:
+            value = getattr(built, name, None)
+            if not value:
+                continue
+            try:
+                setattr(self, name, value)
+            except (AttributeError, ValueError):
+                # 该组件类型没有此字段（如部分版本的 Video 无 path）
+                pass
+
+    async def ensure_loaded(self) -> None:
+        state: Optional[_LoadState] = self._wx_state
+        if state is None:
+            return
+        if state.built is None:
+            # shield：某个读取方被取消时不打断共享的下载
+            await asyncio.shield(self._wx_start())
+        # 浅拷贝会共用同一份状态，下载结果要套用到当前这个实例上
+        self._wx_apply(state.built)
+
+
+class LazyImage(_LazyMediaMixin, Image):
+    _wx_state = PrivateAttr(default=None)
+
+    async def convert_to_file_path(self) -> str:
+        await self.ensure_loaded()
+        return await super().convert_to_file_path()
+
+    async def convert_to_base64(self) -> str:
+        await self.ensure_loaded()
+        return await super().convert_to_base64()
+
+    async def register_to_file_service(self) -> str:
+        await self.ensure_loaded()
+        return await super().register_to_file_service()
+
+
+class LazyRecord(_LazyMediaMixin, Record):
+    _wx_state = PrivateAttr(default=None)
+
+    async def convert_to_file_path(self) -> str:
+        await self.ensure_loaded()
+        return await super().convert_to_file_path()
+
+    async def convert_to_base64(self) -> str:
+        await self.ensure_loaded()
+        return await super().convert_to_base64()
+
+    async def register_to_file_service(self) -> str:
+        await self.ensure_loaded()
+        return await super().register_to_file_service()
+
+
+class LazyVideo(_LazyMediaMixin, Video):
+    _wx_state = PrivateAttr(default=None)
+
+    async def convert_to_file_path(self) -> str:
+        await self.ensure_loaded()
+        return await super().convert_to_file_path()
+
+    async def register_to_file_service(self) -> str:
+        await self.ensure_loaded()
+        return await super().register_to_file_service()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from astrbot import logger
+
+FetchFile = Callable[[], Awaitable[Optional[str]]]
+
+
+class MediaCache:
+    """按内容身份（md5 / CDN fileno+aeskey / MsgId）索引已下载的媒体文件。
+
+    - 命中：直接复用已落盘的文件，不再请求 wxhttp；
+    - 同一身份的并发请求只触发一次下载（single-flight），其余调用方等待同一结果；
+      任一调用方被取消都不会中断共享的下载；
+    - 一个文件可以挂多个 key，任一 key 命中即可。
+    """
+
+    def __init__(self, *, max_entries: int = 4096) -> None:
+        self._max_entries = max(16, int(max_entries))
+        self._paths: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def lookup(self, keys: Iterable[str]) -> Optional[str]:
+        for key in keys:
+            path = self._paths.get(key)
+            if path is None:
+                continue
+            if os.path.exists(path):
+                self._paths.move_to_end(key)
+                return path
+            # 文件已被清理：作废该条目
+            self._paths.pop(key, None)
+        return None
+
+    def put(self, keys: Iterable[str], path: str) -> None:
+        for key in keys:
+            self._paths[key] = path
+            self._paths.move_to_end(key)
+        while len(self._paths) > self._max_entries:
+            self._paths.popitem(last=False)
+
+    def forget_path(self, path: str) -> None:
+        for key in [k for k, p in self._paths.items() if p == path]:
+            self._paths.pop(key, None)
+
+    async def get_or_fetch(self, keys: List[str], fetch: FetchFile) -> Optional[str]:
+        """返回 keys 对应的文件路径；未命中时调用 fetch 下载并登记。"""
+        keys = [k for k in keys if k]
+        if not keys:
+            return await fetch()
+
+        path = self.lookup(keys)
+        if path is not None:
+            self.hits += 1
+            logger.debug(f"[wxhttp] 媒体缓存命中 {keys[0]} -> {path}")
+            return path
+
+        for key in keys:
+            task = self._inflight.get(key)
+            if task is not None:
+                self.shared += 1
+                logger.debug(f"[wxhttp] 媒体下载合并 {key}")
+                return await asyncio.shield(task)
+
+        self.misses += 1
+        # 下载放在独立任务里，所有调用方（包括发起者）都 shield 等待：
+        # 某个调用方被取消只影响它自己，下载继续完成，其余等待者照常拿到结果
+        task = asyncio.create_task(self._fetch_and_put(keys, fetch))
+        for key in keys:
+            self._inflight[key] = task
+        task.add_done_callback(lambda t: self._fetch_done(keys, t))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_put(self, keys: List[str], fetch: FetchFile) -> Optional[str]:
+        path = await fetch()
+        if path:
+            self.put(keys, path)
+        return path
+
+    def _fetch_done(self, keys: List[str], task: asyncio.Task) -> None:
+        for key in keys:
+            if self._inflight.get(key) is task:
+                self._inflight.pop(key, None)
+        # 所有等待者都已取消时，避免出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+from astrbot import logger
+
+from .wxhttp_download import RangeFileWriter
+
+
+class MediaStore:
+    """wxhttp_media 目录的容量与过期管理。
+
+    - root 只属于一个适配器实例（<wxhttp_media>/<机器人wxid>），扫描和回收都不越出 root；
+    - 索引记录每个文件的大小和最后访问时间，按 LRU 顺序维护；
+    - 索引持久化到 <root>/.index.json，启动时直接加载，不遍历整个目录树（仅在索引缺失时后台遍历一次重建）；
+    - 登记新文件后 save_delay_sec 内把索引落盘（合并同一时间窗内的多次登记），
+      进程崩溃时最多丢失这一小段；加载时再补扫索引保存之后的日期目录，找回这些文件；
+    - 后台定期回收：先删过期文件，再按 LRU 删到字节预算以内；文件删除与索引落盘都在线程池执行；
+    - 未完成的下载（*.part 及其 *.part.json 清单）可能正在被写入，不参与过期/LRU 回收，
+      只单独登记；文件与清单都超过 max_age_sec 未修改时才当作残片删除。
+    """
+
+    INDEX_FILE = ".index.json"
+    INDEX_PREFIX = ".index"
+    PARTIAL_SUFFIX = ".part"
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        max_age_sec: float = 7 * 86400,
+        gc_interval_sec: float = 600.0,
+        save_delay_sec: float = 5.0,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.save_delay_sec = max(0.0, float(save_delay_sec))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age_sec = max(0.0, float(max_age_sec))
+        self.gc_interval_sec = max(10.0, float(gc_interval_sec))
+        # 相对路径 -> (size, last_access)，最久未访问的在前
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        # 未完成下载的相对路径，不计入预算
+        self._partials: Set[str] = set()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._save_task: Optional[asyncio.Task] = None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def is_partial(cls, name: str) -> bool:
+        return name.endswith(cls.PARTIAL_SUFFIX) or name.endswith(RangeFileWriter.MANIFEST_SUFFIX)
+
+    def _rel(self, path: str) -> Optional[str]:
+        abs_path = os.path.abspath(path)
+        if not abs_path.startswith(self.root + os.sep):
+            return None
+        return os.path.relpath(abs_path, self.root)
+
+    def _set(self, rel: str, size: int, atime: float) -> None:
+        old = self._entries.pop(rel, None)
+        if old is not None:
+            self._total_bytes -= old[0]
+        self._entries[rel] = (size, atime)
+        self._total_bytes += size
+        self._dirty = True
+
+    def _drop(self, rel: str) -> None:
+        old = self._entries.pop(rel, None)
+        if old is not None:
+            self._total_bytes -= old[0]
+            self._dirty = True
+
+    def record(self, path: str, size: Optional[int] = None) -> None:
+        """登记新写入（或被覆盖）的文件。"""
+        rel = self._rel(path)
+        if rel is None:
+            return
+        if self.is_partial(rel):
+            if rel not in self._partials:
+                self._partials.add(rel)
+                self._dirty = True
+                self._schedule_save()
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        self._set(rel, int(size), time.time())
+        self._schedule_save()
+
+    def touch(self, path: str) -> None:
+        """文件被再次使用：刷新 LRU 位置。"""
+        rel = self._rel(path)
+        if rel is None:
+            return
+        entry = self._entries.get(rel)
+        if entry is None:
+            self.record(path)
+            return
+        self._set(rel, entry[0], time.time())
+
+    def forget(self, path: str) -> None:
+        rel = self._rel(path)
+        if rel is None:
+            return
+        if rel in self._partials:
+            self._partials.discard(rel)
+            self._dirty = True
+        self._drop(rel)
+
+    def _schedule_save(self) -> None:
+        """登记新文件后延迟落盘索引；已有待执行的保存时直接合并。"""
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_task = loop.create_task(self._delayed_save())
+
+    async def _delayed_save(self) -> None:
+        await asyncio.sleep(self.save_delay_sec)
+        await self.save()
+
+    # ---- 索引加载/保存 ----
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, self.INDEX_FILE)
+
+    def _load_index_sync(self) -> Optional[List[Tuple[str, int, float]]]:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[wxhttp] 媒体索引损坏，将重建: {e}")
+            return None
+        out: List[Tuple[str, int, float]] = []
+        for item in raw.get("entries") or []:
+            if isinstance(item, list) and len(item) == 3:
+                out.append((str(item[0]), int(item[1]), float(item[2])))
+        for rel in raw.get("partials") or []:
+            if isinstance(rel, str):
+                out.append((rel, 0, 0.0))
+        saved_at = raw.get("saved_at")
+        if isinstance(saved_at, (int, float)):
+            # 补扫索引保存之后写入的文件（上次未正常退出时它们不在索引里）
+            known = {rel for rel, _size, _atime in out}
+            for entry in self._scan_recent_sync(float(saved_at)):
+                if entry[0] not in known:
+                    out.append(entry)
+        return out
+
+    def _scan_recent_sync(self, since: float) -> List[Tuple[str, int, float]]:
+        """只遍历 <root>/<会话>/<YYYYMMDD> 中不早于 since 前一天的日期目录。"""
+        first_day = time.strftime("%Y%m%d", time.localtime(since - 86400))
+        out: List[Tuple[str, int, float]] = []
+        try:
+            origins = os.listdir(self.root)
+        except OSError:
+            return out
+        for origin in origins:
+            origin_dir = os.path.join(self.root, origin)
+            if origin.startswith(".") or not os.path.isdir(origin_dir):
+                continue
+            try:
+                days = os.listdir(origin_dir)
+            except OSError:
+                continue
+            for day in days:
+                if len(day) == 8 and day.isdigit() and day >= first_day:
+                    # 留出余量：文件先写盘、稍后才登记，可能早于索引保存时间
+                    out.extend(self._scan_sync(os.path.join(origin_dir, day), min_mtime=since - 60))
+        return out
+
+    def _scan_sync(self, top: Optional[str] = None, min_mtime: float = 0.0) -> List[Tuple[str, int, float]]:
+        out: List[Tuple[str, int, float]] = []
+        for dirpath, _dirnames, filenames in os.walk(top or self.root):
+            for name in filenames:
+                # 清单随 .part 一起处理，不单独登记
+                if name.startswith(self.INDEX_PREFIX) or name.endswith(RangeFileWriter.MANIFEST_SUFFIX):
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                if st.st_mtime < min_mtime:
+                    continue
+                out.append((os.path.relpath(full, self.root), st.st_size, st.st_mtime))
+        return out
+
+    def _save_index_sync(self, entries: List[Tuple[str, int, float]], partials: List[str]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": 1, "saved_at": time.time(), "entries": entries, "partials": partials},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, self._index_path())
+
+    async def load(self) -> None:
+        entries = await asyncio.to_thread(self._load_index_sync)
+        if entries is None:
+            logger.info(f"[wxhttp] 媒体索引不存在，后台扫描 {self.root} 重建")
+            entries = await asyncio.to_thread(self._scan_sync)
+            self._dirty = True
+        # 启动后新登记的文件优先于索引里的旧记录
+        existing = dict(self._entries)
+        self._entries.clear()
+        self._total_bytes = 0
+        for rel, size, atime in sorted(entries, key=lambda e: e[2]):
+            if self.is_partial(rel):
+                self._partials.add(rel)
+                continue
+            if rel not in existing:
+                self._entries[rel] = (size, atime)
+                self._total_bytes += size
+        for rel, (size, atime) in existing.items():
+            self._entries[rel] = (size, atime)
+            self._total_bytes += size
+        logger.info(
+            f"[wxhttp] 媒体存储: {len(self._entries)} 个文件, {self._total_bytes / 1048576:.1f} MB"
+            f"（预算 {self.max_bytes / 1048576:.0f} MB, 保留 {self.max_age_sec / 86400:g} 天）"
+        )
+
+    async def save(self) -> None:
+        if not self._dirty:
+            return
+        snapshot = [[rel, size, atime] for rel, (size, atime) in self._entries.items()]
+        partials = sorted(self._partials)
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._save_index_sync, snapshot, partials)
+        except Exception as e:
+            self._dirty = True
+            logger.debug(f"[wxhttp] 保存媒体索引失败: {e}")
+
+    # ---- 回收 ----
+
+    def _select_victims(self, now: float) -> List[str]:
+        victims: List[str] = []
+        total = self._total_bytes
+        for rel, (size, atime) in self._entries.items():
+            if self.is_partial(rel):
+                continue
+            expired = self.max_age_sec > 0 and now - atime > self.max_age_sec
+            over_budget = self.max_bytes > 0 and total > self.max_bytes
+            if not expired and not over_budget:
+                # 有序字典按访问时间递增，后面的只会更新、更小概率过期
+                break
+            victims.append(rel)
+            total -= size
+        return victims
+
+    def _stale_partials_sync(self, rels: List[str], now: float) -> List[str]:
+        """找出 .part 与清单都超过 max_age_sec 未修改的残片；文件已不存在的也一并返回。"""
+        stale: List[str] = []
+        for rel in rels:
+            full = os.path.join(self.root, rel)
+            mtimes = []
+            for p in (full, full + RangeFileWriter.MANIFEST_SUFFIX):
+                try:
+                    mtimes.append(os.stat(p).st_mtime)
+                except OSError:
+                    pass
+            if not mtimes or now - max(mtimes) > self.max_age_sec:
+                stale.append(rel)
+        return stale
+
+    def _delete_sync(self, rels: List[str]) -> List[str]:
+        removed: List[str] = []
+        dirs = set()
+        for rel in rels:
+            full = os.path.join(self.root, rel)
+            paths = [full]
+            if self.is_partial(rel):
+                paths.append(full + RangeFileWriter.MANIFEST_SUFFIX)
+            for p in paths:
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.debug(f"[wxhttp] 删除媒体文件失败 {p}: {e}")
+                    break
+            else:
+                removed.append(rel)
+                dirs.add(os.path.dirname(full))
+        # 顺手清理空的 <origin>/<YYYYMMDD>/<类型> 目录
+        for d in sorted(dirs, key=len, reverse=True):
+            while d.startswith(self.root + os.sep):
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    break
+                d = os.path.dirname(d)
+        return removed
+
+    async def compact(self) -> int:
+        """执行一次回收，返回删除的文件数。"""
+        victims = self._select_victims(time.time())
+        if victims:
+            removed = await asyncio.to_thread(self._delete_sync, victims)
+            freed = 0
+            for rel in removed:
+                entry = self._entries.get(rel)
+                if entry is not None:
+                    freed += entry[0]
+                    self._drop(rel)
+            self.evicted_files += len(removed)
+            self.evicted_bytes += freed
+            logger.info(
+                f"[wxhttp] 媒体回收: 删除 {len(removed)} 个文件, 释放 {freed / 1048576:.1f} MB, "
+                f"当前 {self._total_bytes / 1048576:.1f} MB"
+            )
+        if self._partials and self.max_age_sec > 0:
+            stale = await asyncio.to_thread(self._stale_partials_sync, sorted(self._partials), time.time())
+            if stale:
+                removed = await asyncio.to_thread(self._delete_sync, stale)
+                for rel in removed:
+                    self.forget(os.path.join(self.root, rel))
+                logger.info(f"[wxhttp] 媒体回收: 清理 {len(removed)} 个长期未完成的下载残片")
+        await self.save()
+        return len(victims)
+
+    async def _gc_loop(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            logger.warning(f"[wxhttp] 加载媒体索引失败: {e}")
+        while True:
+            try:
+                await self.compact()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[wxhttp] 媒体回收异常: {e}")
+            await asyncio.sleep(self.gc_interval_sec)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._gc_loop())
+
+    async def close(self) -> None:
+        for task in (self._task, self._save_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._save_task = None
+        await self.save()
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from astrbot import logger
+
+if TYPE_CHECKING:
+    from .wxhttp_member_store import MemberStore
+
+# chatroom_id -> {wxid -> nickname}；失败或无数据返回 None
+FetchMembers = Callable[[str], Awaitable[Optional[Mapping]]]
+
+
+class MemberTable(Mapping):
+    """紧凑的只读 wxid -> nickname 表。
+
+    两个按 wxid 排序的元组 + 二分查找，代替每个群一个 dict（省去哈希表的稀疏槽位）；
+    昵称与 wxid 相同（全量拉取时的占位）时只存 None。
+    """
+
+    __slots__ = ("_ids", "_names", "nbytes")
+
+    def __init__(self, members: Mapping) -> None:
+        ids = tuple(sorted(members))
+        names = tuple(None if members[k] == k else members[k] for k in ids)
+        self._ids: Tuple[str, ...] = ids
+        self._names: Tuple[Optional[str], ...] = names
+        size = sys.getsizeof(ids) + sys.getsizeof(names)
+        for wxid in ids:
+            size += sys.getsizeof(wxid)
+        for name in names:
+            if name is not None:
+                size += sys.getsizeof(name)
+        self.nbytes = size
+
+    def _index(self, wxid: Any) -> int:
+        if not isinstance(wxid, str):
+            return -1
+        i = bisect_left(self._ids, wxid)
+        if i < len(self._ids) and self._ids[i] == wxid:
+            return i
+        return -1
+
+    def __getitem__(self, wxid: str) -> str:
+        i = self._index(wxid)
+        if i < 0:
+            raise KeyError(wxid)
+        name = self._names[i]
+        return wxid if name is None else name
+
+    def get(self, wxid: str, default: Any = None) -> Any:
+        # 热路径：绕过 Mapping.get 的 try/except 开销
+        i = self._index(wxid)
+        if i < 0:
+            return default
+        name = self._names[i]
+        return wxid if name is None else name
+
+    def __contains__(self, wxid: object) -> bool:
+        return self._index(wxid) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __repr__(self) -> str:
+        return f"MemberTable({len(self._ids)} members, {self.nbytes} B)"
+
+
+class ChatroomMemberCache:
+    """群成员昵称缓存。
+
+    - single-flight：同一群的并发刷新只发一次 GetChatRoomMemberDetail；
+    - stale-while-revalidate：过期条目继续返回旧数据，同时在后台刷新；
+    - 负缓存：拉取失败后 negative_ttl_sec 内不再重试，直接返回旧数据或空；
+    - 可选持久化：首次用到某个群时先从 MemberStore 预热，刷新结果异步写回；
+    - 有界：按群数与估算字节数做 LRU 淘汰（被淘汰的群下次用到时可从 MemberStore 重新预热）。
+    """
+
+    def __init__(
+        self,
+        fetch: FetchMembers,
+        *,
+        ttl_sec: float = 600.0,
+        negative_ttl_sec: float = 60.0,
+        store: Optional["MemberStore"] = None,
+        max_groups: int = 500,
+        max_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self._fetch = fetch
+        self.ttl_sec = float(ttl_sec)
+        self.negative_ttl_sec = max(0.0, float(negative_ttl_sec))
+        self.max_groups = max(0, int(max_groups))
+        self.max_bytes = max(0, int(max_bytes))
+        # 最近使用的在末尾
+        self._members: "OrderedDict[str, MemberTable]" = OrderedDict()
+        self._total_bytes = 0
+        self._fetched_at: Dict[str, float] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._store = store
+        self._store_checked: Set[str] = set()
+        self._warming: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, chatroom_id: str) -> bool:
+        return chatroom_id in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "groups": len(self._members),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def peek(self, chatroom_id: str) -> Optional[MemberTable]:
+        """只读当前缓存，不触发任何请求，也不影响 LRU 顺序。"""
+        return self._members.get(chatroom_id)
+
+    def peek_nickname(self, chatroom_id: str, wxid: str) -> str:
+        return (self._members.get(chatroom_id) or {}).get(wxid, "")
+
+    def _is_stale(self, chatroom_id: str, now: float) -> bool:
+        if self.ttl_sec <= 0:
+            return False
+        return now - self._fetched_at.get(chatroom_id, 0.0) >= self.ttl_sec
+
+    def _in_negative_window(self, chatroom_id: str, now: float) -> bool:
+        failed = self._failed_at.get(chatroom_id)
+        return failed is not None and now - failed < self.negative_ttl_sec
+
+    def _put(self, chatroom_id: str, table: MemberTable) -> None:
+        old = self._members.pop(chatroom_id, None)
+        if old is not None:
+            self._total_bytes -= old.nbytes
+        self._members[chatroom_id] = table
+        self._total_bytes += table.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        # 至少保留刚写入的那个群
+        while len(self._members) > 1 and (
+            (self.max_groups and len(self._members) > self.max_groups)
+            or (self.max_bytes and self._total_bytes > self.max_bytes)
+        ):
+            cid, table = self._members.popitem(last=False)
+            self._total_bytes -= table.nbytes
+            self._fetched_at.pop(cid, None)
+            # 允许下次用到时从 MemberStore 重新预热
+            self._store_checked.discard(cid)
+            self.evictions += 1
+
+    def _prune_failures(self) -> None:
+        if len(self._failed_at) <= max(self.max_groups, 64):
+            return
+        now = time.monotonic()
+        for cid in [c for c, t in self._failed_at.items() if now - t >= self.negative_ttl_sec]:
+            self._failed_at.pop(cid, None)
+
+    def set_members(self, chatroom_id: str, members: Mapping, fetched_at: Optional[float] = None) -> None:
+        table = members if isinstance(members, MemberTable) else MemberTable(members)
+        self._fetched_at[chatroom_id] = time.monotonic() if fetched_at is None else fetched_at
+        self._failed_at.pop(chatroom_id, None)
+        self._put(chatroom_id, table)
+
+    def invalidate(self, chatroom_id: str) -> None:
+        """标记过期：下次读取时后台刷新（旧数据仍可用）。"""
+        if chatroom_id in self._fetched_at:
+            self._fetched_at[chatroom_id] = 0.0
+
+    def apply_delta(
+        self,
+        chatroom_id: str,
+        *,
+        added: Optional[Dict[str, str]] = None,
+        removed: Iterable[str] = (),
+        renamed: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """按群系统消息增量更新成员表（不改变 TTL 计时）。该群尚未缓存时忽略，返回是否有改动。"""
+        current = self._members.get(chatroom_id)
+        if current is None:
+            return False
+        before = dict(current)
+        members = dict(before)
+        for wxid in removed:
+            members.pop(wxid, None)
+        for wxid, nickname in (added or {}).items():
+            # 与全量拉取一致：无昵称时用 wxid 占位
+            members[wxid] = nickname or members.get(wxid) or wxid
+        for wxid, nickname in (renamed or {}).items():
+            if wxid in members and nickname:
+                members[wxid] = nickname
+        if members == before:
+            return False
+        self._put(chatroom_id, MemberTable(members))
+        if self._store is not None:
+            age = max(0.0, time.monotonic() - self._fetched_at.get(chatroom_id, 0.0))
+            self._store.save(chatroom_id, members, fetched_at=time.time() - age)
+        return True
+
+    async def _do_refresh(self, chatroom_id: str) -> Optional[MemberTable]:
+        try:
+            members = await self._fetch(chatroom_id)
+        except Exception as e:
+            logger.debug(f"[wxhttp] refresh chatroom members failed {chatroom_id}: {e}")
+            members = None
+        if members:
+            table = MemberTable(members)
+            self.set_members(chatroom_id, table)
+            if self._store is not None:
+                self._store.save(chatroom_id, dict(members))
+            return table
+        self._failed_at[chatroom_id] = time.monotonic()
+        self._prune_failures()
+        return None
+
+    def refresh(self, chatroom_id: str) -> asyncio.Task:
+        """发起（或复用进行中的）刷新任务。"""
+        task = self._inflight.get(chatroom_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._do_refresh(chatroom_id))
+            self._inflight[chatroom_id] = task
+            task.add_done_callback(
+                lambda t, cid=chatroom_id: self._inflight.pop(cid, None)
+                if self._inflight.get(cid) is t
+                else None
+            )
+        return task
+
+    async def _warm_from_store(self, chatroom_id: str) -> None:
+        assert self._store is not None
+        loaded = await self._store.load(chatroom_id)
+        self._store_checked.add(chatroom_id)
+        if loaded is None or chatroom_id in self._members:
+            return
+        members, fetched_wall = loaded
+        # 墙钟时间换算为本进程的 monotonic，TTL 判断照常生效
+        age = max(0.0, time.time() - fetched_wall)
+        self.set_members(chatroom_id, members, fetched_at=time.monotonic() - age)
+        logger.debug(f"[wxhttp] 群成员缓存从本地预热 {chatroom_id}: {len(members)} 人, {age:.0f}s 前")
+
+    async def get(self, chatroom_id: str) -> Mapping:
+        if (
+            self._store is not None
+            and chatroom_id not in self._members
+            and chatroom_id not in self._store_checked
+        ):
+            task = self._warming.get(chatroom_id)
+            if task is None:
+                task = asyncio.create_task(self._warm_from_store(chatroom_id))
+                self._warming[chatroom_id] = task
+                task.add_done_callback(lambda _t, cid=chatroom_id: self._warming.pop(cid, None))
+            await asyncio.shield(task)
+
+        now = time.monotonic()
+        members = self._members.get(chatroom_id)
+        if members is not None:
+            self.hits += 1
+            self._members.move_to_end(chatroom_id)
+            if self._is_stale(chatroom_id, now) and not self._in_negative_window(chatroom_id, now):
+                # 过期：先返回旧数据，后台刷新
+                self.refresh(chatroom_id)
+            return members
+
+        self.misses += 1
+        if self._in_negative_window(chatroom_id, now):
+            return {}
+        # shield：调用方被取消时不打断共享的刷新
+        return await asyncio.shield(self.refresh(chatroom_id)) or {}
+
+    async def get_nickname(self, chatroom_id: str, wxid: str) -> str:
+        return (await self.get(chatroom_id)).get(wxid, "")
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from astrbot import logger
+
+
+class MemberStore:
+    """群成员昵称的本地 SQLite 持久化，用于重启后预热 ChatroomMemberCache。
+
+    - 读取按群懒加载（首次用到某个群时才查库）；
+    - 写入为 write-behind：save() 只登记到内存，后台任务批量落盘；
+    - 所有 SQLite 操作在线程池执行，不阻塞事件循环。
+    时间戳使用墙钟时间（time.time()），跨进程仍有意义。
+    """
+
+    def __init__(self, path: str, *, flush_interval_sec: float = 5.0) -> None:
+        self.path = path
+        self.flush_interval_sec = max(0.5, float(flush_interval_sec))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, Tuple[Dict[str, str], float]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chatroom_members ("
+                " chatroom_id TEXT PRIMARY KEY,"
+                " members TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _load_sync(self, chatroom_id: str) -> Optional[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT members, fetched_at FROM chatroom_members WHERE chatroom_id = ?",
+                (chatroom_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            members = json.loads(row[0])
+        except ValueError:
+            return None
+        if not isinstance(members, dict) or not members:
+            return None
+        return {str(k): str(v) for k, v in members.items()}, float(row[1])
+
+    def _write_sync(self, batch: Dict[str, Tuple[Dict[str, str], float]]) -> None:
+        rows = [
+            (cid, json.dumps(members, ensure_ascii=False, separators=(",", ":")), fetched_at)
+            for cid, (members, fetched_at) in batch.items()
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO chatroom_members (chatroom_id, members, fetched_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(chatroom_id) DO UPDATE SET members = excluded.members, fetched_at = excluded.fetched_at",
+                rows,
+            )
+            conn.commit()
+
+    async def load(self, chatroom_id: str) -> Optional[Tuple[Dict[str, str], float]]:
+        """返回 (members, fetched_at_wall) 或 None。尚未落盘的写入优先。"""
+        pending = self._pending.get(chatroom_id)
+        if pending is not None:
+            return dict(pending[0]), pending[1]
+        try:
+            return await asyncio.to_thread(self._load_sync, chatroom_id)
+        except Exception as e:
+            logger.debug(f"[wxhttp] load chatroom members from store failed {chatroom_id}: {e}")
+            return None
+
+    def save(self, chatroom_id: str, members: Dict[str, str], fetched_at: Optional[float] = None) -> None:
+        self._pending[chatroom_id] = (dict(members), time.time() if fetched_at is None else fetched_at)
+        self._start()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _start(self) -> None:
+        if self._task is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._write_sync, batch)
+        except Exception as e:
+            logger.warning(f"[wxhttp] 群成员缓存落盘失败: {e}")
+            # 失败的批次放回，新写入优先
+            for cid, value in batch.items():
+                self._pending.setdefault(cid, value)
+
+    async def _flush_loop(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # 合并短时间内的多次写入
+            await asyncio.sleep(self.flush_interval_sec)
+            await self.flush()
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Optional, Pattern, Tuple
+
+# WeChat @ 昵称后通常跟空格/特殊空格（\u00A0/\u2005 等）
+_AT_TRAILING_SPACE = r"[\s\u00A0\u2005\u2006\u2009]*"
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class MentionMatcher:
+    """机器人在某个群里的 @ 匹配器：昵称对应的正则只编译一次。"""
+
+    __slots__ = ("nickname", "token", "_mention_re")
+
+    def __init__(self, nickname: str) -> None:
+        self.nickname = nickname
+        self.token = f"@{nickname}"
+        self._mention_re: Pattern[str] = re.compile("@" + re.escape(nickname) + _AT_TRAILING_SPACE)
+
+    def detect_and_clean(self, text: str) -> Tuple[bool, str]:
+        """返回 (文本里是否 @ 了机器人, 去掉所有 @昵称 并压缩空白后的文本)。"""
+        if self.token not in text:
+            return False, text
+        cleaned = self._mention_re.sub("", text)
+        return True, _WHITESPACE_RE.sub(" ", cleaned).strip()
+
+
+class MentionMatcherCache:
+    """chatroom_id -> MentionMatcher。
+
+    只有机器人在该群的昵称变化时才重建（调用方传入当前昵称，不一致即失效），
+    按群数做 LRU 上限。
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self._max_entries = max(16, int(max_entries))
+        self._matchers: "OrderedDict[str, MentionMatcher]" = OrderedDict()
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return len(self._matchers)
+
+    def get(self, chatroom_id: str, nickname: str) -> Optional[MentionMatcher]:
+        if not nickname:
+            self._matchers.pop(chatroom_id, None)
+            return None
+        matcher = self._matchers.get(chatroom_id)
+        if matcher is not None and matcher.nickname == nickname:
+            self._matchers.move_to_end(chatroom_id)
+            return matcher
+        matcher = MentionMatcher(nickname)
+        self.rebuilds += 1
+        self._matchers[chatroom_id] = matcher
+        self._matchers.move_to_end(chatroom_id)
+        while len(self._matchers) > self._max_entries:
+            self._matchers.popitem(last=False)
+        return matcher
+
+    def invalidate(self, chatroom_id: str) -> None:
+        self._matchers.pop(chatroom_id, None)
+
+
+# 客户端插入的 @昵称 以 \u2005（四分之一空格）结尾，可据此切出完整昵称（昵称本身可能含普通空格）
+_MENTION_TOKEN_RE = re.compile(r"@([^@\u2005]+)\u2005")
+
+
+class SelfNicknameIndex:
+    """机器人在各群里被 @ 时使用的昵称。
+
+    来源优先级：
+    1. 实际观察到的 @：<atuserlist> 只包含机器人、正文里恰好一个 @昵称 时记下该昵称
+       （这是群昵称优先的显示名，比成员列表里的 NickName 更准确）；
+    2. 成员缓存里已有的机器人条目（只读，不为此拉取成员列表）。
+    """
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self._max_entries = max(16, int(max_entries))
+        # chatroom_id -> 观察到的昵称
+        self._observed: "OrderedDict[str, str]" = OrderedDict()
+        self.learned = 0
+
+    def __len__(self) -> int:
+        return len(self._observed)
+
+    def get(self, chatroom_id: str) -> str:
+        return self._observed.get(chatroom_id, "")
+
+    def learn_from_mention(self, chatroom_id: str, text: str, at_wxids: list, self_wxid: str) -> str:
+        """从一条 @ 了机器人的消息里学习昵称，返回学到的昵称（无法确定时返回空）。"""
+        if not chatroom_id or at_wxids != [self_wxid]:
+            return ""
+        tokens = _MENTION_TOKEN_RE.findall(text or "")
+        if len(tokens) != 1:
+            return ""
+        nickname = tokens[0].strip()
+        if not nickname:
+            return ""
+        if self._observed.get(chatroom_id) != nickname:
+            self.learned += 1
+        self._observed[chatroom_id] = nickname
+        self._observed.move_to_end(chatroom_id)
+        while len(self._observed) > self._max_entries:
+            self._observed.popitem(last=False)
+        return nickname
+
+    def forget(self, chatroom_id: str) -> None:
+        self._observed.pop(chatroom_id, None)
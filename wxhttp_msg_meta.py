@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from defusedxml import ElementTree as eT
+
+_ATUSERLIST_OPEN = "<atuserlist>"
+_ATUSERLIST_CLOSE = "</atuserlist>"
+
+# MsgType -> 承载媒体参数的 XML 元素
+_MEDIA_TAGS = {
+    3: "img",
+    34: "voicemsg",
+    43: "videomsg",
+}
+
+
+def _positive_int(s: Optional[str]) -> Optional[int]:
+    if not s:
+        return None
+    try:
+        v = int(s)
+    except Exception:
+        return None
+    return v if v > 0 else None
+
+
+def _stripped(s: Optional[str]) -> Optional[str]:
+    if isinstance(s, str) and s.strip():
+        return s.strip()
+    return None
+
+
+def parse_atuserlist(msg_source: Optional[str]) -> List[str]:
+    """从 MsgSource 的 <atuserlist> 取出被 @ 的 wxid 列表。
+
+    注意：不同实现可能返回空列表、逗号分隔 wxid 或其它格式；这里做最宽松的拆分。
+    """
+    if not isinstance(msg_source, str) or not msg_source:
+        return []
+    # 等价于 re.search(r"<atuserlist>(.*?)</atuserlist>", re.S)，用 str.find 更快（每条群文本都要走一次）
+    start = msg_source.find(_ATUSERLIST_OPEN)
+    if start < 0:
+        return []
+    start += len(_ATUSERLIST_OPEN)
+    end = msg_source.find(_ATUSERLIST_CLOSE, start)
+    if end < 0:
+        return []
+    inner = msg_source[start:end].strip()
+    if not inner:
+        return []
+    # 常见是 wxid 用逗号分隔，也可能包含空白/换行；等价于按 [\s,]+ 拆分并去掉空段
+    return inner.replace(",", " ").split()
+
+
+class MessageMeta:
+    """一条消息的 Content / MsgSource 解码结果，每条消息只解析一次，供各组件构建函数共用。
+
+    只有与 msg_type 对应的字段会被填充，其余保持 None。
+    """
+
+    __slots__ = (
+        "msg_type",
+        "at_list",
+        "md5",
+        # 图片
+        "cdn_file_no",
+        "cdn_aes_key",
+        "img_len",
+        # 语音
+        "voice_bufid",
+        "voice_len",
+        # 视频
+        "video_len",
+        "video_raw_len",
+        "play_len",
+        "cdn_video_url",
+        "cdn_raw_video_url",
+    )
+
+    def __init__(self, msg_type: int) -> None:
+        self.msg_type = msg_type
+        self.at_list: List[str] = []
+        self.md5: Optional[str] = None
+        self.cdn_file_no: Optional[str] = None
+        self.cdn_aes_key: Optional[str] = None
+        self.img_len: Optional[int] = None
+        self.voice_bufid: Optional[str] = None
+        self.voice_len: Optional[int] = None
+        self.video_len: Optional[int] = None
+        self.video_raw_len: Optional[int] = None
+        self.play_len: Optional[int] = None
+        self.cdn_video_url: Optional[str] = None
+        self.cdn_raw_video_url: Optional[str] = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name) not in (None, [])
+        )
+        return f"MessageMeta({fields})"
+
+    def _fill_img(self, img) -> None:
+        # 尽量取高清长度
+        for attr in ("hdlength", "totalLen", "length", "len"):
+            v = _positive_int(img.get(attr))
+            if v:
+                self.img_len = v
+                break
+
+        # CdnDownloadImage 参数：FileAesKey 取 aeskey；FileNo 优先取 cdnbigimgurl/cdnmidimgurl/cdnthumburl
+        # - 若是 http(s) URL：取倒数第二段
+        # - 否则：直接使用该字段字符串（很多实现就是一个长 ID）
+        self.cdn_aes_key = _stripped(img.get("aeskey") or img.get("cdnthumbaeskey"))
+        raw = _stripped(img.get("cdnbigimgurl") or img.get("cdnmidimgurl") or img.get("cdnthumburl"))
+        if raw is None:
+            return
+        if raw.startswith("http://") or raw.startswith("https://"):
+            parts = [p for p in raw.split("/") if p]
+            self.cdn_file_no = parts[-2] if len(parts) >= 2 else None
+        else:
+            self.cdn_file_no = raw
+
+    def _fill_voice(self, voicemsg) -> None:
+        self.voice_bufid = voicemsg.get("bufid") or None
+        self.voice_len = _positive_int(voicemsg.get("length"))
+
+    def _fill_video(self, videomsg) -> None:
+        self.video_len = _positive_int(videomsg.get("length"))
+        self.cdn_video_url = _stripped(videomsg.get("cdnvideourl"))
+        self.play_len = _positive_int(videomsg.get("playlength"))
+        self.video_raw_len = _positive_int(videomsg.get("rawlength"))
+        self.cdn_raw_video_url = _stripped(videomsg.get("cdnrawvideourl"))
+
+
+# 非媒体且没有 @ 列表的消息（最常见的文本）共用一个只读的空结果，不再逐条构建
+_EMPTY_METAS: Dict[int, MessageMeta] = {}
+
+
+def _empty_meta(msg_type: int) -> MessageMeta:
+    meta = _EMPTY_METAS.get(msg_type)
+    if meta is None:
+        meta = _EMPTY_METAS[msg_type] = MessageMeta(msg_type)
+    return meta
+
+
+def decode_message_meta(msg_type: int, content: str, msg_source: Optional[str] = None) -> MessageMeta:
+    """解析媒体 XML（一次 fromstring）与 MsgSource 的 atuserlist。content 为去掉群前缀后的正文。
+
+    返回值只读：非媒体且没有 @ 的消息返回共享实例。
+    """
+    tag = _MEDIA_TAGS.get(msg_type)
+    if tag is None:
+        at_list = parse_atuserlist(msg_source) if msg_source else None
+        if not at_list:
+            return _empty_meta(msg_type)
+        meta = MessageMeta(msg_type)
+        meta.at_list = at_list
+        return meta
+
+    meta = MessageMeta(msg_type)
+    if msg_source:
+        meta.at_list = parse_atuserlist(msg_source)
+    if not content:
+        return meta
+    try:
+        root = eT.fromstring(content)
+    except Exception:
+        return meta
+    node = root if root.tag == tag else root.find(f".//{tag}")
+    if node is None:
+        return meta
+
+    md5 = node.get("md5")
+    if isinstance(md5, str) and md5.strip():
+        meta.md5 = md5.strip().lower()
+    if msg_type == 3:
+        meta._fill_img(node)
+    elif msg_type == 34:
+        meta._fill_voice(node)
+    else:
+        meta._fill_video(node)
+    return meta
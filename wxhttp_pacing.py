@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from astrbot import logger
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量。
+
+    reserve() 允许令牌透支，返回需要等待的秒数，这样并发调用方按到达顺序依次排开。
+    """
+
+    __slots__ = ("rate", "burst", "_tokens", "_last")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self._last:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self._tokens -= 1.0
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self._tokens >= self.burst
+
+
+class SessionPacer:
+    """按会话（to_wxid）限速的发送节奏控制。
+
+    - 每个会话一个令牌桶 + 可选随机抖动，同一会话内的发送按顺序排开；
+    - 全局令牌桶作为总量上限；
+    - 不同会话之间互不等待，可以并行发送。
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = 0.0,
+        burst: float = 1.0,
+        global_rate: float = 0.0,
+        global_burst: float = 1.0,
+        jitter: Tuple[float, float] = (0.0, 0.0),
+        max_sessions: int = 2048,
+    ) -> None:
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._global = TokenBucket(global_rate, global_burst)
+        self._jitter_min, self._jitter_max = jitter
+        self._max_sessions = max(16, int(max_sessions))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate > 0 or self._global.rate > 0 or self._jitter_max > 0
+
+    def describe(self) -> str:
+        return (
+            f"会话 {self._rate:g}/s burst={self._burst:g}, "
+            f"全局 {self._global.rate:g}/s burst={self._global.burst:g}, "
+            f"抖动 {self._jitter_min:g}-{self._jitter_max:g}s"
+        )
+
+    def _prune(self) -> None:
+        # 只回收空闲（桶已满、无人持锁）的会话，避免长期运行时字典无限增长
+        if len(self._buckets) <= self._max_sessions:
+            return
+        now = time.monotonic()
+        for key in list(self._buckets):
+            lock = self._locks.get(key)
+            if (lock is None or not lock.locked()) and self._buckets[key].is_full(now):
+                self._buckets.pop(key, None)
+                self._locks.pop(key, None)
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        """等待直到可以向 key 会话发送下一条消息，并在发送完成前占住该会话。
+
+        同一会话的消息因此严格按顺序发出；不同会话互不影响。
+        """
+        if not self.enabled:
+            yield
+            return
+        lock = self._locks.get(key)
+        if lock is None:
+            self._prune()
+            lock = self._locks[key] = asyncio.Lock()
+            self._buckets[key] = TokenBucket(self._rate, self._burst)
+
+        async with lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self._rate, self._burst)
+            wait = bucket.reserve()
+            if self._jitter_max > 0:
+                wait += random.uniform(self._jitter_min, self._jitter_max)
+            if wait > 0:
+                logger.debug(f"[wxhttp] 会话 {key} 延时 {wait:.2f}s 后发送")
+                await asyncio.sleep(wait)
+
+            global_wait = self._global.reserve()
+            if global_wait > 0:
+                logger.debug(f"[wxhttp] 全局发送限速，延时 {global_wait:.2f}s")
+                await asyncio.sleep(global_wait)
+
+            yield
+
+
+# 响应 Message 中出现这些词（不区分大小写）且 Code/Success 表示失败时，视为服务端限流/风控
+DEFAULT_THROTTLE_KEYWORDS = ("频繁", "频率", "过快", "限流", "风控", "稍后再试", "too many", "rate limit", "frequent")
+
+
+class AdaptiveRateController:
+    """AIMD 自适应请求速率（请求/秒），代替手工调节的固定随机延时。
+
+    - 加性增：响应正常时每秒约增加 increase（每个正常响应加 increase / rate）；
+    - 乘性减：出现限流信号时速率乘以 decrease，冷却期（约一个请求间隔、至少 1 秒）内只减一次，
+      避免同一波在途请求的信号把速率一路压到底；
+    - 限流信号由调用方判定（响应 Code/Message、HTTP 429/5xx、超时），这里另外检测延迟突增：
+      某接口耗时超过其 EWMA 基线的 latency_spike 倍（且不少于 latency_floor_sec）；
+      耗时随请求大小变化的接口（媒体分片）由调用方传 latency_sec=None 跳过该检测；
+    - 速率始终在 [min_rate, max_rate] 内，通过令牌桶把请求按当前速率排开。
+    """
+
+    _LATENCY_ALPHA = 0.2
+    _LATENCY_WARMUP = 5
+
+    def __init__(
+        self,
+        *,
+        min_rate: float = 0.5,
+        max_rate: float = 10.0,
+        initial_rate: float = 2.0,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        latency_spike: float = 3.0,
+        latency_floor_sec: float = 1.0,
+        window_sec: float = 10.0,
+    ) -> None:
+        self.min_rate = max(0.01, float(min_rate))
+        self.max_rate = max(self.min_rate, float(max_rate))
+        self.increase = max(0.0, float(increase))
+        self.decrease = min(0.95, max(0.05, float(decrease)))
+        self.latency_spike = float(latency_spike)
+        self.latency_floor_sec = max(0.0, float(latency_floor_sec))
+        self.window_sec = max(1.0, float(window_sec))
+        self._bucket = TokenBucket(self._clamp(initial_rate), 1.0)
+        self._last_decrease = 0.0
+        self._backed_off = False
+        # api_name -> (耗时 EWMA, 样本数)
+        self._latency: Dict[str, Tuple[float, int]] = {}
+        # 窗口内完成请求的时间点，用于计算实际吞吐
+        self._done: Deque[float] = deque()
+        self._started = time.monotonic()
+        self.throttles = 0
+        self.last_signal = ""
+
+    def _clamp(self, rate: float) -> float:
+        return min(self.max_rate, max(self.min_rate, float(rate)))
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    def describe(self) -> str:
+        return (
+            f"{self.min_rate:g}-{self.max_rate:g}/s（当前 {self.rate:g}/s）, "
+            f"加性增 {self.increase:g}/s, 乘性减 x{self.decrease:g}"
+        )
+
+    def reserve(self) -> float:
+        """按当前速率预约一个请求名额，返回需要等待的秒数。"""
+        return self._bucket.reserve()
+
+    def _set_rate(self, rate: float, now: float) -> None:
+        # 先按旧速率结算已累积的令牌，再切换速率
+        self._bucket._refill(now)
+        self._bucket.rate = self._clamp(rate)
+
+    def _latency_signal(self, api_name: str, latency_sec: float) -> str:
+        if self.latency_spike <= 0 or latency_sec < 0:
+            return ""
+        ewma, samples = self._latency.get(api_name, (latency_sec, 0))
+        spiked = (
+            samples >= self._LATENCY_WARMUP
+            and latency_sec >= self.latency_floor_sec
+            and latency_sec > ewma * self.latency_spike
+        )
+        # 基线照常更新：服务整体变慢时基线随之抬高，不会一直判为突增
+        self._latency[api_name] = (ewma + (latency_sec - ewma) * self._LATENCY_ALPHA, samples + 1)
+        if spiked:
+            return f"{api_name} 耗时 {latency_sec:.2f}s（基线 {ewma:.2f}s）"
+        return ""
+
+    def observe(self, api_name: str, latency_sec: Optional[float], signal: str = "") -> None:
+        """记录一次请求结果。signal 非空表示调用方已判定为限流信号；latency_sec 为 None 时不做耗时突增检测。"""
+        now = time.monotonic()
+        self._done.append(now)
+        self._trim(now)
+        if not signal and latency_sec is not None:
+            signal = self._latency_signal(api_name, latency_sec)
+        if signal:
+            self._on_throttle(signal, now)
+            return
+        rate = self.rate
+        if rate < self.max_rate and self.increase > 0:
+            self._set_rate(rate + self.increase / max(rate, 1.0), now)
+            if self._backed_off and self.rate >= self.max_rate:
+                self._backed_off = False
+                logger.info(f"[wxhttp] 请求速率已恢复至上限 {self.max_rate:g}/s")
+
+    def _on_throttle(self, signal: str, now: float) -> None:
+        self.throttles += 1
+        self.last_signal = signal
+        cooldown = max(1.0, 1.0 / self.rate)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        old = self.rate
+        self._set_rate(old * self.decrease, now)
+        self._backed_off = True
+        logger.info(f"[wxhttp] 限流信号：{signal}，请求速率 {old:.2f} → {self.rate:.2f}/s")
+
+    def _trim(self, now: float) -> None:
+        done = self._done
+        while done and now - done[0] > self.window_sec:
+            done.popleft()
+
+    def throughput(self) -> float:
+        """最近 window_sec 内实际完成的请求数/秒。"""
+        now = time.monotonic()
+        self._trim(now)
+        span = min(self.window_sec, max(1.0, now - self._started))
+        return len(self._done) / span
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "rate": round(self.rate, 3),
+            "min_rate": self.min_rate,
+            "max_rate": self.max_rate,
+            "throughput": round(self.throughput(), 3),
+            "throttles": self.throttles,
+            "last_signal": self.last_signal,
+        }
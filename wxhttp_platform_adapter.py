@@ -2,12 +2,12 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import json
 import os
 import random
 import re
 import time
-from collections import deque
-from typing import Any, Deque, Dict, Optional, Set, Tuple
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 
 from astrbot import logger
 from astrbot.api.event import MessageChain
@@ -24,11 +24,31 @@ from astrbot.core.platform.astr_message_event import MessageSesion
 from astrbot.core.utils.astrbot_path import get_astrbot_data_path
 from astrbot.core.utils.tencent_record_helper import audio_to_tencent_silk_base64
 
-from defusedxml import ElementTree as eT
 import yaml
 
-from .wxhttp_client import WxHttpClient
+from .wxhttp_blacklist import NicknameBlacklist
+from .wxhttp_client import DEFAULT_LANES, WxHttpClient
+from .wxhttp_dedup import MessageDeduper, SyncCheckpoint
+from .wxhttp_download import (
+    BytesSink,
+    RangedDownloader,
+    RangeFileWriter,
+    SectionDownloadError,
+    SectionSizeRegistry,
+)
+from .wxhttp_scheduler import LaneConfig
 from .wxhttp_event import WxHttpMessageEvent
+from .wxhttp_group_events import GROUP_SYSTEM_MSG_TYPES, parse_group_system_message
+from .wxhttp_ingest import BACKLOG_HISTORY, AdaptivePollInterval, BacklogGate, IngestPipeline
+from .wxhttp_lazy_media import LazyImage, LazyRecord, LazyVideo
+from .wxhttp_media_cache import MediaCache
+from .wxhttp_media_store import MediaStore
+from .wxhttp_member_cache import ChatroomMemberCache
+from .wxhttp_member_store import MemberStore
+from .wxhttp_mention import MentionMatcherCache, SelfNicknameIndex
+from .wxhttp_msg_meta import MessageMeta, decode_message_meta
+from .wxhttp_pacing import DEFAULT_THROTTLE_KEYWORDS, AdaptiveRateController, SessionPacer
+from .wxhttp_retry import DEFAULT_RETRY_POLICIES, CircuitOpenError, RetryPolicy
 
 # 从 metadata.yaml 读取版本信息
 def _load_metadata():
@@ -45,6 +65,16 @@ _metadata = _load_metadata()
 ADAPTER_DISPLAY_NAME = "Webot 微信适配器（基于 wxhttp 协议）"
 LOGO_FILE = "logo.svg"
 
+# 积压消息（轻量历史模式）在原始 AddMsg 上的标记
+_BACKLOG_FLAG = "_wxhttp_backlog"
+
+# MsgType -> 懒加载媒体组件
+_LAZY_MEDIA_TYPES = {
+    3: LazyImage,
+    34: LazyRecord,
+    43: LazyVideo,
+}
+
 
 def _safe_get(d: Dict[str, Any], *path: str) -> Any:
     cur: Any = d
@@ -97,17 +127,58 @@ def _detect_image_ext(data: bytes) -> str:
         "wxid": "",
         "poll_interval_sec": 1.5,
         "use_client_synckey": False,
+        # 最近处理过的消息 id 持久化到 data/wxhttp_state/<wxid>/dedup.ring，重启后不会重复派发
+        "persist_dedup": True,
+        # 精确去重窗口大小（条）；dedup_bloom_capacity > 0 时再用 Bloom 过滤器记住更多 id（极低概率误判为重复）
+        "dedup_capacity": 3000,
+        "dedup_bloom_capacity": 0,
+
+        # 积压快进：启动或 Sync 连续失败 max_consecutive_errors 次恢复后，CreateTime 早于该秒数的旧消息不再完整处理；
+        # 追上实时消息后自动恢复。0 表示关闭（默认），可按需设为 600 等
+        # backlog_mode："history" 仍派发事件，但不下载媒体、不拉取昵称、不识别 @、不触发默认 LLM 回复，并在事件上标记 extra wxhttp_backlog=True；
+        # "drop" 直接丢弃。群系统消息（入群/移出）两种模式下都照常更新成员缓存
+        "backlog_max_age_sec": 0,
+        "backlog_mode": "history",
+
+        # 自适应轮询：有新消息时立即再次 Sync，空闲时间隔从下限逐步退避到上限（秒）
+        # 关闭后使用固定的 poll_interval_sec
+        "adaptive_poll": True,
+        "poll_interval_min_sec": 0.5,
+        "poll_interval_max_sec": 5.0,
 
         # API 请求延时范围（秒）
         # 格式："最小值,最大值"，例如 "0.5,2.0" 表示每次 API 请求前随机延时 0.5-2.0 秒
         # 用于防止请求过快触发风控。留空或 "0,0" 表示不延时。注意：消息同步接口不受此影响
         "api_request_delay_range": "",
 
+        # 自适应限速（AIMD）：开启后代替 api_request_delay_range，按服务端反馈自动调节请求速率
+        # 响应正常时每秒约提高 adaptive_rate_increase 次/秒；遇到限流信号（Code/Message 含“频繁”等、
+        # HTTP 429/5xx、超时、耗时突增到基线的 adaptive_rate_latency_spike 倍）时速率乘以 adaptive_rate_decrease
+        "adaptive_rate": False,
+        "adaptive_rate_min": 0.5,
+        "adaptive_rate_max": 10.0,
+        "adaptive_rate_initial": 2.0,
+        "adaptive_rate_increase": 0.5,
+        "adaptive_rate_decrease": 0.5,
+        "adaptive_rate_latency_spike": 3.0,
+        # 额外的限流关键词（逗号分隔），追加到内置列表
+        "adaptive_rate_throttle_keywords": "",
+
         # 消息发送延时范围（秒）
         # 格式："最小值,最大值"，例如 "3.5,6.5" 表示每条消息发送前随机延时 3.5-6.5 秒
         # 用于模拟真人回复速度，降低被识别为机器人的风险。留空或 "0,0" 表示不延时
+        # 未开启下面的发送限速时，与旧版一致只作用于 send_by_session；开启后按会话（to_wxid）作用于所有发送，
+        # 一个群的发送排队不会拖慢其它会话
         "send_delay_range": "",
 
+        # 按会话的发送限速（令牌桶）：每秒条数与突发条数；0 表示不限（默认），例如 0.5 / 2 表示每会话平均 2 秒一条、最多连发 2 条
+        "send_rate_per_session": 0,
+        "send_burst_per_session": 2,
+
+        # 全局发送限速上限（所有会话合计）；0 表示不限（默认），例如 5 / 10
+        "send_rate_global": 0,
+        "send_burst_global": 10,
+
         # 昵称黑名单（过滤消息，不回复）
         # - 私聊：默认屏蔽昵称包含“微信 / wx / wechat”的联系人
         # - 群聊：默认不启用（保持原有 @/主动触发逻辑）
@@ -127,9 +198,45 @@ def _detect_image_ext(data: bytes) -> str:
         "group_nickname_blacklist_regex": "",
 
         # 最大连续错误次数
-        # 连续轮询错误达到此次数后，适配器将自动停止运行（防止 wxhttp 服务异常时无限重试）
-        # 建议设置为 10-20
+        # 连续轮询错误达到此次数后记录一条错误告警，之后按指数退避继续重试（不再停止运行），
+        # 退避间隔上限为 poll_error_backoff_max_sec；wxhttp 恢复后自动继续收消息
         "max_consecutive_errors": 10,
+        "poll_error_backoff_max_sec": 60.0,
+
+        # 熔断：wxhttp 连续失败达到阈值后，所有请求直接失败 circuit_breaker_reset_sec 秒，
+        # 到时只放行一个探测请求，成功即恢复（失败则等待时间翻倍，最长 300 秒）。阈值 0 表示关闭
+        "circuit_breaker_failure_threshold": 5,
+        "circuit_breaker_reset_sec": 30.0,
+
+        # HTTP 传输方式
+        # "pool"：asyncio keep-alive 连接池（默认，复用 TCP 连接）；"urllib"：每次请求新建连接（兼容回退）
+        "http_transport": "pool",
+
+        # 连接池最大连接数（其中一个始终保留给 Sync）
+        "http_pool_size": 8,
+
+        # 图片/视频分片下载时同时在途的分片数（分片请求仍按 api_request_delay_range 依次发出）
+        "media_download_window": 4,
+
+        # 媒体文件容量管理：总大小上限（MB）与最长保留天数，超出后按最后访问时间（LRU）回收
+        "media_store_max_mb": 2048,
+        "media_store_max_age_days": 7,
+
+        # 懒加载媒体：图片/语音/视频只在插件或 Provider 首次读取时下载（群里未被 @ 的消息不再白白下载）
+        # 注意：直接读取组件 file 字段而不调用 convert_to_file_path() 的插件会拿到空值
+        "lazy_media_download": False,
+        # 懒加载模式下，私聊媒体（必然发给机器人）在后台预取
+        "lazy_media_prefetch_private": True,
+
+        # 群成员昵称持久化到 data/wxhttp_state/<wxid>/chatroom_members.sqlite3，重启后无需重新拉取
+        "persist_chatroom_member_cache": True,
+        # 群成员缓存上限：最多缓存的群数与估算内存（MB），超出后淘汰最久未用的群
+        "chatroom_member_cache_max_groups": 500,
+        "chatroom_member_cache_max_mb": 64,
+
+        # 入站消息转换分片数与缓冲区大小（Sync 只入队，下载/昵称解析在后台完成；同一会话保持顺序）
+        "ingest_workers": 4,
+        "ingest_queue_size": 500,
     },
 )
 class WxHttpPlatformAdapter(Platform):
@@ -163,13 +270,126 @@ class WxHttpPlatformAdapter(Platform):
             except Exception as e:
                 logger.warning(f"[webot] 解析 api_request_delay_range 失败: {e}")
         
+        http_transport = str(self.config.get("http_transport") or "pool").strip().lower()
+        if http_transport not in ("pool", "urllib"):
+            logger.warning(f"[webot] 未知 http_transport={http_transport!r}，使用 pool")
+            http_transport = "pool"
+
+        # 请求通道（send/media/meta）覆盖配置，例如 {"media": {"workers": 4, "apply_delay": false}}
+        lanes: Dict[str, LaneConfig] = {}
+        lanes_cfg = self.config.get("request_lanes") or {}
+        if isinstance(lanes_cfg, dict):
+            for lane_name, lane_value in lanes_cfg.items():
+                if lane_name not in DEFAULT_LANES or not isinstance(lane_value, dict):
+                    logger.warning(f"[webot] 忽略无效的 request_lanes.{lane_name}")
+                    continue
+                try:
+                    lanes[lane_name] = LaneConfig.from_dict(lane_value, DEFAULT_LANES[lane_name])
+                except Exception as e:
+                    logger.warning(f"[webot] 解析 request_lanes.{lane_name} 失败: {e}")
+
+        # 按接口类别（sync/media/meta/send）覆盖重试策略，格式同 request_lanes
+        retry_policies: Dict[str, RetryPolicy] = {}
+        retry_cfg = self.config.get("http_retry_policies") or {}
+        if isinstance(retry_cfg, dict):
+            for name, value in retry_cfg.items():
+                if name not in DEFAULT_RETRY_POLICIES or not isinstance(value, dict):
+                    logger.warning(f"[webot] 忽略无效的 http_retry_policies.{name}")
+                    continue
+                try:
+                    retry_policies[name] = RetryPolicy.from_dict(value, DEFAULT_RETRY_POLICIES[name])
+                except Exception as e:
+                    logger.warning(f"[webot] 解析 http_retry_policies.{name} 失败: {e}")
+
+        # 解析发送延时配置
+        self._send_delay_min = 0.0
+        self._send_delay_max = 0.0
+        delay_range = (self.config.get("send_delay_range") or "").strip()
+        if delay_range:
+            try:
+                parts = delay_range.split(",")
+                if len(parts) == 2:
+                    min_val = float(parts[0].strip())
+                    max_val = float(parts[1].strip())
+                    if min_val >= 0 and max_val >= min_val:
+                        self._send_delay_min = min_val
+                        self._send_delay_max = max_val
+                        logger.info(f"[webot] 消息发送延时: {self._send_delay_min}-{self._send_delay_max} 秒")
+            except Exception as e:
+                logger.warning(f"[webot] 解析 send_delay_range 失败: {e}")
+
+        # 按会话（to_wxid）的发送节奏：每个会话一个令牌桶 + send_delay_range 抖动，另有全局上限。
+        # 不同会话的发送互不等待。默认不限速；只配置 send_delay_range 时保持旧行为（见 send_by_session）
+        send_rate = float(self.config.get("send_rate_per_session", 0))
+        send_rate_global = float(self.config.get("send_rate_global", 0))
+        pacing = send_rate > 0 or send_rate_global > 0
+        self._send_pacer = SessionPacer(
+            rate=send_rate,
+            burst=float(self.config.get("send_burst_per_session", 2)),
+            global_rate=send_rate_global,
+            global_burst=float(self.config.get("send_burst_global", 10)),
+            jitter=(self._send_delay_min, self._send_delay_max) if pacing else (0.0, 0.0),
+        )
+        if self._send_pacer.enabled:
+            logger.info(f"[webot] 发送节奏控制: {self._send_pacer.describe()}")
+
+        rate_controller: Optional[AdaptiveRateController] = None
+        if bool(self.config.get("adaptive_rate", False)):
+            rate_controller = AdaptiveRateController(
+                min_rate=float(self.config.get("adaptive_rate_min", 0.5)),
+                max_rate=float(self.config.get("adaptive_rate_max", 10.0)),
+                initial_rate=float(self.config.get("adaptive_rate_initial", 2.0)),
+                increase=float(self.config.get("adaptive_rate_increase", 0.5)),
+                decrease=float(self.config.get("adaptive_rate_decrease", 0.5)),
+                latency_spike=float(self.config.get("adaptive_rate_latency_spike", 3.0)),
+            )
+            logger.info(f"[webot] 自适应限速: {rate_controller.describe()}")
+            if api_delay_max > 0:
+                logger.info("[webot] 已开启自适应限速，api_request_delay_range 不再生效")
+        throttle_keywords = tuple(DEFAULT_THROTTLE_KEYWORDS) + tuple(
+            self._normalize_blacklist_keywords(self.config.get("adaptive_rate_throttle_keywords"))
+        )
+
         self._client = WxHttpClient(
             base_url=base_url,
             request_delay_min=api_delay_min,
             request_delay_max=api_delay_max,
+            transport=http_transport,
+            pool_max_connections=int(self.config.get("http_pool_size", 8)),
+            lanes=lanes,
+            max_inflight=int(self.config.get("max_inflight_requests", 0)),
+            send_pacer=self._send_pacer,
+            retry_policies=retry_policies,
+            breaker_failure_threshold=int(self.config.get("circuit_breaker_failure_threshold", 5)),
+            breaker_reset_sec=float(self.config.get("circuit_breaker_reset_sec", 30.0)),
+            rate_controller=rate_controller,
+            throttle_keywords=throttle_keywords,
         )
 
         self._poll_interval_sec = float(self.config.get("poll_interval_sec", 1.5))
+        # 自适应轮询：有消息立即再拉，空闲时从下限逐步退避到上限；
+        # 关闭时退回固定 poll_interval_sec。出错后从 poll_interval_sec 开始指数退避。
+        self._adaptive_poll = bool(self.config.get("adaptive_poll", True))
+        self._poller = AdaptivePollInterval(
+            min_sec=float(self.config.get("poll_interval_min_sec", 0.5)),
+            max_sec=float(self.config.get("poll_interval_max_sec", 5.0)),
+        )
+
+        # 入站流水线：Sync 只负责入队，转换（下载/昵称解析）由后台 worker 完成；
+        # 按会话分片，同一会话内保持顺序
+        self._ingest = IngestPipeline(
+            self._process_raw_msg,
+            self._session_key_of_raw,
+            workers=int(self.config.get("ingest_workers", 4)),
+            max_pending=int(self.config.get("ingest_queue_size", 500)),
+        )
+        # 积压快进：启动或 Sync 长时间故障恢复后，超过该时长的旧消息不再完整处理（0 表示关闭）
+        self._backlog = BacklogGate(
+            max_age_sec=float(self.config.get("backlog_max_age_sec", 0)),
+            mode=str(self.config.get("backlog_mode", BACKLOG_HISTORY) or BACKLOG_HISTORY).strip().lower(),
+            # 群系统消息只更新成员缓存，丢弃会让成员表与实际不一致
+            passthrough_types=GROUP_SYSTEM_MSG_TYPES,
+        )
         self._use_client_synckey = bool(self.config.get("use_client_synckey", False))
         self._synckey: str = ""  # 客户端游标（可选模式）
 
@@ -181,50 +401,132 @@ class WxHttpPlatformAdapter(Platform):
             self.config.get("enable_group_member_cache", True)
         )
 
-        # 解析发送延时配置
-        self._send_delay_min = 0.0
-        self._send_delay_max = 0.0
-        delay_range = (self.config.get("send_delay_range") or "").strip()
-        if delay_range:
-            try:
-                parts = delay_range.split(",")
-                if len(parts) == 2:
-                    min_val = float(parts[0].strip())
-                    max_val = float(parts[1].strip())
-                    if min_val >= 0 and max_val >= min_val:
-                        self._send_delay_min = min_val
-                        self._send_delay_max = max_val
-                        logger.info(f"[webot] 消息发送延时: {self._send_delay_min}-{self._send_delay_max} 秒")
-            except Exception as e:
-                logger.warning(f"[webot] 解析 send_delay_range 失败: {e}")
+        # 图片/视频分片下载时同时在途的分片数
+        self._media_download_window = max(1, int(self.config.get("media_download_window", 4)))
+
+        # 懒加载媒体：默认关闭（部分插件直接读取组件的 file 字段）；
+        # 开启后仅在首次读取文件/URL 时下载，私聊消息可在后台预取
+        self._lazy_media_download = bool(self.config.get("lazy_media_download", False))
+        self._lazy_media_prefetch_private = bool(self.config.get("lazy_media_prefetch_private", True))
+
+        # 已下载媒体的内容缓存（md5 / CDN 身份 / MsgId -> 文件），并发同一内容只下载一次
+        self._media_cache = MediaCache(max_entries=int(self.config.get("media_cache_entries", 4096)))
+
+        # 媒体目录按机器人 wxid 分开：多个适配器实例各管各的文件，回收时互不误删
+        self._media_root = os.path.join(get_astrbot_data_path(), "temp", "wxhttp_media", _safe_path_part(self_wxid))
+
+        # 媒体目录容量管理：字节预算 + 最长保留时间，按最后访问 LRU 回收
+        self._media_store = MediaStore(
+            self._media_root,
+            max_bytes=int(float(self.config.get("media_store_max_mb", 2048)) * 1024 * 1024),
+            max_age_sec=float(self.config.get("media_store_max_age_days", 7)) * 86400,
+            gc_interval_sec=float(self.config.get("media_store_gc_interval_sec", 600)),
+        )
+
+        # 自适应分片大小：按 (媒体类型, base_url) 学习，结果落盘以便重启后沿用
+        self._section_sizes = SectionSizeRegistry(
+            initial={"image": 61440, "video": 65536},
+            min_size=int(self.config.get("media_section_min_len", 16384)),
+            max_size=int(self.config.get("media_section_max_len", 524288)),
+            target_latency_sec=float(self.config.get("media_section_target_latency_sec", 1.0)),
+        )
+        self._section_sizes_path = os.path.join(self._state_dir(), "section_sizes.json")
+        self._section_sizes_saved: Dict[str, Dict[str, int]] = {}
+        try:
+            with open(self._section_sizes_path, "r", encoding="utf-8") as f:
+                self._section_sizes_saved = json.load(f)
+            self._section_sizes.restore(self._section_sizes_saved)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"[wxhttp] load section sizes failed: {e}")
 
         self._chatroom_member_cache_ttl_sec = float(
             self.config.get("chatroom_member_cache_ttl_sec", 600)
         )
 
+        # 群成员昵称持久化（SQLite），重启后按群懒加载预热，避免部署后首批回复都要重新拉成员列表
+        self._member_store: Optional[MemberStore] = None
+        if bool(self.config.get("persist_chatroom_member_cache", True)):
+            self._member_store = MemberStore(os.path.join(self._state_dir(), "chatroom_members.sqlite3"))
+
         # chatroom_id -> {wxid -> nickname}
-        self._chatroom_member_cache: Dict[str, Dict[str, str]] = {}
-        self._chatroom_member_cache_at: Dict[str, float] = {}
+        # 并发刷新合并为一次请求；过期后先返回旧数据并后台刷新；失败后短时间内不再重试
+        # 按群数与估算内存做 LRU 淘汰
+        self._chatroom_member_cache = ChatroomMemberCache(
+            self._fetch_chatroom_members,
+            ttl_sec=self._chatroom_member_cache_ttl_sec,
+            negative_ttl_sec=float(self.config.get("chatroom_member_cache_negative_ttl_sec", 60)),
+            store=self._member_store,
+            max_groups=int(self.config.get("chatroom_member_cache_max_groups", 500)),
+            max_bytes=int(float(self.config.get("chatroom_member_cache_max_mb", 64)) * 1024 * 1024),
+        )
+
+        # chatroom_id -> 机器人 @昵称 匹配器
+        self._mention_matchers = MentionMatcherCache()
+        # chatroom_id -> 机器人被 @ 时的昵称（从 atuserlist + 正文学习）
+        self._self_nicknames = SelfNicknameIndex()
 
-        self._private_nickname_blacklist_keywords = self._normalize_blacklist_keywords(
-            self.config.get("private_nickname_blacklist_keywords"),
+        # 昵称黑名单在配置加载时编译（关键词自动机 + 预编译正则），匹配结果按昵称缓存
+        self._private_nickname_blacklist = NicknameBlacklist(
+            self._normalize_blacklist_keywords(self.config.get("private_nickname_blacklist_keywords")),
+            str(self.config.get("private_nickname_blacklist_regex") or ""),
+            label="private",
         )
-        self._private_nickname_blacklist_regex = str(
-            self.config.get("private_nickname_blacklist_regex") or "",
-        ).strip()
-        self._group_nickname_blacklist_keywords = self._normalize_blacklist_keywords(
-            self.config.get("group_nickname_blacklist_keywords"),
+        self._group_nickname_blacklist = NicknameBlacklist(
+            self._normalize_blacklist_keywords(self.config.get("group_nickname_blacklist_keywords")),
+            str(self.config.get("group_nickname_blacklist_regex") or ""),
+            label="group",
         )
-        self._group_nickname_blacklist_regex = str(
-            self.config.get("group_nickname_blacklist_regex") or "",
-        ).strip()
 
-        self._seen_ids: Set[int] = set()
-        self._seen_order: Deque[int] = deque(maxlen=3000)
+        # 消息去重：定长 id 环 + 开放寻址索引（持久化时为 mmap 文件，重启后不会把已处理的消息再次派发），
+        # 可选叠加 Bloom 过滤器覆盖更长的窗口
+        dedup_capacity = int(self.config.get("dedup_capacity", 3000))
+        dedup_bloom_capacity = int(self.config.get("dedup_bloom_capacity", 0))
+        dedup_path = (
+            os.path.join(self._state_dir(), "dedup.ring")
+            if bool(self.config.get("persist_dedup", True))
+            else None
+        )
+        try:
+            self._dedup = MessageDeduper(dedup_capacity, path=dedup_path, bloom_capacity=dedup_bloom_capacity)
+        except Exception as e:
+            logger.warning(f"[wxhttp] 打开持久化去重文件失败，回退到内存去重: {e}")
+            self._dedup = MessageDeduper(dedup_capacity, bloom_capacity=dedup_bloom_capacity)
+
+        # 客户端游标模式下，KeyBuf 在一批消息全部转换后才提交并原子落盘，重启从检查点继续
+        self._checkpoint: Optional[SyncCheckpoint] = None
+        if self._use_client_synckey:
+            self._checkpoint = SyncCheckpoint(os.path.join(self._state_dir(), "sync_checkpoint.json"))
+            self._synckey = self._checkpoint.load()
+            if self._synckey:
+                logger.info("[wxhttp] 从 Sync 检查点恢复客户端游标")
+            self._checkpoint.on_flush(self._dedup.flush)
         
-        # 连续错误计数器（用于检测 wxhttp 服务是否异常）
+        # 连续错误计数器（用于检测 wxhttp 服务是否异常）；出错后按指数退避重试，不会终止
         self._consecutive_errors = 0
         self._max_consecutive_errors = int(self.config.get("max_consecutive_errors", 10))
+        self._poll_error_backoff = RetryPolicy(
+            base_delay_sec=max(0.1, self._poll_interval_sec),
+            max_delay_sec=max(self._poll_interval_sec, float(self.config.get("poll_error_backoff_max_sec", 60.0))),
+        )
+
+    def _state_dir(self) -> str:
+        """适配器的持久化状态目录：data/wxhttp_state/<wxid>/"""
+        path = os.path.join(get_astrbot_data_path(), "wxhttp_state", _safe_path_part(self._self_wxid))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    async def _save_section_sizes(self) -> None:
+        snapshot = self._section_sizes.snapshot()
+        if snapshot == self._section_sizes_saved:
+            return
+        self._section_sizes_saved = snapshot
+        data = json.dumps(snapshot, ensure_ascii=False).encode("utf-8")
+        try:
+            await asyncio.to_thread(self._write_bytes, self._section_sizes_path, data)
+        except Exception as e:
+            logger.debug(f"[wxhttp] save section sizes failed: {e}")
 
     @staticmethod
     def _normalize_blacklist_keywords(value: Any) -> list[str]:
@@ -247,31 +549,7 @@ class WxHttpPlatformAdapter(Platform):
                     out.append(s)
         return out
 
-    @staticmethod
-    def _match_nickname_blacklist(
-        nickname_or_id: str,
-        keywords: list[str],
-        regex: str,
-    ) -> bool:
-        if not nickname_or_id:
-            return False
-
-        haystack = nickname_or_id.casefold()
-        for kw in keywords:
-            if kw and kw.casefold() in haystack:
-                return True
-
-        if regex:
-            try:
-                return re.search(regex, nickname_or_id, flags=re.IGNORECASE) is not None
-            except re.error as e:
-                logger.warning(f"[wxhttp] invalid blacklist regex={regex!r}: {e}")
-        return False
-
-    async def _refresh_chatroom_member_cache(self, chatroom_id: str) -> None:
-        if not self._enable_group_member_cache:
-            return
-
+    async def _fetch_chatroom_members(self, chatroom_id: str) -> Optional[Dict[str, str]]:
         resp = await self._client.get_chatroom_member_detail(
             qid=chatroom_id,
             wxid=self._self_wxid,
@@ -280,7 +558,7 @@ class WxHttpPlatformAdapter(Platform):
         new_data = data.get("NewChatroomData") or {}
         members = new_data.get("ChatRoomMember") or []
         if not isinstance(members, list):
-            return
+            return None
 
         m: Dict[str, str] = {}
         for item in members:
@@ -294,76 +572,52 @@ class WxHttpPlatformAdapter(Platform):
                 else:
                     m.setdefault(wxid, wxid)
 
-        if m:
-            self._chatroom_member_cache[chatroom_id] = m
-            self._chatroom_member_cache_at[chatroom_id] = time.monotonic()
+        return m or None
 
-    async def _ensure_chatroom_member_cache(self, chatroom_id: str) -> None:
+    def _apply_group_system_msg(self, raw_msg: Dict[str, Any]) -> None:
+        from_user = _safe_get(raw_msg, "FromUserName", "string")
+        if not isinstance(from_user, str) or not from_user.endswith("@chatroom"):
+            return
         if not self._enable_group_member_cache:
             return
-
-        now = time.monotonic()
-        last = self._chatroom_member_cache_at.get(chatroom_id, 0.0)
-        if chatroom_id not in self._chatroom_member_cache:
-            await self._refresh_chatroom_member_cache(chatroom_id)
+        # 群内系统消息可能带 "chatroom_id:\n" 前缀，解析器会直接定位 <sysmsg>
+        content = _safe_get(raw_msg, "Content", "string") or ""
+        delta = parse_group_system_message(int(raw_msg.get("MsgType") or 0), content)
+        if delta is None or delta.is_empty:
             return
-        if self._chatroom_member_cache_ttl_sec <= 0:
+        if delta.invalidate:
+            self._chatroom_member_cache.invalidate(from_user)
+            logger.debug(f"[wxhttp] 群成员变动（无 wxid），标记过期 {from_user}")
             return
-        if now - last >= self._chatroom_member_cache_ttl_sec:
-            await self._refresh_chatroom_member_cache(chatroom_id)
+        changed = self._chatroom_member_cache.apply_delta(
+            from_user,
+            added=delta.added,
+            removed=delta.removed,
+            renamed=delta.renamed,
+        )
+        if changed:
+            logger.debug(
+                f"[wxhttp] 群成员增量更新 {from_user}: +{len(delta.added)} -{len(delta.removed)} ~{len(delta.renamed)}"
+            )
 
     async def _get_chatroom_member_nickname(self, chatroom_id: str, wxid: str) -> str:
         if not chatroom_id or not wxid:
             return ""
-        await self._ensure_chatroom_member_cache(chatroom_id)
-        return (self._chatroom_member_cache.get(chatroom_id) or {}).get(wxid, "")
-
-    async def _get_self_nickname_in_chatroom(self, chatroom_id: str) -> str:
-        return await self._get_chatroom_member_nickname(chatroom_id, self._self_wxid)
-
-    @staticmethod
-    def _strip_at_prefix(text: str, nickname: str) -> str:
-        # WeChat @ 昵称后通常跟空格/特殊空格（\u00A0/\u2005 等）
-        if not nickname:
-            return text
-        pattern = r"^@" + re.escape(nickname) + r"[\s\u00A0\u2005\u2006\u2009]*"
-        return re.sub(pattern, "", text, count=1).strip()
-
-    @staticmethod
-    def _remove_at_mentions(text: str, nickname: str) -> str:
-        """移除文本中出现的 @昵称 片段（用于降噪，不影响唤醒标记）。"""
-        if not nickname:
-            return text
-        # 匹配 @昵称 后可能跟的空白
-        pattern = r"@" + re.escape(nickname) + r"[\s\u00A0\u2005\u2006\u2009]*"
-        cleaned = re.sub(pattern, "", text)
-        # 简单压缩多余空白
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
-        return cleaned
-
-    def _parse_atuserlist_by_msgsource(self, raw_msg: Dict[str, Any]) -> list[str]:
-        """从 MsgSource 的 <atuserlist> 判断是否 @ 了机器人。
-
-        注意：不同实现可能返回空列表、逗号分隔 wxid 或其它格式；这里做最宽松的包含判断。
-        """
-        msg_source = raw_msg.get("MsgSource")
-        if not isinstance(msg_source, str) or not msg_source:
-            return []
-        m = re.search(r"<atuserlist>(.*?)</atuserlist>", msg_source, flags=re.S)
-        if not m:
-            return []
-        inner = (m.group(1) or "").strip()
-        if not inner:
-            return []
-        # 常见是 wxid 用逗号分隔，也可能包含空白/换行
-        return [p.strip() for p in re.split(r"[\s,]+", inner) if p.strip()]
+        if not self._enable_group_member_cache:
+            return ""
+        return await self._chatroom_member_cache.get_nickname(chatroom_id, wxid)
 
-    def _is_at_self_by_msgsource(self, raw_msg: Dict[str, Any]) -> bool:
-        parts = self._parse_atuserlist_by_msgsource(raw_msg)
-        return bool(parts) and (str(self._self_wxid) in parts)
+    def _get_self_nickname_in_chatroom(self, chatroom_id: str) -> str:
+        """机器人在群里的昵称：优先用观察到的 @昵称，其次读成员缓存；不会为此拉取成员列表。"""
+        observed = self._self_nicknames.get(chatroom_id)
+        if observed:
+            return observed
+        if not self._enable_group_member_cache:
+            return ""
+        return self._chatroom_member_cache.peek_nickname(chatroom_id, self._self_wxid)
 
-    async def _detect_at_bot_and_clean_text(
-        self, *, chatroom_id: str, text: str, raw_msg: Dict[str, Any]
+    def _detect_at_bot_and_clean_text(
+        self, *, chatroom_id: str, text: str, at_wxids: list[str]
     ) -> tuple[bool, str]:
         if not self._enable_at_wake:
             return False, text
@@ -373,23 +627,20 @@ class WxHttpPlatformAdapter(Platform):
         # 1) 优先用 MsgSource atuserlist 判断（不依赖昵称）
         #    但 MsgSource 不一定可靠/不一定填，所以同时做文本昵称匹配。
         # atuserlist 若能提供 wxid 列表，这是最稳的判断方式。
-        is_at_by_source = self._is_at_self_by_msgsource(raw_msg)
+        is_at_by_source = str(self._self_wxid) in at_wxids
+        if is_at_by_source:
+            # 顺便学习机器人在该群的 @昵称，后续 atuserlist 缺失时也能按文本识别
+            self._self_nicknames.learn_from_mention(chatroom_id, text, at_wxids, str(self._self_wxid))
 
-        bot_nick = ""
-        try:
-            bot_nick = await self._get_self_nickname_in_chatroom(chatroom_id)
-        except Exception:
-            bot_nick = ""
+        bot_nick = self._get_self_nickname_in_chatroom(chatroom_id)
 
         is_at_by_text = False
         cleaned = text
-        if bot_nick:
-            token = f"@{bot_nick}"
-            if token in text:
-                is_at_by_text = True
-                # 去掉开头 @昵称，并清理正文里的重复 @昵称（降噪）
-                cleaned = self._strip_at_prefix(cleaned, bot_nick)
-                cleaned = self._remove_at_mentions(cleaned, bot_nick)
+        # 每群缓存编译好的 @昵称 正则，机器人群昵称变化时才重建
+        matcher = self._mention_matchers.get(chatroom_id, bot_nick)
+        if matcher is not None:
+            # 去掉 @昵称，并清理正文里的重复 @昵称（降噪）
+            is_at_by_text, cleaned = matcher.detect_and_clean(text)
 
         return (is_at_by_source or is_at_by_text), cleaned
 
@@ -403,11 +654,26 @@ class WxHttpPlatformAdapter(Platform):
             support_streaming_message=False,
         )
 
+    async def terminate(self):
+        await self._ingest.close(timeout=5.0)
+        if self._checkpoint is not None:
+            await self._checkpoint.close()
+        self._dedup.close()
+        await self._media_store.close()
+        if self._member_store is not None:
+            await self._member_store.close()
+        logger.info(f"[wxhttp] 群成员缓存统计: {self._chatroom_member_cache.stats()}")
+        rate_stats = self._client.rate_stats()
+        if rate_stats is not None:
+            logger.info(f"[wxhttp] 自适应限速统计: {rate_stats}")
+        await self._save_section_sizes()
+        await self._client.close()
+
     async def send_by_session(self, session: MessageSesion, message_chain: MessageChain):
         to_wxid = session.session_id
         for item in message_chain.chain:
-            # 发送消息前随机延时
-            if self._send_delay_max > 0:
+            # 开启发送限速后延时由 WxHttpClient 的 SessionPacer 按会话控制；否则保持旧行为，发送前随机延时
+            if not self._send_pacer.enabled and self._send_delay_max > 0:
                 delay = random.uniform(self._send_delay_min, self._send_delay_max)
                 logger.debug(f"[webot] 延时 {delay:.2f} 秒后发送消息")
                 await asyncio.sleep(delay)
@@ -451,43 +717,119 @@ class WxHttpPlatformAdapter(Platform):
 
     async def run(self):
         logger.info("wxhttp adapter started")
+        self._media_store.start()
         while True:
+            delay = self._poll_interval_sec
             try:
                 synckey = self._synckey if self._use_client_synckey else ""
                 resp = await self._client.sync(wxid=self._self_wxid, scene=0, synckey=synckey)
 
                 # 请求成功，重置错误计数器
+                if self._consecutive_errors >= self._max_consecutive_errors:
+                    logger.info(f"[webot] 轮询已恢复（此前连续 {self._consecutive_errors} 次异常）")
                 self._consecutive_errors = 0
 
                 data = resp.get("Data") or {}
                 keybuf = data.get("KeyBuf") or {}
+                kb = ""
                 if self._use_client_synckey:
                     kb = keybuf.get("buffer")
                     if isinstance(kb, str) and kb:
                         self._synckey = kb
+                    else:
+                        kb = ""
 
                 add_msgs = data.get("AddMsgs") or []
-                if isinstance(add_msgs, list):
-                    for raw_msg in add_msgs:
-                        abm = await self.convert_message(raw_msg)
-                        if abm is None:
-                            continue
-                        await self.handle_msg(abm)
+                batch = [m for m in add_msgs if isinstance(m, dict)] if isinstance(add_msgs, list) else []
+                msg_count = len(batch)
+                # 故障恢复后的积压：按 CreateTime 丢弃或标记为轻量历史
+                live, backlog = self._backlog.split(batch, time.time())
+                if backlog and self._backlog.mode == BACKLOG_HISTORY:
+                    for raw_msg in backlog:
+                        raw_msg[_BACKLOG_FLAG] = True
+                    live = batch
+                # 该批消息全部转换完成后才提交本次 KeyBuf
+                on_done = self._checkpoint.begin_batch(kb, len(live)) if self._checkpoint is not None else None
+                for raw_msg in live:
+                    await self._ingest.put(raw_msg, on_done)
+                if self._adaptive_poll:
+                    delay = self._poller.next_delay(msg_count)
             except Exception as e:
                 self._consecutive_errors += 1
-                logger.exception(f"[webot] 轮询异常 ({self._consecutive_errors}/{self._max_consecutive_errors}): {e}")
-                
-                if self._consecutive_errors >= self._max_consecutive_errors:
-                    logger.error(
-                        f"[webot] 连续 {self._max_consecutive_errors} 次轮询异常，插件终止运行。"
-                        f"请检查 wxhttp 服务是否正常运行，以及 base_url 配置是否正确。"
-                    )
-                    break
+                # 只有真正的故障（连续失败到阈值或熔断打开）才在恢复后重新检查积压；
+                # 单次超时由重试与熔断处理，不影响消息
+                if self._consecutive_errors >= self._max_consecutive_errors or isinstance(e, CircuitOpenError):
+                    self._backlog.enter()
+                # 指数退避（带抖动）；熔断打开时至少等到下一次探测
+                delay = max(self._poll_interval_sec, self._poll_error_backoff.backoff(self._consecutive_errors))
+                if isinstance(e, CircuitOpenError):
+                    delay = max(delay, e.retry_after)
+                    logger.warning(f"[webot] 轮询暂停：{e}")
+                elif self._consecutive_errors < self._max_consecutive_errors:
+                    logger.exception(f"[webot] 轮询异常 ({self._consecutive_errors}/{self._max_consecutive_errors}): {e}")
+                else:
+                    if self._consecutive_errors == self._max_consecutive_errors:
+                        logger.error(
+                            f"[webot] 连续 {self._max_consecutive_errors} 次轮询异常，转为退避重试（最长间隔 "
+                            f"{self._poll_error_backoff.max_delay_sec:.0f}s）。"
+                            f"请检查 wxhttp 服务是否正常运行，以及 base_url 配置是否正确。"
+                        )
+                    logger.warning(f"[webot] 轮询异常 ({self._consecutive_errors} 次)，{delay:.1f}s 后重试: {e}")
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _session_key_of_raw(raw_msg: Dict[str, Any]) -> str:
+        """原始 AddMsg 所属会话：群消息为 chatroom id，私聊为对方 wxid（即 FromUserName）。"""
+        from_user = _safe_get(raw_msg, "FromUserName", "string")
+        return from_user if isinstance(from_user, str) else ""
+
+    def _media_loader(
+        self,
+        *,
+        msg_type: int,
+        raw_msg: Dict[str, Any],
+        from_user: str,
+        to_user: str,
+        new_msg_id: int | None,
+        meta: MessageMeta,
+    ) -> Callable[[], Awaitable[Any]] | None:
+        """返回下载该条媒体消息的协程工厂；非媒体类型返回 None。"""
+        if msg_type == 3:
+            return lambda: self._try_build_image_component(
+                raw_msg=raw_msg,
+                from_user=from_user,
+                to_user=to_user,
+                meta=meta,
+            )
+        if msg_type == 34:
+            return lambda: self._try_build_record_component(
+                raw_msg=raw_msg,
+                from_user=from_user,
+                new_msg_id=new_msg_id,
+                meta=meta,
+            )
+        if msg_type == 43:
+            return lambda: self._try_build_video_component(
+                raw_msg=raw_msg,
+                from_user=from_user,
+                meta=meta,
+            )
+        return None
 
-            await asyncio.sleep(self._poll_interval_sec)
+    async def _process_raw_msg(self, raw_msg: Dict[str, Any]) -> None:
+        abm = await self.convert_message(raw_msg)
+        if abm is None:
+            return
+        await self.handle_msg(abm)
 
     async def convert_message(self, raw_msg: Dict[str, Any]) -> Optional[AstrBotMessage]:
         msg_type = raw_msg.get("MsgType")
+        if msg_type in GROUP_SYSTEM_MSG_TYPES:
+            # 群系统消息（入群/移出等）不派发事件，只增量更新成员缓存
+            self._apply_group_system_msg(raw_msg)
+            return None
         # 先做到“能识别类型”，发送侧后续再逐步补齐。
         supported_types = {1, 3, 34, 43, 47, 49}
         if msg_type not in supported_types:
@@ -501,16 +843,8 @@ class WxHttpPlatformAdapter(Platform):
         elif isinstance(msg_id, int):
             dedup_id = msg_id
 
-        if dedup_id is not None:
-            if dedup_id in self._seen_ids:
-                return None
-            self._seen_ids.add(dedup_id)
-            self._seen_order.append(dedup_id)
-            if len(self._seen_order) == self._seen_order.maxlen:
-                # 淘汰旧的
-                while len(self._seen_ids) > self._seen_order.maxlen:
-                    old = self._seen_order.popleft()
-                    self._seen_ids.discard(old)
+        if dedup_id is not None and not self._dedup.add(dedup_id):
+            return None
 
         from_user = _safe_get(raw_msg, "FromUserName", "string")
         to_user = _safe_get(raw_msg, "ToUserName", "string")
@@ -544,6 +878,11 @@ class WxHttpPlatformAdapter(Platform):
             if sender_id == self._self_wxid:
                 return None
 
+        # Content / MsgSource 在这里解析一次，下游组件构建与 @ 识别共用
+        msg_source = raw_msg.get("MsgSource") if (is_group and msg_type == 1) else None
+        meta = decode_message_meta(int(msg_type), payload_content, msg_source)
+
+        backlog = bool(raw_msg.get(_BACKLOG_FLAG))
         components: list[Any] = []
         placeholder_map = {
             3: "[图片]",
@@ -559,39 +898,40 @@ class WxHttpPlatformAdapter(Platform):
         else:
             message_str = placeholder_map.get(int(msg_type), f"[MsgType={msg_type}]")
 
-            if msg_type == 3:
-                img = await self._try_build_image_component(
-                    raw_msg=raw_msg,
-                    from_user=from_user,
-                    to_user=to_user,
-                    payload_content=payload_content,
-                )
-                if img is not None:
-                    components.append(img)
-            elif msg_type == 34:
-                rec = await self._try_build_record_component(
-                    raw_msg=raw_msg,
-                    from_user=from_user,
-                    new_msg_id=new_msg_id if isinstance(new_msg_id, int) else None,
-                    payload_content=payload_content,
-                )
-                if rec is not None:
-                    components.append(rec)
-            elif msg_type == 43:
-                vid = await self._try_build_video_component(
-                    raw_msg=raw_msg,
-                    from_user=from_user,
-                    payload_content=payload_content,
-                )
-                if vid is not None:
-                    components.append(vid)
+            # 积压历史消息只保留占位文本，不下载媒体
+            loader = None if backlog else self._media_loader(
+                msg_type=int(msg_type),
+                raw_msg=raw_msg,
+                from_user=from_user,
+                to_user=to_user,
+                new_msg_id=new_msg_id if isinstance(new_msg_id, int) else None,
+                meta=meta,
+            )
+            if loader is not None:
+                if self._lazy_media_download:
+                    # 懒加载：只携带下载参数，插件/Provider 首次读取文件或 URL 时才下载
+                    lazy_cls = _LAZY_MEDIA_TYPES[int(msg_type)]
+                    media = lazy_cls.deferred(loader, label=f"MsgType={msg_type} MsgId={msg_id}")
+                    if not is_group and self._lazy_media_prefetch_private:
+                        # 私聊消息一定是发给机器人的，提前在后台下载
+                        media.prefetch()
+                    components.append(media)
+                else:
+                    media = await loader()
+                    if media is not None:
+                        components.append(media)
 
         nickname = ""
         push = raw_msg.get("PushContent")
         if isinstance(push, str) and " : " in push:
             nickname = push.split(" : ", 1)[0].strip()
 
-        if is_group and group_id and sender_id:
+        if is_group and group_id and sender_id and backlog:
+            # 积压历史消息不为昵称拉取成员列表，只读已有缓存
+            resolved = self._chatroom_member_cache.peek_nickname(group_id, sender_id)
+            if resolved:
+                nickname = resolved
+        elif is_group and group_id and sender_id:
             try:
                 resolved = await self._get_chatroom_member_nickname(group_id, sender_id)
                 if resolved:
@@ -608,33 +948,26 @@ class WxHttpPlatformAdapter(Platform):
             else (sender_id or from_user or "")
         )
         if is_group:
-            if self._match_nickname_blacklist(
-                nickname_or_id,
-                self._group_nickname_blacklist_keywords,
-                self._group_nickname_blacklist_regex,
-            ):
+            if self._group_nickname_blacklist.matches(nickname_or_id):
                 logger.info(
                     f"[wxhttp] ignored group sender due to nickname blacklist: {nickname_or_id} ({sender_id})",
                 )
                 return None
         else:
-            if self._match_nickname_blacklist(
-                nickname_or_id,
-                self._private_nickname_blacklist_keywords,
-                self._private_nickname_blacklist_regex,
-            ):
+            if self._private_nickname_blacklist.matches(nickname_or_id):
                 logger.info(
                     f"[wxhttp] ignored private sender due to nickname blacklist: {nickname_or_id} ({sender_id})",
                 )
                 return None
 
         is_at_bot = False
-        if msg_type == 1 and is_group and group_id:
+        # 积压历史消息不再识别 @（不作为唤醒），只作为上下文
+        if msg_type == 1 and is_group and group_id and not backlog:
             try:
-                is_at_bot, message_str = await self._detect_at_bot_and_clean_text(
+                is_at_bot, message_str = self._detect_at_bot_and_clean_text(
                     chatroom_id=group_id,
                     text=message_str,
-                    raw_msg=raw_msg,
+                    at_wxids=meta.at_list,
                 )
             except Exception as e:
                 logger.debug(f"[wxhttp] detect @bot failed: {e}")
@@ -731,113 +1064,76 @@ class WxHttpPlatformAdapter(Platform):
 
         return None
 
-    @staticmethod
-    def _parse_int(s: str | None) -> int | None:
-        if not s:
-            return None
-        try:
-            return int(s)
-        except Exception:
-            return None
-
     @classmethod
-    def _parse_image_total_len_from_xml(cls, xml_text: str) -> int | None:
-        try:
-            root = eT.fromstring(xml_text)
-        except Exception:
-            return None
-        img = root.find(".//img")
-        if img is None:
-            return None
-        # 尽量取高清长度
-        for attr in ("hdlength", "totalLen", "length", "len"):
-            v = cls._parse_int(img.get(attr))
-            if v and v > 0:
-                return v
-        return None
+    def _decode_download_section(cls, resp: Dict[str, Any], *, api: str, msg_id: int, start: int) -> bytes:
+        """校验并解码单个下载分片，失败时抛出 RuntimeError。"""
+        if not cls._resp_ok(resp):
+            raise RuntimeError(f"{api} not ok msg_id={msg_id} start={start}: Code={resp.get('Code')}")
+
+        chunk_b64 = cls._extract_download_chunk_b64(resp)
+        if not chunk_b64:
+            # 兜底：保留旧路径解析，便于快速定位返回结构差异
+            chunk_b64 = cls._extract_base64_payload(resp)
+        if not chunk_b64:
+            raise RuntimeError(f"{api} missing chunk buffer msg_id={msg_id} start={start}")
 
-    @classmethod
-    def _parse_voice_meta_from_xml(cls, xml_text: str) -> tuple[str | None, int | None]:
         try:
-            root = eT.fromstring(xml_text)
-        except Exception:
-            return None, None
-        voicemsg = root.find(".//voicemsg")
-        if voicemsg is None:
-            return None, None
-        bufid = voicemsg.get("bufid")
-        length = cls._parse_int(voicemsg.get("length"))
-        return (bufid or None), (length if (length and length > 0) else None)
-
-    @classmethod
-    def _parse_video_meta_from_xml(
-        cls, xml_text: str
-    ) -> tuple[int | None, str | None, int | None, int | None, str | None]:
-        """解析视频消息 XML。
-
-        Returns:
-            (len_bytes, cdn_video_url, play_length_sec, raw_len_bytes, cdn_raw_video_url)
-        """
+            return base64.b64decode(chunk_b64, validate=False)
+        except Exception as e:
+            raise RuntimeError(f"{api} decode chunk base64 failed msg_id={msg_id} start={start}: {e}") from e
 
-        try:
-            root = eT.fromstring(xml_text)
-        except Exception:
-            return None, None, None, None, None
-        videomsg = root.find(".//videomsg")
-        if videomsg is None:
-            return None, None, None, None, None
-
-        total_len = cls._parse_int(videomsg.get("length"))
-        cdn_url = videomsg.get("cdnvideourl")
-        play_len = cls._parse_int(videomsg.get("playlength"))
-
-        raw_len = cls._parse_int(videomsg.get("rawlength"))
-        cdn_raw_url = videomsg.get("cdnrawvideourl")
-
-        return (
-            total_len if (total_len and total_len > 0) else None,
-            (cdn_url.strip() if isinstance(cdn_url, str) and cdn_url.strip() else None),
-            play_len if (play_len and play_len > 0) else None,
-            raw_len if (raw_len and raw_len > 0) else None,
-            (cdn_raw_url.strip() if isinstance(cdn_raw_url, str) and cdn_raw_url.strip() else None),
+    def _image_media_dir(self, from_user: str) -> str:
+        out_dir = os.path.join(
+            self._media_root,
+            _safe_path_part(from_user),
+            time.strftime("%Y%m%d"),
+            "images",
         )
+        os.makedirs(out_dir, exist_ok=True)
+        return out_dir
 
-    @classmethod
-    def _parse_cdn_image_params_from_xml(cls, xml_text: str) -> tuple[str | None, str | None]:
-        """从图片 XML 解析 CdnDownloadImage 所需参数。
-
-        FileAesKey: <img aeskey="...">
-        FileNo: 优先取 cdnbigimgurl/cdnmidimgurl/cdnthumburl。
-        - 若是 http(s) URL：取倒数第二段
-        - 否则：直接使用该字段字符串（很多实现就是一个长 ID）
-        """
+    async def _write_image_file(self, *, from_user: str, msg_id: int, image_bytes: bytes) -> str | None:
+        if not image_bytes:
+            return None
+        ext = _detect_image_ext(image_bytes)
+        file_path = os.path.join(self._image_media_dir(from_user), f"wxhttp_image_{msg_id}.{ext}")
+        try:
+            await asyncio.to_thread(self._write_bytes, file_path, image_bytes)
+        except Exception as e:
+            logger.debug(f"[wxhttp] write image file failed {file_path}: {e}")
+            return None
+        self._media_store.record(file_path, len(image_bytes))
+        return file_path
 
+    @staticmethod
+    async def _image_component_from_file(file_path: str) -> Image | None:
         try:
-            root = eT.fromstring(xml_text)
+            img = Image.fromFileSystem(file_path)
+            
+            # 尝试将图片转为公网 URL（给智谱等仅接受 URL 的 provider 使用）
+            # 如果 callback_api_base 未配置，则回退到本地路径（provider 会转 base64）
+            try:
+                public_url = await img.register_to_file_service()
+                logger.info(f"[webot] 图片已生成公网链接: {public_url}")
+                # 改用 URL 形式的 Image 组件，智谱等 provider 可以直接使用
+                return Image.fromURL(public_url, path=file_path)
+            except Exception as url_err:
+                logger.debug(f"[wxhttp] 无法生成图片公网 URL（{url_err}），将使用本地路径")
+                # 回退到本地路径（OpenAI 等支持 base64 的 provider 仍可用）
+                return img
         except Exception:
-            return None, None
-        img = root.find(".//img")
-        if img is None:
-            return None, None
-
-        aes_key = img.get("aeskey") or img.get("cdnthumbaeskey")
-        if isinstance(aes_key, str) and aes_key.strip():
-            aes_key = aes_key.strip()
-        else:
-            aes_key = None
-
-        raw = img.get("cdnbigimgurl") or img.get("cdnmidimgurl") or img.get("cdnthumburl")
-        if not isinstance(raw, str) or not raw.strip():
-            return None, aes_key
-        raw = raw.strip()
-
-        if raw.startswith("http://") or raw.startswith("https://"):
-            parts = [p for p in raw.split("/") if p]
-            file_no = parts[-2] if len(parts) >= 2 else None
-        else:
-            file_no = raw
+            return None
 
-        return file_no, aes_key
+    @staticmethod
+    def _image_cache_keys(meta: MessageMeta, msg_id: int) -> list[str]:
+        """图片的内容身份：XML md5 > CDN fileno+aeskey > MsgId。"""
+        keys: list[str] = []
+        if meta.md5:
+            keys.append(f"img:md5:{meta.md5}")
+        if meta.cdn_file_no and meta.cdn_aes_key:
+            keys.append(f"img:cdn:{meta.cdn_file_no}:{meta.cdn_aes_key}")
+        keys.append(f"img:msg:{msg_id}")
+        return keys
 
     async def _try_build_image_component(
         self,
@@ -845,49 +1141,54 @@ class WxHttpPlatformAdapter(Platform):
         raw_msg: Dict[str, Any],
         from_user: str,
         to_user: str,
-        payload_content: str,
+        meta: MessageMeta,
     ) -> Image | None:
         msg_id = raw_msg.get("MsgId")
         if not isinstance(msg_id, int):
             return None
 
-        def _media_dir() -> str:
-            temp_dir = os.path.join(get_astrbot_data_path(), "temp")
-            day = time.strftime("%Y%m%d")
-            origin = _safe_path_part(from_user)
-            out_dir = os.path.join(temp_dir, "wxhttp_media", origin, day, "images")
-            os.makedirs(out_dir, exist_ok=True)
-            return out_dir
+        # 原图走内容缓存：同一张图被转发到多个群、或同一 MsgId 重复投递时只下载一次
+        file_path = await self._media_cache.get_or_fetch(
+            self._image_cache_keys(meta, msg_id),
+            lambda: self._download_image_file(
+                msg_id=msg_id,
+                from_user=from_user,
+                meta=meta,
+            ),
+        )
+        if file_path:
+            self._media_store.touch(file_path)
+            built = await self._image_component_from_file(file_path)
+            if built is not None:
+                return built
 
-        async def _bytes_to_image_component(image_bytes: bytes) -> Image | None:
-            if not image_bytes:
-                return None
-            ext = _detect_image_ext(image_bytes)
-            file_path = os.path.join(_media_dir(), f"wxhttp_image_{msg_id}.{ext}")
+        # 3) 最后兜底：直接用 Sync 自带缩略图（ImgBuf.buffer），缩略图不进入内容缓存
+        thumb_b64 = _safe_get(raw_msg, "ImgBuf", "buffer")
+        if isinstance(thumb_b64, str) and thumb_b64.strip():
             try:
-                await asyncio.to_thread(self._write_bytes, file_path, image_bytes)
+                thumb_path = await self._write_image_file(
+                    from_user=from_user,
+                    msg_id=msg_id,
+                    image_bytes=base64.b64decode(thumb_b64.strip(), validate=False),
+                )
             except Exception as e:
-                logger.debug(f"[wxhttp] write image file failed {file_path}: {e}")
-                return None
-            try:
-                img = Image.fromFileSystem(file_path)
-                
-                # 尝试将图片转为公网 URL（给智谱等仅接受 URL 的 provider 使用）
-                # 如果 callback_api_base 未配置，则回退到本地路径（provider 会转 base64）
-                try:
-                    public_url = await img.register_to_file_service()
-                    logger.info(f"[webot] 图片已生成公网链接: {public_url}")
-                    # 改用 URL 形式的 Image 组件，智谱等 provider 可以直接使用
-                    return Image.fromURL(public_url, path=file_path)
-                except Exception as url_err:
-                    logger.debug(f"[wxhttp] 无法生成图片公网 URL（{url_err}），将使用本地路径")
-                    # 回退到本地路径（OpenAI 等支持 base64 的 provider 仍可用）
-                    return img
-            except Exception:
+                logger.debug(f"[wxhttp] decode ImgBuf thumbnail base64 failed msg_id={msg_id}: {e}")
                 return None
+            if thumb_path:
+                return await self._image_component_from_file(thumb_path)
+
+        return None
 
+    async def _download_image_file(
+        self,
+        *,
+        msg_id: int,
+        from_user: str,
+        meta: MessageMeta,
+    ) -> str | None:
+        """下载原图并落盘，返回文件路径；CDN 优先，失败再分片下载。"""
         # 1) 优先：CDN 下载（不依赖 total_len）
-        file_no, aes_key = self._parse_cdn_image_params_from_xml(payload_content)
+        file_no, aes_key = meta.cdn_file_no, meta.cdn_aes_key
         if file_no and aes_key:
             try:
                 cdn_resp = await self._client.cdn_download_image(
@@ -901,85 +1202,57 @@ class WxHttpPlatformAdapter(Platform):
                         img_b64 = data.get("Image")
                         if isinstance(img_b64, str) and img_b64.strip():
                             try:
-                                return await _bytes_to_image_component(
-                                    base64.b64decode(img_b64.strip(), validate=False),
+                                file_path = await self._write_image_file(
+                                    from_user=from_user,
+                                    msg_id=msg_id,
+                                    image_bytes=base64.b64decode(img_b64.strip(), validate=False),
                                 )
+                                if file_path:
+                                    return file_path
                             except Exception as e:
                                 logger.debug(f"[wxhttp] decode cdn image base64 failed msg_id={msg_id}: {e}")
             except Exception as e:
                 logger.debug(f"[wxhttp] cdn_download_image failed msg_id={msg_id}: {e}")
 
         # 2) 分片下载：需要能解析到 total_len
-        total_len = self._parse_image_total_len_from_xml(payload_content)
-        if total_len:
-            # 按下载指南：ToWxid 统一传消息来源（FromUserName）
-            to_wxid = from_user
-
-            chunk_size = 65536
-            total_len_i = int(total_len)
-            start_pos = 0
-            merged = bytearray()
-
-            while start_pos < total_len_i:
-                part_len = min(chunk_size, total_len_i - start_pos)
-                try:
-                    resp = await self._client.download_img(
-                        wxid=self._self_wxid,
-                        to_wxid=to_wxid,
-                        msg_id=msg_id,
-                        data_len=total_len_i,
-                        compress_type=0,
-                        section_start_pos=start_pos,
-                        section_data_len=part_len,
-                    )
-                except Exception as e:
-                    logger.debug(
-                        f"[wxhttp] download_img failed (ToWxid={to_wxid}) msg_id={msg_id} start={start_pos}: {e}",
-                    )
-                    break
-
-                if not self._resp_ok(resp):
-                    break
-
-                chunk_b64 = self._extract_download_chunk_b64(resp)
-                if not chunk_b64:
-                    # 兜底：保留旧路径解析，便于快速定位返回结构差异
-                    chunk_b64 = self._extract_base64_payload(resp)
-                if not chunk_b64:
-                    logger.debug(
-                        f"[wxhttp] download_img missing chunk buffer msg_id={msg_id} start={start_pos}",
-                    )
-                    break
-
-                try:
-                    merged.extend(base64.b64decode(chunk_b64, validate=False))
-                except Exception as e:
-                    logger.debug(
-                        f"[wxhttp] decode img chunk base64 failed msg_id={msg_id} start={start_pos}: {e}",
-                    )
-                    break
+        total_len = meta.img_len
+        if not total_len:
+            logger.debug(f"[wxhttp] image xml missing length, MsgId={msg_id}")
+            return None
 
-                start_pos += part_len
+        # 按下载指南：ToWxid 统一传消息来源（FromUserName）
+        to_wxid = from_user
+        total_len_i = int(total_len)
 
-            if merged:
-                built = await _bytes_to_image_component(bytes(merged))
-                if built is not None:
-                    return built
-        else:
-            logger.debug(f"[wxhttp] image xml missing length, MsgId={msg_id}")
+        async def fetch_image_section(start_pos: int, part_len: int) -> bytes:
+            resp = await self._client.download_img(
+                wxid=self._self_wxid,
+                to_wxid=to_wxid,
+                msg_id=msg_id,
+                data_len=total_len_i,
+                compress_type=0,
+                section_start_pos=start_pos,
+                section_data_len=part_len,
+            )
+            return self._decode_download_section(resp, api="download_img", msg_id=msg_id, start=start_pos)
 
-        # 3) 最后兜底：直接用 Sync 自带缩略图（ImgBuf.buffer）
-        thumb_b64 = _safe_get(raw_msg, "ImgBuf", "buffer")
-        if isinstance(thumb_b64, str) and thumb_b64.strip():
-            try:
-                return await _bytes_to_image_component(
-                    base64.b64decode(thumb_b64.strip(), validate=False),
-                )
-            except Exception as e:
-                logger.debug(f"[wxhttp] decode ImgBuf thumbnail base64 failed msg_id={msg_id}: {e}")
-                return None
+        sink = BytesSink(total_len_i)
+        try:
+            await RangedDownloader(
+                fetch_image_section,
+                total_len=total_len_i,
+                chunk_size=61440,
+                window=self._media_download_window,
+                label=f"image msg_id={msg_id}",
+                sizer=self._section_sizes.get("image", self._client.base_url),
+            ).run(sink)
+        except SectionDownloadError as e:
+            logger.debug(f"[wxhttp] download_img failed (ToWxid={to_wxid}) msg_id={msg_id}: {e}")
+            return None
+        finally:
+            await self._save_section_sizes()
 
-        return None
+        return await self._write_image_file(from_user=from_user, msg_id=msg_id, image_bytes=sink.getvalue())
 
     async def _try_build_record_component(
         self,
@@ -987,7 +1260,7 @@ class WxHttpPlatformAdapter(Platform):
         raw_msg: Dict[str, Any],
         from_user: str,
         new_msg_id: int | None,
-        payload_content: str,
+        meta: MessageMeta,
     ) -> Record | None:
         msg_id = raw_msg.get("MsgId")
         if not isinstance(msg_id, int):
@@ -999,9 +1272,7 @@ class WxHttpPlatformAdapter(Platform):
             try:
                 voice_bytes = base64.b64decode(img_buf_b64.strip(), validate=False)
                 temp_dir = os.path.join(
-                    get_astrbot_data_path(),
-                    "temp",
-                    "wxhttp_media",
+                    self._media_root,
                     _safe_path_part(from_user),
                     time.strftime("%Y%m%d"),
                     "records",
@@ -1009,11 +1280,12 @@ class WxHttpPlatformAdapter(Platform):
                 os.makedirs(temp_dir, exist_ok=True)
                 file_path = os.path.join(temp_dir, f"wxhttp_voice_{msg_id}.silk")
                 await asyncio.to_thread(self._write_bytes, file_path, voice_bytes)
+                self._media_store.record(file_path, len(voice_bytes))
                 return Record(file=file_path, url=file_path)
             except Exception as e:
                 logger.debug(f"[wxhttp] decode/write ImgBuf voice failed msg_id={msg_id}: {e}")
 
-        bufid, length = self._parse_voice_meta_from_xml(payload_content)
+        bufid, length = meta.voice_bufid, meta.voice_len
         if bufid == "0":
             bufid = None
         if not bufid and new_msg_id is not None:
@@ -1055,9 +1327,7 @@ class WxHttpPlatformAdapter(Platform):
             return None
 
         temp_dir = os.path.join(
-            get_astrbot_data_path(),
-            "temp",
-            "wxhttp_media",
+            self._media_root,
             _safe_path_part(from_user),
             time.strftime("%Y%m%d"),
             "records",
@@ -1071,6 +1341,7 @@ class WxHttpPlatformAdapter(Platform):
             logger.debug(f"[wxhttp] write voice file failed {file_path}: {e}")
             return None
 
+        self._media_store.record(file_path, len(voice_bytes))
         return Record(file=file_path, url=file_path)
 
     async def _try_build_video_component(
@@ -1078,13 +1349,18 @@ class WxHttpPlatformAdapter(Platform):
         *,
         raw_msg: Dict[str, Any],
         from_user: str,
-        payload_content: str,
+        meta: MessageMeta,
     ) -> Video | None:
         msg_id = raw_msg.get("MsgId")
         if not isinstance(msg_id, int):
             return None
 
-        total_len, cdn_url, _play_len, raw_len, cdn_raw_url = self._parse_video_meta_from_xml(payload_content)
+        total_len, cdn_url, raw_len, cdn_raw_url = (
+            meta.video_len,
+            meta.cdn_video_url,
+            meta.video_raw_len,
+            meta.cdn_raw_video_url,
+        )
 
         # 超大文件优先：如果 CDN 字段本身就是可直连 URL，直接交给 Video(URL)
         for candidate_url in (cdn_raw_url, cdn_url):
@@ -1100,9 +1376,7 @@ class WxHttpPlatformAdapter(Platform):
             return None
 
         temp_dir = os.path.join(
-            get_astrbot_data_path(),
-            "temp",
-            "wxhttp_media",
+            self._media_root,
             _safe_path_part(from_user),
             time.strftime("%Y%m%d"),
             "videos",
@@ -1110,83 +1384,105 @@ class WxHttpPlatformAdapter(Platform):
         os.makedirs(temp_dir, exist_ok=True)
         file_path = os.path.join(temp_dir, f"wxhttp_video_{msg_id}.mp4")
 
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
-            pass
-
-        async def download_to_file(data_len: int) -> bool:
+        # 完整文件只会由下载完成后的 rename 产生，存在即可直接复用
+        if os.path.exists(file_path):
+            self._media_store.touch(file_path)
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                return Video.fromFileSystem(file_path)
             except Exception:
-                pass
+                return None
 
-            chunk_size = 65536
+        async def download_to_file(data_len: int) -> bool:
             total_len_i = int(data_len)
-            start_pos = 0
-            while start_pos < total_len_i:
-                part_len = min(chunk_size, total_len_i - start_pos)
-                try:
-                    resp = await self._client.download_video(
-                        wxid=self._self_wxid,
-                        msg_id=msg_id,
-                        data_len=total_len_i,
-                        compress_type=0,
-                        section_start_pos=start_pos,
-                        section_data_len=part_len,
-                        to_wxid=from_user,
-                    )
-                except Exception as e:
-                    logger.debug(f"[wxhttp] download_video failed msg_id={msg_id} start={start_pos}: {e}")
-                    return False
 
-                if not self._resp_ok(resp):
-                    return False
+            async def fetch_video_section(start_pos: int, part_len: int) -> bytes:
+                resp = await self._client.download_video(
+                    wxid=self._self_wxid,
+                    msg_id=msg_id,
+                    data_len=total_len_i,
+                    compress_type=0,
+                    section_start_pos=start_pos,
+                    section_data_len=part_len,
+                    to_wxid=from_user,
+                )
+                return self._decode_download_section(resp, api="download_video", msg_id=msg_id, start=start_pos)
 
-                chunk_b64 = self._extract_download_chunk_b64(resp)
-                if not chunk_b64:
-                    chunk_b64 = self._extract_base64_payload(resp)
-                if not chunk_b64:
-                    logger.debug(
-                        f"[wxhttp] download_video missing chunk buffer msg_id={msg_id} start={start_pos}",
-                    )
-                    return False
+            # 每个候选长度各自一个 .part 文件 + 清单，失败/重启后只补缺失区间
+            part_path = f"{file_path}.{total_len_i}.part"
+            writer = RangeFileWriter(part_path, total_len_i)
+            try:
+                await asyncio.to_thread(writer.open)
+            except Exception as e:
+                logger.debug(f"[wxhttp] open video file failed {part_path}: {e}")
+                return False
+            # 未完成的 .part 单独登记：写入期间不会被回收，长期未完成的残片随过期清理
+            self._media_store.record(part_path, total_len_i)
 
-                try:
-                    chunk = base64.b64decode(chunk_b64, validate=False)
-                except Exception as e:
-                    logger.debug(
-                        f"[wxhttp] decode video chunk base64 failed msg_id={msg_id} start={start_pos}: {e}",
-                    )
-                    return False
+            missing = writer.missing_ranges()
+            if writer.completed_bytes:
+                logger.info(
+                    f"[wxhttp] 视频续传 msg_id={msg_id}: 已完成 {writer.completed_bytes}/{total_len_i} 字节，"
+                    f"剩余 {len(missing)} 个区间",
+                )
 
+            complete = False
+            try:
+                await RangedDownloader(
+                    fetch_video_section,
+                    total_len=total_len_i,
+                    chunk_size=65536,
+                    window=self._media_download_window,
+                    label=f"video msg_id={msg_id}",
+                    sizer=self._section_sizes.get("video", self._client.base_url),
+                    ranges=missing,
+                ).run(writer)
+                complete = True
+            except SectionDownloadError as e:
+                logger.debug(f"[wxhttp] download_video failed msg_id={msg_id}: {e}")
+            except Exception as e:
+                logger.debug(f"[wxhttp] write video file failed {part_path}: {e}")
+            finally:
                 try:
-                    with open(file_path, "ab") as f:
-                        f.write(chunk)
+                    await writer.close(complete)
                 except Exception as e:
-                    logger.debug(f"[wxhttp] write video file failed {file_path}: {e}")
-                    return False
-
-                start_pos += part_len
+                    logger.debug(f"[wxhttp] close video file failed {part_path}: {e}")
+                    complete = False
+                await self._save_section_sizes()
 
+            if not complete:
+                return False
+            try:
+                os.replace(part_path, file_path)
+            except Exception as e:
+                logger.debug(f"[wxhttp] rename video file failed {part_path}: {e}")
+                return False
+            self._media_store.forget(part_path)
+            self._media_store.record(file_path)
             return True
 
-        # 按指南优先用 length；若失败且存在 rawlength，则再尝试 rawlength
-        tried: list[int] = []
-        for cand in (total_len, raw_len):
-            if not cand or cand in tried:
-                continue
-            tried.append(int(cand))
-            ok = await download_to_file(int(cand))
-            if ok:
-                try:
-                    return Video.fromFileSystem(file_path)
-                except Exception:
-                    return None
+        async def download_any() -> str | None:
+            # 按指南优先用 length；若失败且存在 rawlength，则再尝试 rawlength
+            tried: list[int] = []
+            for cand in (total_len, raw_len):
+                if not cand or cand in tried:
+                    continue
+                tried.append(int(cand))
+                if await download_to_file(int(cand)):
+                    return file_path
+            return None
 
-        return None
+        keys: list[str] = []
+        if meta.md5:
+            keys.append(f"video:md5:{meta.md5}")
+        keys.append(f"video:msg:{msg_id}")
+        cached_path = await self._media_cache.get_or_fetch(keys, download_any)
+        if not cached_path:
+            return None
+        self._media_store.touch(cached_path)
+        try:
+            return Video.fromFileSystem(cached_path)
+        except Exception:
+            return None
 
     @staticmethod
     def _write_bytes(path: str, data: bytes) -> None:
@@ -1205,4 +1501,10 @@ class WxHttpPlatformAdapter(Platform):
             reply_with_quote=bool(self.settings.get("reply_with_quote", False)),
             nickname_resolver=self._get_chatroom_member_nickname,
         )
+        raw = message.raw_message
+        if isinstance(raw, dict) and raw.get(_BACKLOG_FLAG):
+            # 故障恢复后的积压消息：插件可据此只记录、不回复。
+            # 私聊默认会唤醒机器人，这里禁止默认的 LLM 请求，避免对停机期间的旧消息逐条回复
+            event.set_extra("wxhttp_backlog", True)
+            event.should_call_llm(True)
         self.commit_event(event)
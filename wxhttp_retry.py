@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from astrbot import logger
+
+
+class WxHttpRequestError(RuntimeError):
+    """wxhttp 请求失败。status 为 HTTP 状态码，网络错误/超时为 None；timeout 标记请求超时。"""
+
+    def __init__(self, message: str, *, status: Optional[int] = None, timeout: bool = False) -> None:
+        super().__init__(message)
+        self.status = status
+        self.timeout = timeout
+
+    @property
+    def retryable(self) -> bool:
+        # 网络错误、超时、限流与服务端错误可以重试；其它 4xx 重试也不会成功
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class CircuitOpenError(WxHttpRequestError):
+    """熔断打开期间直接失败，不发出请求。"""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"wxhttp circuit open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+@dataclass
+class RetryPolicy:
+    """单类接口的重试策略：指数退避 + full jitter。"""
+
+    # 总尝试次数（含第一次），1 表示不重试
+    max_attempts: int = 1
+    base_delay_sec: float = 0.5
+    max_delay_sec: float = 8.0
+
+    @classmethod
+    def from_dict(cls, value: Dict[str, Any], base: Optional["RetryPolicy"] = None) -> "RetryPolicy":
+        base = base or cls()
+        return cls(
+            max_attempts=max(1, int(value.get("max_attempts", base.max_attempts))),
+            base_delay_sec=max(0.0, float(value.get("base_delay_sec", base.base_delay_sec))),
+            max_delay_sec=max(0.0, float(value.get("max_delay_sec", base.max_delay_sec))),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待秒数：在 [0, min(max, base * 2^(attempt-1))] 内均匀取值。"""
+        cap = min(self.max_delay_sec, self.base_delay_sec * (2 ** max(0, attempt - 1)))
+        return random.uniform(0.0, cap) if cap > 0 else 0.0
+
+
+# 按接口类别的默认策略（归类见 wxhttp_client.retry_class_for_path，只有只读接口归入可重试的类别）。
+# 发送类接口不是幂等的（超时后可能已经发出），未知接口也按发送类处理，默认不重试。
+DEFAULT_RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "sync": RetryPolicy(max_attempts=2, base_delay_sec=0.5, max_delay_sec=2.0),
+    "media": RetryPolicy(max_attempts=3, base_delay_sec=0.5, max_delay_sec=8.0),
+    "meta": RetryPolicy(max_attempts=3, base_delay_sec=1.0, max_delay_sec=10.0),
+    "send": RetryPolicy(max_attempts=1),
+}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """wxhttp 服务级熔断器。
+
+    - closed：正常放行；连续 failure_threshold 次可重试类失败后打开；
+    - open：reset_timeout_sec 内所有请求直接抛 CircuitOpenError；
+    - half_open：到时后只放行一个探测请求，成功则关闭，失败则重新打开并把等待时间翻倍
+      （上限 max_reset_timeout_sec）。
+
+    failure_threshold <= 0 时不启用。
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout_sec: float = 30.0,
+        max_reset_timeout_sec: float = 300.0,
+    ) -> None:
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout_sec = max(0.1, float(reset_timeout_sec))
+        self.max_reset_timeout_sec = max(self.reset_timeout_sec, float(max_reset_timeout_sec))
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._timeout = self.reset_timeout_sec
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def retry_after(self, now: Optional[float] = None) -> float:
+        """距离允许下一次探测还需等待的秒数；未打开时为 0。"""
+        if self._state == CIRCUIT_CLOSED:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._opened_at + self._timeout - now)
+
+    def reject_if_open(self) -> None:
+        """排队前的快速检查：熔断打开且未到探测时间时直接失败（不占用探测名额）。"""
+        if not self.enabled or self._state == CIRCUIT_CLOSED:
+            return
+        wait = self.retry_after()
+        if wait > 0:
+            self.rejected += 1
+            raise CircuitOpenError(wait)
+
+    def before_call(self) -> bool:
+        """请求前调用：熔断打开（或半开且已有探测在途）时抛 CircuitOpenError。
+
+        返回本次调用是否拿到了半开状态的探测名额；只有拿到名额的调用才可以 release()。
+        """
+        if not self.enabled or self._state == CIRCUIT_CLOSED:
+            return False
+        now = time.monotonic()
+        wait = self.retry_after(now)
+        if wait > 0 or self._probing:
+            self.rejected += 1
+            raise CircuitOpenError(wait)
+        self._state = CIRCUIT_HALF_OPEN
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._probing = False
+        self._failures = 0
+        if self._state != CIRCUIT_CLOSED:
+            logger.info("[wxhttp] wxhttp 服务已恢复，熔断关闭")
+            self._state = CIRCUIT_CLOSED
+            self._timeout = self.reset_timeout_sec
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        self._probing = False
+        if self._state == CIRCUIT_HALF_OPEN:
+            self._timeout = min(self.max_reset_timeout_sec, self._timeout * 2)
+            self._open()
+            return
+        if self._state == CIRCUIT_OPEN:
+            return
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._open()
+
+    def release(self) -> None:
+        """探测请求既未成功也未失败（例如被取消）时释放探测名额；仅限 before_call() 返回 True 的调用方。"""
+        self._probing = False
+
+    def _open(self) -> None:
+        self._state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        logger.warning(
+            f"[wxhttp] wxhttp 服务连续失败，熔断打开 {self._timeout:.0f}s（期间请求直接失败，到时探测恢复）"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self._state,
+            "failures": self._failures,
+            "retry_after": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
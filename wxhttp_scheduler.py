@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from astrbot import logger
+
+if TYPE_CHECKING:
+    from .wxhttp_pacing import AdaptiveRateController
+
+
+@dataclass
+class LaneConfig:
+    """单条请求通道的调度参数。"""
+
+    # 加权公平出队的权重：有竞争时各通道按权重比例分配空闲 worker
+    weight: int = 1
+    # 该通道同时在途的请求上限
+    workers: int = 1
+    # 排队上限，超出时提交方等待（0 表示不限）
+    max_depth: int = 0
+    # 是否在发送前应用 request_delay_min/max 随机延时（启用自适应限速时改为按其速率排开）
+    apply_delay: bool = True
+
+    @classmethod
+    def from_dict(cls, value: Dict[str, Any], base: Optional["LaneConfig"] = None) -> "LaneConfig":
+        base = base or cls()
+        return cls(
+            weight=max(1, int(value.get("weight", base.weight))),
+            workers=max(1, int(value.get("workers", base.workers))),
+            max_depth=max(0, int(value.get("max_depth", base.max_depth))),
+            apply_delay=bool(value.get("apply_delay", base.apply_delay)),
+        )
+
+
+@dataclass
+class _Lane:
+    name: str
+    config: LaneConfig
+    pending: Deque[Tuple[Any, asyncio.Future]] = field(default_factory=deque)
+    active: int = 0
+    # 平滑加权轮询（smooth weighted round-robin）的当前值
+    current_weight: int = 0
+
+
+class LaneScheduler:
+    """多通道加权公平调度器。
+
+    固定数量的 worker 共享所有通道；每个 worker 空闲时在“有排队且未达到并发上限”
+    的通道中按平滑加权轮询挑选下一个请求，因此大批量的媒体分片不会堵住发送通道。
+    """
+
+    def __init__(
+        self,
+        lanes: Dict[str, LaneConfig],
+        handler: Callable[[Any], Awaitable[Any]],
+        *,
+        max_inflight: int,
+        delay_range: Tuple[float, float] = (0.0, 0.0),
+        rate_controller: Optional["AdaptiveRateController"] = None,
+    ) -> None:
+        if not lanes:
+            raise ValueError("at least one lane is required")
+        self._lanes: Dict[str, _Lane] = {
+            name: _Lane(name=name, config=cfg) for name, cfg in lanes.items()
+        }
+        self._handler = handler
+        self._max_inflight = max(1, int(max_inflight))
+        self._delay_min, self._delay_max = delay_range
+        self._rate_controller = rate_controller
+        # 固定随机延时的共享预约：所有 apply_delay 通道的请求依次间隔 delay_range 发出
+        self._next_send_at = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def lanes(self) -> Dict[str, LaneConfig]:
+        return {name: lane.config for name, lane in self._lanes.items()}
+
+    def depth(self, lane: str) -> int:
+        return len(self._lanes[lane].pending)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"pending": len(lane.pending), "active": lane.active}
+            for name, lane in self._lanes.items()
+        }
+
+    def _ensure_started(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+            for i in range(self._max_inflight):
+                self._workers.append(asyncio.create_task(self._worker(i)))
+            if self._rate_controller is not None:
+                pacing = f"自适应限速: {self._rate_controller.describe()}"
+            else:
+                pacing = f"延时: {self._delay_min}-{self._delay_max}s"
+            logger.info(
+                f"[wxhttp] 请求调度器启动（worker={self._max_inflight}, {pacing}, "
+                + ", ".join(
+                    f"{n}: w={c.config.weight}/c={c.config.workers}/d={c.config.max_depth or '∞'}"
+                    for n, c in self._lanes.items()
+                )
+                + "）"
+            )
+        return self._cond
+
+    async def submit(self, lane_name: str, item: Any) -> Any:
+        """把请求放入指定通道并等待结果；通道满时阻塞直到有空位。"""
+        lane = self._lanes.get(lane_name)
+        if lane is None:
+            raise KeyError(f"unknown lane: {lane_name}")
+        cond = self._ensure_started()
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        async with cond:
+            limit = lane.config.max_depth
+            if limit > 0 and len(lane.pending) >= limit:
+                logger.debug(f"[wxhttp] 通道 {lane_name} 已满（{limit}），等待空位")
+                await cond.wait_for(lambda: len(lane.pending) < limit)
+            lane.pending.append((item, future))
+            cond.notify_all()
+        return await future
+
+    def _pick_lane(self) -> Optional[_Lane]:
+        eligible = [
+            lane
+            for lane in self._lanes.values()
+            if lane.pending and lane.active < lane.config.workers
+        ]
+        if not eligible:
+            return None
+        total = 0
+        best: Optional[_Lane] = None
+        for lane in eligible:
+            lane.current_weight += lane.config.weight
+            total += lane.config.weight
+            if best is None or lane.current_weight > best.current_weight:
+                best = lane
+        assert best is not None
+        best.current_weight -= total
+        return best
+
+    def _reserve_delay(self) -> float:
+        """为一个 apply_delay 请求预约发送时间，返回需要等待的秒数。
+
+        预约在所有 worker 间共享：多个 worker 同时取到请求时按预约顺序依次排开，
+        而不是各自睡一段随机时间后一起发出。
+        """
+        if self._rate_controller is not None:
+            return self._rate_controller.reserve()
+        if self._delay_max <= 0:
+            return 0.0
+        now = time.monotonic()
+        send_at = max(now, self._next_send_at) + random.uniform(self._delay_min, self._delay_max)
+        self._next_send_at = send_at
+        return send_at - now
+
+    async def _worker(self, index: int) -> None:
+        assert self._cond is not None
+        cond = self._cond
+        while True:
+            try:
+                async with cond:
+                    lane = self._pick_lane()
+                    while lane is None:
+                        await cond.wait()
+                        lane = self._pick_lane()
+                    item, future = lane.pending.popleft()
+                    lane.active += 1
+                    # 唤醒等待空位的提交方
+                    cond.notify_all()
+
+                try:
+                    if future.cancelled():
+                        continue
+                    if lane.config.apply_delay:
+                        delay = self._reserve_delay()
+                        if delay > 0:
+                            logger.debug(f"[wxhttp] 通道 {lane.name} 延时 {delay:.2f}s 后发送")
+                            await asyncio.sleep(delay)
+                    try:
+                        result = await self._handler(item)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                finally:
+                    async with cond:
+                        lane.active -= 1
+                        cond.notify_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[wxhttp] 调度 worker#{index} 异常: {e}")
+
+    async def close(self) -> None:
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        for task in workers:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._cond = None
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+import ssl
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class HttpTransportError(RuntimeError):
+    """连接池传输层异常（连接/读写/协议错误）。"""
+
+
+@dataclass
+class _PooledConnection:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    last_used: float = field(default_factory=time.monotonic)
+    requests: int = 0
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class WxHttpConnectionPool:
+    """面向单一 base_url 的 asyncio HTTP/1.1 keep-alive 连接池。
+
+    wxhttp 只有 JSON POST 一种调用形态，所以这里只实现了最小的 HTTP/1.1 子集：
+    Content-Length / chunked 响应体、Connection: close 与空闲连接回收。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int = 8,
+        timeout_sec: float = 60.0,
+        idle_timeout_sec: float = 30.0,
+    ) -> None:
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported scheme for connection pool: {base_url!r}")
+        if not parts.hostname:
+            raise ValueError(f"missing host in base_url: {base_url!r}")
+
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port or (443 if parts.scheme == "https" else 80)
+        default_port = 443 if parts.scheme == "https" else 80
+        self._host_header = (
+            self._host if self._port == default_port else f"{self._host}:{self._port}"
+        )
+        self._ssl: Optional[ssl.SSLContext] = (
+            ssl.create_default_context() if parts.scheme == "https" else None
+        )
+
+        self._max_connections = max(1, int(max_connections))
+        self._timeout_sec = float(timeout_sec)
+        self._idle_timeout_sec = float(idle_timeout_sec)
+
+        # 空闲连接按 LIFO 复用：最近用过的连接最不可能被服务端关闭
+        self._idle: list[_PooledConnection] = []
+        self._slots = asyncio.Semaphore(self._max_connections)
+        self._closed = False
+
+    @property
+    def max_connections(self) -> int:
+        return self._max_connections
+
+    @property
+    def idle_connections(self) -> int:
+        return len(self._idle)
+
+    async def _open(self) -> _PooledConnection:
+        reader, writer = await asyncio.open_connection(
+            self._host,
+            self._port,
+            ssl=self._ssl,
+        )
+        return _PooledConnection(reader=reader, writer=writer)
+
+    def _take_idle(self) -> Optional[_PooledConnection]:
+        now = time.monotonic()
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.is_closing() or now - conn.last_used > self._idle_timeout_sec:
+                conn.close()
+                continue
+            return conn
+        return None
+
+    def _release(self, conn: _PooledConnection, reusable: bool) -> None:
+        if reusable and not self._closed and not conn.is_closing():
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def post(
+        self,
+        target: str,
+        body: bytes,
+        *,
+        content_type: str = "application/json",
+    ) -> Tuple[int, bytes]:
+        """发送 POST 请求，返回 (status, body)。
+
+        target 为完整 URL 或以 / 开头的请求路径。
+        """
+        if self._closed:
+            raise HttpTransportError("connection pool is closed")
+
+        if target.startswith("http://") or target.startswith("https://"):
+            parts = urlsplit(target)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+        else:
+            path = target or "/"
+
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self._host_header}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n"
+        ).encode("latin-1")
+
+        async with self._slots:
+            return await asyncio.wait_for(
+                self._post_with_reuse(head, body),
+                timeout=self._timeout_sec,
+            )
+
+    async def _post_with_reuse(self, head: bytes, body: bytes) -> Tuple[int, bytes]:
+        conn = self._take_idle()
+        reused = conn is not None
+        if conn is None:
+            conn = await self._open()
+
+        try:
+            return await self._roundtrip(conn, head, body)
+        except _StaleConnection:
+            # 复用的空闲连接已被服务端关闭（尚未收到任何响应字节），换新连接重发一次
+            conn.close()
+            if not reused:
+                raise HttpTransportError("connection closed before response")
+            conn = await self._open()
+            try:
+                return await self._roundtrip(conn, head, body)
+            except _StaleConnection as e:
+                conn.close()
+                raise HttpTransportError("connection closed before response") from e
+
+    async def _roundtrip(
+        self, conn: _PooledConnection, head: bytes, body: bytes
+    ) -> Tuple[int, bytes]:
+        reusable = False
+        try:
+            try:
+                conn.writer.write(head + body)
+                await conn.writer.drain()
+                status_line = await conn.reader.readline()
+            except (ConnectionError, OSError) as e:
+                raise _StaleConnection() from e
+            if not status_line:
+                raise _StaleConnection()
+
+            status, version = self._parse_status_line(status_line)
+            headers = await self._read_headers(conn.reader)
+            payload, body_delimited = await self._read_body(conn.reader, headers)
+
+            connection_hdr = headers.get("connection", "").lower()
+            reusable = body_delimited and (
+                (version == "HTTP/1.1" and connection_hdr != "close")
+                or (version == "HTTP/1.0" and connection_hdr == "keep-alive")
+            )
+            conn.requests += 1
+            return status, payload
+        except _StaleConnection:
+            raise
+        except asyncio.IncompleteReadError as e:
+            raise HttpTransportError(f"incomplete response: {e}") from e
+        except (ConnectionError, OSError) as e:
+            raise HttpTransportError(str(e)) from e
+        finally:
+            self._release(conn, reusable)
+
+    @staticmethod
+    def _parse_status_line(line: bytes) -> Tuple[int, str]:
+        text = line.decode("latin-1").strip()
+        parts = text.split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise HttpTransportError(f"bad status line: {text[:100]!r}")
+        try:
+            return int(parts[1]), parts[0]
+        except ValueError as e:
+            raise HttpTransportError(f"bad status code: {text[:100]!r}") from e
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise HttpTransportError("connection closed while reading headers")
+            if line in (b"\r\n", b"\n"):
+                return headers
+            name, sep, value = line.decode("latin-1").partition(":")
+            if not sep:
+                continue
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _read_body(
+        reader: asyncio.StreamReader, headers: Dict[str, str]
+    ) -> Tuple[bytes, bool]:
+        """读取响应体，返回 (body, 是否有明确边界)。
+
+        无 Content-Length 且非 chunked 时读到 EOF，此时连接不可复用。
+        """
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = bytearray()
+            while True:
+                size_line = await reader.readline()
+                if not size_line:
+                    raise HttpTransportError("connection closed inside chunked body")
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # 丢弃 trailer
+                    while True:
+                        trailer = await reader.readline()
+                        if trailer in (b"\r\n", b"\n", b""):
+                            break
+                    return bytes(chunks), True
+                chunks.extend(await reader.readexactly(size))
+                await reader.readexactly(2)
+
+        length = headers.get("content-length")
+        if length is not None:
+            try:
+                n = int(length)
+            except ValueError as e:
+                raise HttpTransportError(f"bad Content-Length: {length!r}") from e
+            return (await reader.readexactly(n) if n > 0 else b""), True
+
+        return await reader.read(), False
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class _StaleConnection(Exception):
+    """内部信号：连接在收到响应前就已断开。"""